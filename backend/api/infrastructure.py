@@ -1,22 +1,144 @@
 import pathlib
+from typing import Optional
 
 from aws_cdk import (
+    Duration,
+    RemovalPolicy,
+    Stack,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_lambda_python_alpha as lambda_python_alpha,
     aws_apigateway as apigw,
+    aws_cloudwatch as cloudwatch,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as events_targets,
     aws_secretsmanager as ssm,
     aws_iam as iam,
     aws_cloudwatch_actions as cw_actions,
     aws_sns as sns,
+    aws_sqs as sqs,
 )
 from aws_cdk.aws_logs import RetentionDays
 from constructs import Construct
 
+# Namespace and phases of the timing metrics published by the runtime, which must
+# match those in runtime/metrics.py
+METRICS_NAMESPACE = "EscultoideBot"
+METRIC_PHASES = [
+    "Invocation",
+    "SecretFetch",
+    "ApplicationInit",
+    "UpdateParse",
+    "NotionQuery",
+    "PageParse",
+    "Render",
+    "TelegramSend",
+]
+
+# Header where Telegram sends the secret token of the webhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Request template wrapping each update together with its secret token header
+WEBHOOK_REQUEST_TEMPLATE = (
+    '{"body": $input.json(\'$\'), "secretToken": '
+    "\"$util.escapeJavaScript($input.params('" + SECRET_TOKEN_HEADER + "'))\"}"
+)
+
+# Longest run of the bot lambda, the Lambda default. Updates are reserved for a
+# few seconds longer while they are processed, so that a new delivery of an
+# update whose invocation timed out or crashed is processed again.
+BOT_TIMEOUT = Duration.seconds(3)
+DEDUP_LEASE_MARGIN = Duration.seconds(5)
+
+# Largest number of queued updates processed by each run of the bot lambda
+BATCH_SIZE = 10
+# Longest run of the bot lambda when it processes queued updates, as every update
+# in a batch may come from the same chat and be processed one after another
+BATCH_TIMEOUT = Duration.seconds(30)
+# Fields holding the chat of each update type. The first one found is the message
+# group of the queued update, so that the updates of each chat are processed in
+# order. Inline queries, which have no chat, are grouped by their sender.
+UPDATE_GROUP_PATHS = [
+    "$.message.chat.id",
+    "$.edited_message.chat.id",
+    "$.channel_post.chat.id",
+    "$.edited_channel_post.chat.id",
+    "$.callback_query.message.chat.id",
+    "$.my_chat_member.chat.id",
+    "$.chat_member.chat.id",
+    "$.chat_join_request.chat.id",
+    "$.inline_query.from.id",
+    "$.chosen_inline_result.from.id",
+    "$.callback_query.from.id",
+]
+
+# Path of the iCalendar feed in the API
+CALENDAR_PATH = "calendar.ics"
+# Name of the stage of the API Gateway, the default one
+STAGE_NAME = "prod"
+
+# Files in the runtime directory that are not needed by the functions
+RUNTIME_ASSET_EXCLUDES = ["**/__pycache__", "*.pyc", ".pytest_cache"]
+
+
+def update_group_template() -> str:
+    """
+    Build the mapping template statements that set $group to the message group of
+    the received update, or to its identifier for update types without a chat
+    :return: String with the statements, which render no text themselves
+    """
+    paths = ", ".join(f"'{path}'" for path in UPDATE_GROUP_PATHS)
+    # Directives are closed with #{end}, as they are followed by more text
+    return (
+        "#set($group = '')"
+        f"#foreach($path in [{paths}])"
+        "#set($value = $input.path($path))"
+        "#if($group == '' && \"$!value\" != '')#set($group = \"$value\")#{end}"
+        "#{end}"
+        "#if($group == '')#set($group = \"$input.path('$.update_id')\")#{end}"
+    )
+
+
+class PerformanceProfile:
+    """
+    Sizing of the bot lambda. The defaults favour low latency at a low cost:
+    Graviton processors, and enough memory for the CPU share to keep cold starts
+    short.
+    """
+
+    def __init__(
+        self,
+        architecture: _lambda.Architecture = _lambda.Architecture.ARM_64,
+        memory_size: int = 512,
+        provisioned_concurrency: int = 0,
+    ) -> None:
+        """
+        Initializes a new PerformanceProfile
+        :param architecture: Instruction set architecture of the functions
+        :param memory_size: Memory of the bot lambda in MB, which also sets its
+                            share of CPU
+        :param provisioned_concurrency: Number of execution environments kept
+                                        initialized, through an alias that serves
+                                        the API. 0 to disable it.
+        """
+        if provisioned_concurrency < 0:
+            raise ValueError("Provisioned concurrency cannot be negative")
+
+        self.architecture = architecture
+        self.memory_size = memory_size
+        self.provisioned_concurrency = provisioned_concurrency
+
 
 class API(Construct):
     """
     Construct representing the API of the EscultoideBot Telegram bot. It
     consists on an API Gateway and a Lambda function that processes requests.
+
+    Optionally, the API Gateway can place the updates in an SQS queue instead, so
+    that the Lambda function processes them in batches, a scheduled function can
+    send reminders of the upcoming events to a set of chats, and another one can
+    sync the calendar into a table read by the Lambda function instead of Notion.
+    The API can also serve the calendar as an iCalendar feed.
     """
 
     def __init__(
@@ -27,32 +149,134 @@ class API(Construct):
         notion_secret: ssm.ISecret,
         notion_calendar_id: str,
         allowed_users: [str] = None,
+        webhook_reply: bool = False,
+        batch_ingestion: bool = False,
+        reminder_chats: [int] = None,
+        performance: Optional[PerformanceProfile] = None,
+        secret_token: bool = False,
+        calendar_sync_interval: Optional[Duration] = None,
+        calendar_feed: bool = False,
+        calendar_cache_ttl: Optional[Duration] = Duration.minutes(5),
     ) -> None:
+        """
+        Initializes an instance of the API construct
+        :param scope: Scope where this construct is included
+        :param id_: Unique identifier for this construct
+        :param telegram_secret: Secret containing the API key for the Telegram bot
+        :param notion_secret: Secret containing the API key for the Notion integration
+        :param notion_calendar_id: Identifier for the Notion database to interact with
+        :param allowed_users: List of usernames that must be able to access restricted
+                              bot commands
+        :param webhook_reply: Whether to answer updates with a method call in the
+                              webhook response, instead of a separate request to the
+                              Telegram API
+        :param batch_ingestion: Whether to queue the updates and process them in
+                                batches, instead of invoking the function once per
+                                update. Incompatible with webhook_reply.
+        :param reminder_chats: List of chat IDs where a daily reminder of the events
+                               in the following 24 hours is sent
+        :param performance: Sizing of the bot lambda, PerformanceProfile defaults
+                            if not provided
+        :param secret_token: Whether updates without the secret token of the webhook
+                             must be rejected. The token is derived from the
+                             Telegram API key, so the webhook must be set again
+                             after rotating the key.
+        :param calendar_sync_interval: Interval between the syncs of the calendar
+                                       into a table that the bot lambda reads
+                                       instead of querying Notion. None to always
+                                       query Notion.
+        :param calendar_feed: Whether to serve the calendar as an iCalendar feed at
+                              GET /calendar.ics, to anyone with the link given by
+                              the /calendario command
+        :param calendar_cache_ttl: Time the API Gateway caches the feed, None to
+                                   disable its cache cluster
+        """
         super().__init__(scope, id_)
 
+        if performance is None:
+            performance = PerformanceProfile()
+
+        if webhook_reply and batch_ingestion:
+            raise ValueError(
+                "Replies cannot be sent in the webhook response when updates are "
+                "processed in batches"
+            )
+
         # Use an empty list when no allowed users exist, so we can use the join
         # function later without errors
         if not allowed_users:
             allowed_users = []
 
+        # Environment shared by every function that calls Telegram and Notion
+        runtime_environment = {
+            "TelegramSecretName": telegram_secret.secret_name,
+            "NotionSecretName": notion_secret.secret_name,
+            "NotionCalendarID": notion_calendar_id,
+        }
+
+        # Table where the updates are recorded, so that those delivered again by
+        # Telegram are discarded. Processed updates expire after a day, and those
+        # being processed once their lease is over.
+        self.update_table = dynamodb.Table(
+            self,
+            "UpdateTable",
+            partition_key=dynamodb.Attribute(
+                name="UpdateId", type=dynamodb.AttributeType.NUMBER
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="ExpiresAt",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+
+        # Options shared by the functions built from the runtime directory. Only
+        # the packages in its requirements.txt are bundled, boto3 is provided by
+        # the Lambda runtime.
+        self.performance = performance
+        self._runtime_options = {
+            "runtime": _lambda.Runtime.PYTHON_3_11,
+            "entry": str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
+            "architecture": performance.architecture,
+            "bundling": lambda_python_alpha.BundlingOptions(
+                asset_excludes=RUNTIME_ASSET_EXCLUDES
+            ),
+        }
+
         # Main lambda function processing the updates received by the bot
+        bot_timeout = BATCH_TIMEOUT if batch_ingestion else BOT_TIMEOUT
         self.bot_lambda = lambda_python_alpha.PythonFunction(
             self,
             "BotLambda",
             description="Main function processing Telegram updates",
-            runtime=_lambda.Runtime.PYTHON_3_11,
-            entry=str(pathlib.Path(__file__).parent.joinpath("runtime").resolve()),
+            **self._runtime_options,
+            memory_size=performance.memory_size,
             index="router_lambda.py",
-            handler="handler",
+            handler="batch_handler" if batch_ingestion else "handler",
+            timeout=bot_timeout,
             environment={
-                "TelegramSecretName": telegram_secret.secret_name,
-                "NotionSecretName": notion_secret.secret_name,
-                "NotionCalendarID": notion_calendar_id,
+                **runtime_environment,
                 "AllowedUsers": ",".join(allowed_users),
+                "WebhookReply": str(webhook_reply).lower(),
+                "DedupTableName": self.update_table.table_name,
+                "DedupLease": str(
+                    int(bot_timeout.to_seconds() + DEDUP_LEASE_MARGIN.to_seconds())
+                ),
+                "ValidateSecretToken": str(secret_token).lower(),
             },
             log_retention=RetentionDays.ONE_WEEK,
         )
 
+        # Function or alias that receives the updates. Provisioned concurrency
+        # can only be configured on a version, so it is served through an alias.
+        self.bot_handler: _lambda.IFunction = self.bot_lambda
+        if performance.provisioned_concurrency:
+            self.bot_handler = _lambda.Alias(
+                self,
+                "BotLambdaAlias",
+                alias_name="live",
+                version=self.bot_lambda.current_version,
+                provisioned_concurrent_executions=performance.provisioned_concurrency,
+            )
+
         # Alarm when the lambda is getting more invocations than expected
         self.bot_lambda.metric_all_invocations().create_alarm(
             self, "HighUsageAlarm", threshold=20, evaluation_periods=4, datapoints_to_alarm=3
@@ -69,9 +293,34 @@ class API(Construct):
         # The bot lambda must be able to read both API Key secrets
         telegram_secret.grant_read(grantee=self.bot_lambda)
         notion_secret.grant_read(grantee=self.bot_lambda)
+        self.update_table.grant_read_write_data(self.bot_lambda)
+
+        self._add_dashboard()
+
+        if reminder_chats:
+            self._add_reminders(
+                telegram_secret,
+                notion_secret,
+                runtime_environment,
+                reminder_chats,
+                failure_topic,
+            )
+
+        if calendar_sync_interval:
+            self._add_calendar_sync(
+                notion_secret,
+                runtime_environment,
+                calendar_sync_interval,
+                failure_topic,
+            )
 
         # Policy that only allows requests coming from IP ranges belonging to
-        # Telegram webhooks to go through the API Gateway
+        # Telegram webhooks to go through the API Gateway. Calendar apps fetch the
+        # feed from anywhere, so it is left out, and checks its own access token.
+        if calendar_feed:
+            restricted = {"not_resources": [f"execute-api:/*/GET/{CALENDAR_PATH}"]}
+        else:
+            restricted = {"resources": ["execute-api:/*/*/*"]}
         only_telegram_ip_policy = iam.PolicyDocument(
             statements=[
                 iam.PolicyStatement(
@@ -84,7 +333,7 @@ class API(Construct):
                     effect=iam.Effect.DENY,
                     principals=[iam.AnyPrincipal()],
                     actions=["execute-api:Invoke"],
-                    resources=["execute-api:/*/*/*"],
+                    **restricted,
                     conditions={
                         "NotIpAddress": {
                             "aws:SourceIp": ["149.154.160.0/20", "91.108.4.0/22"]
@@ -99,24 +348,379 @@ class API(Construct):
         self.gateway = apigw.LambdaRestApi(
             self,
             "EscultoideBotAPIGateway",
-            handler=self.bot_lambda,
+            handler=self.bot_handler,
             proxy=False,
             policy=only_telegram_ip_policy,
             deploy_options=apigw.StageOptions(
+                stage_name=STAGE_NAME,
                 metrics_enabled=True,
                 logging_level=apigw.MethodLoggingLevel.ERROR,
+                **self._calendar_cache_options(calendar_feed, calendar_cache_ttl),
             ),
         )
 
+        if batch_ingestion:
+            # Updates are queued, and the lambda processes them in batches
+            root_integration = self._add_ingestion_queue(failure_topic, secret_token)
+        else:
+            # The lambda integration returns 200 for every successful function run,
+            # no matter the actual HTTP return code of the invocation.
+            # The function result is passed through as the response body, so that a
+            # method call returned by it is executed by Telegram. Telegram only does
+            # so for JSON responses.
+            root_integration = apigw.LambdaIntegration(
+                self.bot_handler,
+                proxy=False,
+                # The update is wrapped together with the secret token header, so
+                # that the function can check it
+                request_templates={"application/json": WEBHOOK_REQUEST_TEMPLATE},
+                integration_responses=[
+                    apigw.IntegrationResponse(
+                        status_code="200",
+                        response_parameters={
+                            "method.response.header.Content-Type": "'application/json'"
+                        },
+                    )
+                ],
+            )
+
         self.gateway.root.add_method(
             # We can allow only POST, as it is what the webhook uses.
             "POST",
-            # The lambda integration returns 200 for every successful function run, no
-            # matter the actual HTTP return code of the invocation.
+            root_integration,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={"method.response.header.Content-Type": True},
+                )
+            ],
+        )
+
+        if calendar_feed:
+            self._add_calendar_feed(telegram_secret, notion_secret, runtime_environment)
+
+    @staticmethod
+    def _calendar_cache_options(
+        calendar_feed: bool, cache_ttl: Optional[Duration]
+    ) -> dict:
+        """
+        Return the stage options that cache the calendar feed in the API Gateway
+        :param calendar_feed: Whether the feed is served
+        :param cache_ttl: Time the feed is cached, None to disable the cache
+        :return: Dictionary with the keyword arguments for StageOptions
+        """
+        if not calendar_feed or cache_ttl is None:
+            return {}
+        return {
+            "cache_cluster_enabled": True,
+            "cache_cluster_size": "0.5",
+            "method_options": {
+                f"/{CALENDAR_PATH}/GET": apigw.MethodDeploymentOptions(
+                    caching_enabled=True, cache_ttl=cache_ttl
+                )
+            },
+        }
+
+    def _add_calendar_feed(
+        self,
+        telegram_secret: ssm.ISecret,
+        notion_secret: ssm.ISecret,
+        runtime_environment: dict,
+    ):
+        """
+        Create the function that serves the iCalendar feed, and its resource in the
+        API Gateway
+        :param telegram_secret: Secret containing the API key for the Telegram bot,
+                                from which the access token of the feed is derived
+        :param notion_secret: Secret containing the API key for the Notion integration
+        :param runtime_environment: Environment variables shared with the bot lambda
+        """
+        self.calendar_lambda = lambda_python_alpha.PythonFunction(
+            self,
+            "CalendarLambda",
+            description="Function serving the calendar as an iCalendar feed",
+            **self._runtime_options,
+            index="ical.py",
+            handler="handler",
+            environment=runtime_environment,
+            timeout=Duration.seconds(15),
+            log_retention=RetentionDays.ONE_WEEK,
+        )
+        telegram_secret.grant_read(grantee=self.calendar_lambda)
+        notion_secret.grant_read(grantee=self.calendar_lambda)
+
+        # The cache key includes the token, so that a cached feed is never served
+        # to a request with a wrong token, and the ETag the client has, so that a
+        # cached 304 is never served to a client without the feed
+        cache_key_parameters = [
+            "method.request.querystring.token",
+            "method.request.header.If-None-Match",
+        ]
+        self.gateway.root.add_resource(CALENDAR_PATH).add_method(
+            "GET",
             apigw.LambdaIntegration(
-                self.bot_lambda,
-                proxy=False,
-                integration_responses=[{"statusCode": "200"}],
+                self.calendar_lambda, cache_key_parameters=cache_key_parameters
+            ),
+            request_parameters={
+                "method.request.querystring.token": True,
+                "method.request.header.If-None-Match": False,
+            },
+        )
+
+        # The bot hands out the link to the feed. The URL is built from the
+        # identifier of the API and the name of the stage, as the stage itself
+        # depends on the bot lambda.
+        stack = Stack.of(self)
+        self.bot_lambda.add_environment(
+            "CalendarURL",
+            f"https://{self.gateway.rest_api_id}.execute-api.{stack.region}."
+            f"{stack.url_suffix}/{STAGE_NAME}/{CALENDAR_PATH}",
+        )
+
+    def _add_dashboard(self):
+        """
+        Create a dashboard with the p50 and p99 duration of each phase of the
+        requests processed by the bot lambda
+        """
+        self.dashboard = cloudwatch.Dashboard(self, "Dashboard")
+        widgets = []
+        for phase in METRIC_PHASES:
+            widgets.append(
+                cloudwatch.GraphWidget(
+                    title=phase,
+                    left=[
+                        cloudwatch.Metric(
+                            namespace=METRICS_NAMESPACE,
+                            metric_name=phase,
+                            dimensions_map={
+                                "FunctionName": self.bot_lambda.function_name
+                            },
+                            statistic=statistic,
+                            label=statistic,
+                            period=Duration.minutes(5),
+                        )
+                        for statistic in ("p50", "p99")
+                    ],
+                    left_y_axis=cloudwatch.YAxisProps(label="ms", show_units=False),
+                    width=6,
+                )
+            )
+        self.dashboard.add_widgets(*widgets)
+
+    def _add_reminders(
+        self,
+        telegram_secret: ssm.ISecret,
+        notion_secret: ssm.ISecret,
+        runtime_environment: dict,
+        reminder_chats: [int],
+        failure_topic: sns.ITopic,
+    ):
+        """
+        Create the function that sends the daily reminders, and the rule that runs it
+        :param telegram_secret: Secret containing the API key for the Telegram bot
+        :param notion_secret: Secret containing the API key for the Notion integration
+        :param runtime_environment: Environment variables shared with the bot lambda
+        :param reminder_chats: List of chat IDs where the reminders are sent
+        :param failure_topic: Topic to notify when reminders cannot be sent
+        """
+        self.reminder_lambda = lambda_python_alpha.PythonFunction(
+            self,
+            "ReminderLambda",
+            description="Scheduled function sending reminders of upcoming events",
+            **self._runtime_options,
+            index="reminders.py",
+            handler="handler",
+            environment={
+                **runtime_environment,
+                "ReminderChats": ",".join(str(chat_id) for chat_id in reminder_chats),
+                "ReminderHorizonHours": "24",
+            },
+            # Sending within the rate limits takes about a second per 25 messages
+            timeout=Duration.minutes(5),
+            # A retry would send the reminders again to the chats that got them
+            retry_attempts=0,
+            log_retention=RetentionDays.ONE_WEEK,
+        )
+        telegram_secret.grant_read(grantee=self.reminder_lambda)
+        notion_secret.grant_read(grantee=self.reminder_lambda)
+
+        self.reminder_lambda.metric_errors().create_alarm(
+            self, "ReminderFailureAlarm", threshold=1, evaluation_periods=1
+        ).add_alarm_action(cw_actions.SnsAction(failure_topic))
+
+        # Runs once a day, matching the 24 hours covered by each run
+        events.Rule(
+            self,
+            "ReminderSchedule",
+            schedule=events.Schedule.cron(minute="0", hour="17"),
+            targets=[events_targets.LambdaFunction(self.reminder_lambda)],
+        )
+
+    def _add_calendar_sync(
+        self,
+        notion_secret: ssm.ISecret,
+        runtime_environment: dict,
+        interval: Duration,
+        failure_topic: sns.ITopic,
+    ):
+        """
+        Create the table with the events read by the bot lambda, the function that
+        syncs it with the calendar in Notion, and the rule that runs it
+        :param notion_secret: Secret containing the API key for the Notion integration
+        :param runtime_environment: Environment variables shared with the bot lambda
+        :param interval: Interval between syncs
+        :param failure_topic: Topic to notify when the calendar cannot be synced
+        """
+        # Events are keyed by Kind and Id, and looked up by the day they start on
+        # through the ByStart index
+        self.event_table = dynamodb.Table(
+            self,
+            "EventTable",
+            partition_key=dynamodb.Attribute(
+                name="Kind", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(name="Id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        self.event_table.add_global_secondary_index(
+            index_name="ByStart",
+            partition_key=dynamodb.Attribute(
+                name="Kind", type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="StartKey", type=dynamodb.AttributeType.STRING
+            ),
+        )
+
+        self.sync_lambda = lambda_python_alpha.PythonFunction(
+            self,
+            "CalendarSyncLambda",
+            description="Scheduled function syncing the Notion calendar into a table",
+            **self._runtime_options,
+            index="calendar_sync.py",
+            handler="handler",
+            environment={
+                **runtime_environment,
+                "EventStoreTableName": self.event_table.table_name,
+            },
+            timeout=Duration.minutes(2),
+            log_retention=RetentionDays.ONE_WEEK,
+        )
+        notion_secret.grant_read(grantee=self.sync_lambda)
+        self.event_table.grant_read_write_data(self.sync_lambda)
+
+        # The bot lambda goes back to querying Notion if three syncs in a row are
+        # missed
+        self.bot_lambda.add_environment(
+            "EventStoreTableName", self.event_table.table_name
+        )
+        self.bot_lambda.add_environment(
+            "EventStoreMaxAge", str(int(interval.to_seconds() * 3))
+        )
+        self.event_table.grant_read_data(self.bot_lambda)
+
+        self.sync_lambda.metric_errors().create_alarm(
+            self, "CalendarSyncFailureAlarm", threshold=1, evaluation_periods=3
+        ).add_alarm_action(cw_actions.SnsAction(failure_topic))
+
+        events.Rule(
+            self,
+            "CalendarSyncSchedule",
+            schedule=events.Schedule.rate(interval),
+            targets=[events_targets.LambdaFunction(self.sync_lambda)],
+        )
+
+    def _add_ingestion_queue(
+        self, failure_topic: sns.ITopic, secret_token: bool
+    ) -> apigw.AwsIntegration:
+        """
+        Create the queue where updates are buffered before being processed in
+        batches by the bot lambda
+        :param failure_topic: Topic to notify when updates cannot be processed
+        :param secret_token: Whether to pass the secret token header along with each
+                             update, as a message attribute
+        :return: Integration that sends the body of each request to the queue
+        """
+        # Telegram sends each update only once in a response, so its identifier is
+        # also the deduplication identifier of its message
+        send_message = (
+            f"{update_group_template()}"
+            "Action=SendMessage&MessageBody=$util.urlEncode($input.body)"
+            "&MessageGroupId=$util.urlEncode($group)"
+            "&MessageDeduplicationId=$input.path('$.update_id')"
+        )
+        if secret_token:
+            # SQS rejects empty attributes, so requests without the header are not
+            # queued at all
+            send_message += (
+                "&MessageAttribute.1.Name=SecretToken"
+                "&MessageAttribute.1.Value.DataType=String"
+                "&MessageAttribute.1.Value.StringValue="
+                f"$util.urlEncode($input.params('{SECRET_TOKEN_HEADER}'))"
+            )
+
+        # Updates that keep failing are moved to a dead-letter queue, so that they
+        # do not block the rest
+        dead_letter_queue = sqs.Queue(
+            self,
+            "UpdateDeadLetterQueue",
+            fifo=True,
+            retention_period=Duration.days(14),
+        )
+        dead_letter_queue.metric_approximate_number_of_messages_visible().create_alarm(
+            self, "DeadLetterAlarm", threshold=1, evaluation_periods=1
+        ).add_alarm_action(cw_actions.SnsAction(failure_topic))
+
+        # Messages of a group are not received while an earlier one is in flight,
+        # so the updates of a chat keep their order across batches and retries.
+        # The visibility timeout is six times that of the function, as advised for
+        # Lambda event sources.
+        self.update_queue = sqs.Queue(
+            self,
+            "UpdateQueue",
+            fifo=True,
+            visibility_timeout=Duration.seconds(6 * BATCH_TIMEOUT.to_seconds()),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=3, queue=dead_letter_queue
+            ),
+        )
+
+        # Failed updates are reported individually, so only those are retried
+        self.bot_handler.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                self.update_queue,
+                # FIFO queues do not support batching windows
+                batch_size=BATCH_SIZE,
+                report_batch_item_failures=True,
+            )
+        )
+
+        gateway_role = iam.Role(
+            self,
+            "IngestionRole",
+            assumed_by=iam.ServicePrincipal("apigateway.amazonaws.com"),
+        )
+        self.update_queue.grant_send_messages(gateway_role)
+
+        return apigw.AwsIntegration(
+            service="sqs",
+            path=f"{Stack.of(self).account}/{self.update_queue.queue_name}",
+            integration_http_method="POST",
+            options=apigw.IntegrationOptions(
+                credentials_role=gateway_role,
+                passthrough_behavior=apigw.PassthroughBehavior.NEVER,
+                request_parameters={
+                    "integration.request.header.Content-Type": (
+                        "'application/x-www-form-urlencoded'"
+                    )
+                },
+                request_templates={"application/json": send_message},
+                # Telegram only needs to know that the update was received
+                integration_responses=[
+                    apigw.IntegrationResponse(
+                        status_code="200", response_templates={"application/json": "{}"}
+                    )
+                ],
             ),
-            method_responses=[apigw.MethodResponse(status_code="200")],
         )
@@ -0,0 +1,95 @@
+"""
+Scheduled sync of the Notion calendar into the event store read by the handlers.
+
+Each run only fetches the pages edited since the previous one, so its cost grows
+with the number of edits rather than with the size of the calendar. Pages
+deleted from Notion never show up as edited, so every so often the store is
+rebuilt with every event instead.
+
+Usage, for local runs with a SQLite store:
+    EventStorePath=events.db python calendar_sync.py [--every SECONDS]
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Dict, Optional
+
+import metrics
+import transport
+from notion.api import MAX_EVENT_SPAN, edited_since_query, iter_pages, pages_after_query
+from notion.model import NotionEvent
+from notion.store import REBUILT_AT, WATERMARK, open_event_store
+
+# Seconds after which the store is rebuilt from scratch, dropping deleted events
+REBUILD_INTERVAL = timedelta(
+    seconds=float(os.environ.get("EventSyncRebuildInterval", "86400"))
+)
+
+
+def sync_events(store, now: Optional[datetime] = None) -> Dict[str, object]:
+    """
+    Bring the store up to date with the calendar in Notion
+    :param store: Store to update
+    :param now: Moment the sync starts, the current one if not provided
+    :return: Dictionary with the number of events written and whether the store was
+             rebuilt
+    """
+    now = now or datetime.now(UTC)
+    watermark = store.get_state(WATERMARK)
+    rebuilt_at = store.get_state(REBUILT_AT)
+
+    rebuild = (
+        watermark is None or rebuilt_at is None or now - rebuilt_at >= REBUILD_INTERVAL
+    )
+    if rebuild:
+        # Events that began before today but still last are kept too
+        query = pages_after_query(now - MAX_EVENT_SPAN - timedelta(days=1))
+    else:
+        query = edited_since_query(watermark)
+    events = [NotionEvent.from_page(page) for page in iter_pages(query)]
+
+    if rebuild:
+        store.replace(events, now)
+    else:
+        store.upsert(events, now)
+    return {"events": len(events), "rebuilt": rebuild}
+
+
+def handler(event, context):
+    """
+    Entry point for the scheduled sync runs
+    """
+    store = open_event_store()
+    if store is None:
+        raise RuntimeError("No event store is configured")
+
+    try:
+        with metrics.span(metrics.INVOCATION):
+            result = sync_events(store)
+    finally:
+        metrics.flush()
+    print(f"Calendar sync finished: {result}")
+    print(f"Connection reuse: {transport.format_stats()}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--every",
+        type=float,
+        help="Keep syncing with this many seconds between runs, instead of once",
+    )
+    args = parser.parse_args()
+
+    while True:
+        handler(None, None)
+        if args.every is None:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
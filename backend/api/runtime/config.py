@@ -0,0 +1,209 @@
+"""
+Configuration and secrets for the bot runtime. Secrets are fetched lazily, in
+parallel, and cached with a refresh TTL so that warm containers do not hit
+Secrets Manager on every invocation.
+"""
+
+import functools
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import metrics
+
+TELEGRAM_SECRET_NAME = os.environ.get("TelegramSecretName")
+NOTION_SECRET_NAME = os.environ.get("NotionSecretName")
+
+# Seconds after which a cached secret is fetched again, so rotations are picked up
+SECRET_TTL = float(os.environ.get("SecretRefreshTTL", "3600"))
+
+# Time zone where the calendar events take place, used to determine the current day
+TIME_ZONE = ZoneInfo(os.environ.get("TimeZone", "Europe/Madrid"))
+
+# Alternative API endpoints, used to point the bot to local stand-ins
+TELEGRAM_BASE_URL = os.environ.get("TelegramBaseURL")
+NOTION_BASE_URL = os.environ.get("NotionBaseURL")
+
+# Whether updates must carry the secret token set on the webhook, which proves
+# that they were sent by Telegram
+VALIDATE_SECRET_TOKEN = os.environ.get("ValidateSecretToken", "false").lower() == "true"
+
+# Keep the event loop and the initialized application alive between the
+# invocations served by the same container, so that background tasks survive them
+PERSISTENT_RUNTIME = os.environ.get("PersistentRuntime", "true").lower() == "true"
+
+# JSON object mapping secret names to values, used instead of Secrets Manager for
+# local runs
+LOCAL_SECRETS = os.environ.get("LocalSecrets")
+
+_secrets_manager = None
+
+
+def _load_from_secrets_manager(secret_name: str) -> str:
+    """
+    Obtain the value of a secret from Secrets Manager. boto3 is imported here, so
+    its import cost is only paid when a secret is actually needed.
+    :param secret_name: Name of the secret
+    :return: String with the plaintext secret
+    """
+    global _secrets_manager
+
+    if _secrets_manager is None:
+        import boto3
+        from transport import aws_config
+
+        _secrets_manager = boto3.client("secretsmanager", config=aws_config())
+    return _secrets_manager.get_secret_value(SecretId=secret_name)["SecretString"]
+
+
+def _load_from_local_secrets(secret_name: str) -> str:
+    """
+    Obtain the value of a secret from the LocalSecrets environment variable
+    :param secret_name: Name of the secret
+    :return: String with the plaintext secret
+    """
+    return json.loads(LOCAL_SECRETS)[secret_name]
+
+
+class SecretStore:
+    """Cache of secret values, refreshed after a TTL"""
+
+    def __init__(self, loader: Callable[[str], str], ttl: float):
+        """
+        Initializes a new SecretStore
+        :param loader: Function returning the value of a secret given its name
+        :param ttl: Seconds during which a fetched value is reused
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, secret_name: str) -> bool:
+        cached = self._values.get(secret_name)
+        return cached is not None and time.monotonic() - cached[1] < self.ttl
+
+    def _fetch(self, secret_name: str) -> str:
+        value = self.loader(secret_name)
+        with self._lock:
+            self._values[secret_name] = (value, time.monotonic())
+        return value
+
+    def get(self, secret_name: str) -> str:
+        """
+        Return the value of a secret, fetching it if it is not cached or expired
+        :param secret_name: Name of the secret
+        :return: String with the plaintext secret
+        """
+        if self._is_fresh(secret_name):
+            return self._values[secret_name][0]
+        with metrics.span(metrics.SECRET_FETCH):
+            return self._fetch(secret_name)
+
+    def prefetch(self, secret_names: Iterable[Optional[str]]):
+        """
+        Fetch every secret that is not cached yet in parallel
+        :param secret_names: Names of the secrets, None values are ignored
+        """
+        missing = {name for name in secret_names if name and not self._is_fresh(name)}
+        if not missing:
+            return
+        with metrics.span(metrics.SECRET_FETCH):
+            if len(missing) == 1:
+                self._fetch(missing.pop())
+            else:
+                with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                    # Consume the results so that any error is raised here
+                    list(executor.map(self._fetch, missing))
+
+    def clear(self):
+        """
+        Forget every cached value
+        """
+        with self._lock:
+            self._values.clear()
+
+
+secret_store = SecretStore(
+    _load_from_local_secrets if LOCAL_SECRETS else _load_from_secrets_manager,
+    SECRET_TTL,
+)
+
+
+def prefetch_secrets():
+    """
+    Fetch the Telegram and Notion API keys in parallel, so that neither has to be
+    fetched on the critical path of a later request
+    """
+    secret_store.prefetch([TELEGRAM_SECRET_NAME, NOTION_SECRET_NAME])
+
+
+def get_telegram_api_key() -> str:
+    """
+    Return the API key for the Telegram bot
+    :return: String with the plaintext API key
+    """
+    return secret_store.get(TELEGRAM_SECRET_NAME)
+
+
+def get_notion_api_key() -> str:
+    """
+    Return the API key for the Notion integration
+    :return: String with the plaintext API key
+    """
+    return secret_store.get(NOTION_SECRET_NAME)
+
+
+@functools.lru_cache(maxsize=2)
+def derive_webhook_secret_token(api_key: str) -> str:
+    """
+    Derive the secret token of the webhook from the API key of the bot, so that
+    it changes when the key is rotated and no additional secret is needed. The
+    webhook function derives it in the same way.
+    :param api_key: API key for the Telegram bot
+    :return: String with the token, made of characters accepted by Telegram
+    """
+    return hmac.new(
+        api_key.encode(), b"telegram-webhook-secret-token", hashlib.sha256
+    ).hexdigest()
+
+
+@functools.lru_cache(maxsize=2)
+def derive_calendar_token(api_key: str) -> str:
+    """
+    Derive the token that gives access to the calendar feed from the API key of
+    the bot, so that the subscription links stop working when the key is rotated
+    :param api_key: API key for the Telegram bot
+    :return: String with the token, safe to use in a URL
+    """
+    return hmac.new(
+        api_key.encode(), b"calendar-feed-token", hashlib.sha256
+    ).hexdigest()
+
+
+def is_valid_calendar_token(token: Optional[str]) -> bool:
+    """
+    Check the token received with a request for the calendar feed
+    :param token: Value of the token query parameter, if any
+    :return: True if the feed can be served, False otherwise
+    """
+    expected = derive_calendar_token(get_telegram_api_key())
+    return token is not None and hmac.compare_digest(token, expected)
+
+
+def is_valid_secret_token(token: Optional[str]) -> bool:
+    """
+    Check the secret token received with an update, if validation is enabled
+    :param token: Value of the X-Telegram-Bot-Api-Secret-Token header, if any
+    :return: True if the update can be processed, False otherwise
+    """
+    if not VALIDATE_SECRET_TOKEN:
+        return True
+    expected = derive_webhook_secret_token(get_telegram_api_key())
+    return token is not None and hmac.compare_digest(token, expected)
@@ -0,0 +1,245 @@
+"""
+Deduplication of the updates delivered more than once by Telegram.
+
+Telegram delivers an update again when the webhook takes too long to answer, so
+each update_id is claimed before it is processed, in two phases. The claim is a
+short lease, which lets a delivery through again if the one holding it crashed
+or timed out, and only once the update has been processed is it marked as done
+for a day. Recently completed identifiers are kept in memory, so that a duplicate
+reaching the same container is discarded without any request, while a shared
+store with expiring entries catches those reaching another container.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import transport
+
+# Name of the DynamoDB table shared by every container, None to only keep the
+# claimed updates in memory
+DEDUP_TABLE_NAME = os.environ.get("DedupTableName")
+# Seconds a processed update is remembered. Telegram stops delivering an update
+# well before a day has passed.
+DEDUP_TTL = int(os.environ.get("DedupTTL", "86400"))
+# Seconds an update is reserved while it is processed, after which another
+# delivery can claim it. It must be longer than the function timeout.
+DEDUP_LEASE = int(os.environ.get("DedupLease", "60"))
+# Maximum number of processed updates kept in memory by each container
+DEDUP_MAX_ENTRIES = int(os.environ.get("DedupMaxEntries", "1024"))
+
+
+class InMemoryStore:
+    """Store of claimed updates local to the process, for tests and local runs"""
+
+    def __init__(
+        self, ttl: float, lease: float, clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initializes a new InMemoryStore
+        :param ttl: Seconds a processed update is remembered
+        :param lease: Seconds an update is reserved while it is processed
+        :param clock: Function returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.lease = lease
+        self._clock = clock
+        self._expirations = {}
+        self._lock = threading.Lock()
+
+    def claim(self, update_id: int) -> bool:
+        """
+        Reserve an update for the lease time, unless it is reserved or processed
+        :param update_id: Identifier of the update
+        :return: True if the update was claimed, False if it is a duplicate
+        """
+        now = self._clock()
+        with self._lock:
+            if self._expirations.get(update_id, now) > now:
+                return False
+            self._expirations[update_id] = now + self.lease
+            # Expired entries are dropped once there are too many entries
+            if len(self._expirations) > 2 * DEDUP_MAX_ENTRIES:
+                self._expirations = {
+                    key: expiration
+                    for key, expiration in self._expirations.items()
+                    if expiration > now
+                }
+        return True
+
+    def complete(self, update_id: int):
+        """
+        Mark a claimed update as processed, so that it is remembered for the TTL
+        :param update_id: Identifier of the update
+        """
+        with self._lock:
+            self._expirations[update_id] = self._clock() + self.ttl
+
+    def release(self, update_id: int):
+        """
+        Forget a claimed update, so that it can be claimed again
+        :param update_id: Identifier of the update
+        """
+        with self._lock:
+            self._expirations.pop(update_id, None)
+
+
+class DynamoDBStore:
+    """
+    Store of claimed updates in a DynamoDB table, whose ExpiresAt attribute is
+    configured as its time to live
+    """
+
+    def __init__(self, table_name: str, ttl: int, lease: int):
+        """
+        Initializes a new DynamoDBStore
+        :param table_name: Name of the table, with UpdateId as its numeric key
+        :param ttl: Seconds a processed update is remembered
+        :param lease: Seconds an update is reserved while it is processed
+        """
+        self.table_name = table_name
+        self.ttl = ttl
+        self.lease = lease
+        self._client = None
+
+    def _get_client(self):
+        # boto3 is only imported when the first update is claimed
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("dynamodb", config=transport.aws_config())
+        return self._client
+
+    def claim(self, update_id: int) -> bool:
+        """
+        Reserve an update for the lease time with a conditional write, which only
+        succeeds if the update is not in the table or its entry has expired but not
+        been deleted yet, such as the lease of a crashed invocation
+        :param update_id: Identifier of the update
+        :return: True if the update was claimed, False if it is a duplicate
+        """
+        from botocore.exceptions import ClientError
+
+        now = int(time.time())
+        try:
+            self._get_client().put_item(
+                TableName=self.table_name,
+                Item={
+                    "UpdateId": {"N": str(update_id)},
+                    "ExpiresAt": {"N": str(now + self.lease)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(UpdateId) OR ExpiresAt < :now"
+                ),
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def complete(self, update_id: int):
+        """
+        Mark a claimed update as processed, so that it is remembered for the TTL
+        :param update_id: Identifier of the update
+        """
+        self._get_client().put_item(
+            TableName=self.table_name,
+            Item={
+                "UpdateId": {"N": str(update_id)},
+                "ExpiresAt": {"N": str(int(time.time()) + self.ttl)},
+            },
+        )
+
+    def release(self, update_id: int):
+        """
+        Forget a claimed update, so that it can be claimed again
+        :param update_id: Identifier of the update
+        """
+        self._get_client().delete_item(
+            TableName=self.table_name, Key={"UpdateId": {"N": str(update_id)}}
+        )
+
+
+class UpdateDeduplicator:
+    """
+    Remembers the recently processed updates in memory, in front of a shared store
+    """
+
+    def __init__(self, store, max_entries: int):
+        """
+        Initializes a new UpdateDeduplicator
+        :param store: Store shared by every container, with claim, complete and
+                      release methods
+        :param max_entries: Maximum number of processed updates kept in memory,
+                            least recently processed ones are evicted first
+        """
+        self.store = store
+        self.max_entries = max_entries
+        self._recent: OrderedDict[int, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, update_id: Optional[int]) -> bool:
+        """
+        Claim an update before processing it, which reserves it until it is
+        completed or released, or the lease expires. If the shared store cannot be
+        reached the update is processed anyway, as a duplicate reply is preferable
+        to none.
+        :param update_id: Identifier of the update, None if unknown
+        :return: True if the update must be processed, False if it is a duplicate
+        """
+        if update_id is None:
+            return True
+        with self._lock:
+            if update_id in self._recent:
+                return False
+
+        try:
+            return self.store.claim(update_id)
+        except Exception as e:
+            print(f"Could not claim update {update_id}: {e!r}")
+            return True
+
+    def complete(self, update_id: Optional[int]):
+        """
+        Mark an update as processed, so that later deliveries are discarded
+        :param update_id: Identifier of the update, None if unknown
+        """
+        if update_id is None:
+            return
+        with self._lock:
+            self._recent[update_id] = None
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+        try:
+            self.store.complete(update_id)
+        except Exception as e:
+            print(f"Could not complete update {update_id}: {e!r}")
+
+    def release(self, update_id: Optional[int]):
+        """
+        Release an update that could not be processed, so that the next delivery
+        is processed again
+        :param update_id: Identifier of the update, None if unknown
+        """
+        if update_id is None:
+            return
+        with self._lock:
+            self._recent.pop(update_id, None)
+        try:
+            self.store.release(update_id)
+        except Exception as e:
+            print(f"Could not release update {update_id}: {e!r}")
+
+
+deduplicator = UpdateDeduplicator(
+    (
+        DynamoDBStore(DEDUP_TABLE_NAME, DEDUP_TTL, DEDUP_LEASE)
+        if DEDUP_TABLE_NAME
+        else InMemoryStore(DEDUP_TTL, DEDUP_LEASE)
+    ),
+    DEDUP_MAX_ENTRIES,
+)
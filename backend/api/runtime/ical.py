@@ -0,0 +1,242 @@
+"""
+iCalendar feed of the calendar events, for calendar apps to subscribe to.
+
+Calendar apps poll their feeds often, while the calendar rarely changes. The feed
+is rendered as the pages arrive from Notion, and kept in memory together with an
+ETag computed from a digest of the rendered feed, so that polls within the cache
+TTL cost neither a Notion query nor a render, and polls of an unchanged calendar
+are answered with 304 Not Modified.
+"""
+
+import hashlib
+import os
+import time
+from datetime import date, datetime, timedelta, UTC
+from typing import Iterable, Iterator, Optional
+
+import config
+import metrics
+from notion import api
+from notion.model import NotionEvent
+
+# Seconds a rendered feed is served before querying Notion again
+CACHE_TTL = float(os.environ.get("CalendarCacheTTL", "300"))
+# Days of past events included in the feed
+PAST_DAYS = int(os.environ.get("CalendarPastDays", "30"))
+
+# Longest line allowed by the iCalendar format, in octets and without line break
+MAX_LINE_OCTETS = 75
+
+
+def escape_text(text: str) -> str:
+    """
+    Escape a text for use as an iCalendar property value
+    :param text: Text to escape
+    :return: String with the escaped text
+    """
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def fold(line: str) -> str:
+    """
+    Split a content line into lines of at most 75 octets, as required by the
+    iCalendar format, without splitting multibyte characters
+    :param line: Content line, without line break
+    :return: String with the folded line, ending in a line break
+    """
+    if len(line.encode()) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+
+    parts = []
+    current, size = [], 0
+    for char in line:
+        char_size = len(char.encode())
+        # Continuation lines start with a space, which counts towards the limit
+        limit = MAX_LINE_OCTETS if not parts else MAX_LINE_OCTETS - 1
+        if size + char_size > limit:
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += char_size
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_moment(moment: datetime) -> str:
+    return moment.astimezone(UTC).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _format_day(day: date) -> str:
+    return day.strftime("%Y%m%d")
+
+
+def _edited_at(event: NotionEvent) -> Optional[datetime]:
+    if not event.last_edited_time:
+        return None
+    return datetime.fromisoformat(event.last_edited_time.replace("Z", "+00:00"))
+
+
+def render_event(event: NotionEvent) -> Iterator[str]:
+    """
+    Render an event as an iCalendar VEVENT component. Dates without time zone
+    are those of all-day events.
+    :param event: Event to render
+    :return: Iterator over the folded content lines of the component
+    """
+    start, end = event.date.start, event.date.end
+    edited_at = _edited_at(event)
+
+    lines = ["BEGIN:VEVENT", f"UID:{event.id}@escultoide-bot"]
+    lines.append(f"DTSTAMP:{_format_moment(edited_at or datetime.now(UTC))}")
+    if start.tzinfo is None:
+        # The end of all-day events is exclusive
+        last_day = (end or start).date() + timedelta(days=1)
+        lines.append(f"DTSTART;VALUE=DATE:{_format_day(start.date())}")
+        lines.append(f"DTEND;VALUE=DATE:{_format_day(last_day)}")
+    else:
+        lines.append(f"DTSTART:{_format_moment(start)}")
+        if end:
+            lines.append(f"DTEND:{_format_moment(end)}")
+    lines.append(f"SUMMARY:{escape_text(event.title)}")
+    if event.location:
+        lines.append(f"LOCATION:{escape_text(event.location)}")
+
+    description = [event.type]
+    if event.scouters:
+        description.append(f"Scouters: {', '.join(event.scouters)}")
+    if event.participant_num:
+        description.append(f"Educandos: {event.participant_num}")
+    description_text = escape_text("\n".join(description))
+    lines.append(f"DESCRIPTION:{description_text}")
+    lines.append(f"URL:{event.url}")
+    if edited_at:
+        lines.append(f"LAST-MODIFIED:{_format_moment(edited_at)}")
+    lines.append("END:VEVENT")
+
+    for line in lines:
+        yield fold(line)
+
+
+def render_calendar(events: Iterable[NotionEvent]) -> Iterator[str]:
+    """
+    Render a calendar with events, one component at a time, so that each event is
+    rendered as soon as it is available
+    :param events: Events to include
+    :return: Iterator over the folded content lines of the calendar
+    """
+    yield fold("BEGIN:VCALENDAR")
+    yield fold("VERSION:2.0")
+    yield fold("PRODID:-//EscultoideBot//Calendario//ES")
+    yield fold("CALSCALE:GREGORIAN")
+    yield fold("X-WR-CALNAME:Escultoide")
+    for event in events:
+        yield from render_event(event)
+    yield fold("END:VCALENDAR")
+
+
+class CalendarFeed:
+    """Rendered feed, together with its ETag"""
+
+    __slots__ = ("body", "etag", "built_at")
+
+    def __init__(self, body: str, etag: str, built_at: float):
+        """
+        Initializes a new CalendarFeed
+        :param body: Text of the feed
+        :param etag: Quoted strong ETag of the feed
+        :param built_at: Monotonic time the feed was built at
+        """
+        self.body = body
+        self.etag = etag
+        self.built_at = built_at
+
+
+def build_feed(events: Iterable[NotionEvent]) -> CalendarFeed:
+    """
+    Render a feed, computing its ETag from a digest of the rendered text, so that
+    it changes with any change to the feed, including several edits made within
+    the same minute, which Notion reports with the same last edit time
+    :param events: Events to include, consumed only once
+    :return: CalendarFeed instance
+    """
+    body = "".join(render_calendar(events))
+    digest = hashlib.sha256(body.encode()).hexdigest()
+    return CalendarFeed(body, f'"{digest[:32]}"', time.monotonic())
+
+
+# Feed served by this container, kept across warm invocations
+_feed: Optional[CalendarFeed] = None
+
+
+def get_feed() -> CalendarFeed:
+    """
+    Return the feed, rendering it again once it is older than CACHE_TTL
+    :return: CalendarFeed instance
+    """
+    global _feed
+
+    if _feed is None or time.monotonic() - _feed.built_at >= CACHE_TTL:
+        since = datetime.now(UTC) - timedelta(days=PAST_DAYS)
+        # Pages are fetched while the feed is rendered, so the time is recorded in
+        # the Notion phases rather than as a render
+        _feed = build_feed(api.get_events_after(since))
+    return _feed
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check whether an If-None-Match header matches an ETag, with the weak
+    comparison that the header calls for
+    :param if_none_match: Value of the header, if any
+    :param etag: Quoted ETag of the current representation
+    :return: True if the client already has the current representation
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def respond(token: Optional[str], if_none_match: Optional[str]) -> dict:
+    """
+    Build the response to a request for the feed
+    :param token: Access token received in the query string, if any
+    :param if_none_match: Value of the If-None-Match header, if any
+    :return: Dictionary with the response for an API Gateway proxy integration
+    """
+    if not config.is_valid_calendar_token(token):
+        return {"statusCode": 403, "body": ""}
+
+    feed = get_feed()
+    headers = {"ETag": feed.etag, "Cache-Control": f"max-age={int(CACHE_TTL)}"}
+    if etag_matches(if_none_match, feed.etag):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    return {
+        "statusCode": 200,
+        "headers": {**headers, "Content-Type": "text/calendar; charset=utf-8"},
+        "body": feed.body,
+    }
+
+
+def handler(event, context):
+    """
+    Entry point for the GET /calendar.ics requests, through an API Gateway proxy
+    integration
+    """
+    params = event.get("queryStringParameters") or {}
+    headers = {
+        name.lower(): value for name, value in (event.get("headers") or {}).items()
+    }
+    try:
+        with metrics.span(metrics.INVOCATION):
+            return respond(params.get("token"), headers.get("if-none-match"))
+    finally:
+        metrics.flush()
@@ -0,0 +1,121 @@
+"""
+Timing of the phases of a request, published as CloudWatch metrics.
+
+Phases are timed with spans, which only add up the elapsed time in memory. At the
+end of each invocation the totals are written to the log as a single record in
+the CloudWatch Embedded Metric Format, which CloudWatch turns into metrics
+without any call to its API.
+"""
+
+import json
+import os
+import time
+from typing import Dict, Optional
+
+# Namespace of the published metrics
+NAMESPACE = os.environ.get("MetricsNamespace", "EscultoideBot")
+# Metrics are published per function, so those of different functions are not mixed
+FUNCTION_NAME = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+# Whether the metrics are written to the log at the end of each invocation
+METRICS_ENABLED = os.environ.get("Metrics", "true").lower() == "true"
+
+# Names of the timed phases
+SECRET_FETCH = "SecretFetch"
+APPLICATION_INIT = "ApplicationInit"
+UPDATE_PARSE = "UpdateParse"
+NOTION_QUERY = "NotionQuery"
+PAGE_PARSE = "PageParse"
+RENDER = "Render"
+TELEGRAM_SEND = "TelegramSend"
+INVOCATION = "Invocation"
+
+PHASES = (
+    SECRET_FETCH,
+    APPLICATION_INIT,
+    UPDATE_PARSE,
+    NOTION_QUERY,
+    PAGE_PARSE,
+    RENDER,
+    TELEGRAM_SEND,
+    INVOCATION,
+)
+
+# Milliseconds spent in each phase during the current invocation
+_totals: Dict[str, float] = {}
+_cold_start = True
+
+
+def record(name: str, milliseconds: float):
+    """
+    Add time to a phase of the current invocation
+    :param name: Name of the phase
+    :param milliseconds: Time spent in the phase
+    """
+    _totals[name] = _totals.get(name, 0.0) + milliseconds
+
+
+class Span:
+    """
+    Context manager that adds the time spent inside it to a phase. It can be
+    entered several times, for example once per Notion page parsed.
+    """
+
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._start = 0
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, (time.perf_counter_ns() - self._start) / 1e6)
+
+
+def span(name: str) -> Span:
+    """
+    Time a block of code as part of a phase
+    :param name: Name of the phase
+    :return: Span to use in a with statement
+    """
+    return Span(name)
+
+
+def flush(properties: Optional[Dict[str, object]] = None) -> Optional[str]:
+    """
+    Write the phase timings of the current invocation to the log as an embedded
+    metric record, and reset them for the next invocation
+    :param properties: Additional fields for the record, searchable in the logs but
+                       not published as metrics
+    :return: The record written, None if metrics are disabled
+    """
+    global _totals, _cold_start
+
+    totals, _totals = _totals, {}
+    cold_start, _cold_start = _cold_start, False
+    if not METRICS_ENABLED:
+        return None
+
+    record_ = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": "Milliseconds"} for name in totals
+                    ],
+                }
+            ],
+        },
+        "FunctionName": FUNCTION_NAME,
+        "ColdStart": cold_start,
+        **(properties or {}),
+        **{name: round(value, 3) for name, value in totals.items()},
+    }
+    line = json.dumps(record_, separators=(",", ":"))
+    print(line)
+    return line
@@ -1,65 +1,376 @@
+import json
 import os
-from datetime import datetime, UTC
-from typing import Any
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, TYPE_CHECKING
 
-import boto3
+import httpx
 
-from notion_client import Client
+import metrics
+import transport
+from config import NOTION_BASE_URL, get_notion_api_key
 from .model import NotionEvent
+from .schema import event_schema
+from .singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from notion_client import Client
 
 # Get environment variables
 CALENDAR_DB_ID = os.environ["NotionCalendarID"]
-NOTION_SECRET_NAME = os.environ["NotionSecretName"]
 
-secrets_manager = boto3.client("secretsmanager")
-NOTION_API_KEY = secrets_manager.get_secret_value(SecretId=NOTION_SECRET_NAME)[
-    "SecretString"
-]
+# Largest page size accepted by the Notion API
+MAX_PAGE_SIZE = 100
+
+# Longest span of a multi-day event. Window queries look this far back, so that
+# events that started before the window but last into it are found too.
+MAX_EVENT_SPAN = timedelta(days=int(os.environ.get("MaxEventSpanDays", "14")))
+
+# Precision of the last_edited_time of Notion pages
+LAST_EDITED_GRANULARITY = timedelta(minutes=1)
+
+# Attempts made for each query, and longest wait before a retry in seconds. A
+# longer Retry-After than that fails the query, rather than the whole invocation.
+MAX_ATTEMPTS = int(os.environ.get("NotionMaxAttempts", "3"))
+MAX_RETRY_DELAY = float(os.environ.get("NotionMaxRetryDelay", "2"))
+# Base of the exponential backoff when Notion does not say how long to wait
+RETRY_BASE_DELAY = 0.25
+# Rate limited, and transient gateway errors
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+# Name of the property with the date of the events
+DATE_PROPERTY = event_schema.property_name("date")
 
-notion = Client(auth=NOTION_API_KEY)
+_notion: Optional["Client"] = None
+_notion_api_key: Optional[str] = None
 
+# Identical queries made concurrently share a single request
+_in_flight = SingleFlight()
+# Key of the request retrieving the schema of the database
+SCHEMA_KEY = ("retrieve", CALENDAR_DB_ID)
 
-def get_pages_after(date: datetime) -> [Any]:
+
+def get_client() -> "Client":
     """
-    Fetch the Notion pages with a date after the provided one
-    :param date: Date to use as a filter
-    :return: List with dictionaries for the Notion pages
-    """
-    date_as_text = date.isoformat()
-    query_res = notion.databases.query(
-        **{
-            "database_id": CALENDAR_DB_ID,
-            "filter": {"property": "Fecha", "date": {"after": date_as_text}},
-            "sorts": [{"property": "Fecha", "direction": "ascending"}],
-        }
-    )
+    Return the Notion client, creating it on first use. notion_client is imported
+    here so that requests that never reach Notion do not pay for it, and the client
+    is recreated if the API key has been rotated. Its connection pool is kept alive
+    across warm invocations.
+    :return: Client instance
+    """
+    global _notion, _notion_api_key
 
-    return query_res["results"]
+    api_key = get_notion_api_key()
+    if _notion is None or api_key != _notion_api_key:
+        from notion_client import Client
 
+        options = {"base_url": NOTION_BASE_URL} if NOTION_BASE_URL else {}
+        _notion = Client(auth=api_key, client=transport.notion_http_client(), **options)
+        transport.apply_notion_timeout(_notion)
+        _notion_api_key = api_key
+    return _notion
 
-def get_events_after(date: datetime) -> [NotionEvent]:
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
     """
-    Return the Notion events with a date after the provided one
-    :param date: Date to use as a filter
-    :return: List with NotionEvent objects
+    Return how long to wait before retrying a failed request. The Retry-After
+    header is honored when present, otherwise the wait is an exponential backoff
+    with full jitter, so that concurrent retries are spread out.
+    :param error: Error raised by the request
+    :param attempt: Number of the failed attempt, starting at 1
+    :return: Seconds to wait, None if the request must not be retried
+    """
+    from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+    if attempt >= MAX_ATTEMPTS:
+        return None
+
+    delay = None
+    if isinstance(error, HTTPResponseError):
+        if error.status not in RETRYABLE_STATUSES:
+            return None
+        try:
+            retry_after = float(error.headers["Retry-After"])
+            delay = retry_after + random.uniform(0, RETRY_BASE_DELAY)
+        except (KeyError, ValueError):
+            pass
+    elif not isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+        return None
+
+    if delay is None:
+        delay = random.uniform(0, RETRY_BASE_DELAY * 2**attempt)
+    return delay if delay <= MAX_RETRY_DELAY else None
+
+
+class Retries:
+    """
+    Attempts made for a request, shared by the synchronous and asynchronous
+    clients, which only differ in how they wait between attempts
+    """
+
+    def __init__(self):
+        self.attempt = 1
+
+    def delay_after(self, error: Exception) -> float:
+        """
+        Return how long to wait before the next attempt, after logging the failure
+        :param error: Error raised by the last attempt
+        :return: Seconds to wait
+        :raises the error if the request must not be retried
+        """
+        delay = retry_delay(error, self.attempt)
+        if delay is None:
+            raise error
+        print(f"Notion request failed with {error!r}, retrying in {delay:.2f}s")
+        self.attempt += 1
+        return delay
+
+
+def query_key(params: Dict[str, Any]) -> str:
+    """
+    Return a key identifying the parameters of a query
+    :param params: Parameters for the query
+    :return: String with the parameters serialized in a stable order
+    """
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def _with_retry(request: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    retries = Retries()
+    while True:
+        try:
+            with metrics.span(metrics.NOTION_QUERY):
+                return request()
+        except Exception as e:
+            time.sleep(retries.delay_after(e))
+
+
+def _query_with_retry(params: Dict[str, Any]) -> Dict[str, Any]:
+    notion = get_client()
+    return _with_retry(lambda: notion.databases.query(**params))
+
+
+def query_database(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Query the database, retrying transient errors. Identical queries made while
+    one is in flight wait for it and share its response.
+    :param params: Parameters for the query, including the database identifier
+    :return: Dictionary with the response, which must not be modified
+    """
+    return _in_flight.do(query_key(params), lambda: _query_with_retry(params))
+
+
+def get_property_ids() -> Optional[List[str]]:
+    """
+    Return the identifiers of the properties events are built from, resolving them
+    from the schema of the database on first use. Queries then only request those
+    properties, instead of every property of every page.
+    :return: List with the identifiers, None if they could not be resolved, in
+             which case every property is requested
+    :raises ValueError if the database lacks a property of the event schema
     """
-    pages = get_pages_after(date)
+    if not event_schema.should_resolve():
+        return event_schema.property_ids
 
-    return [NotionEvent.from_page(page) for page in pages]
+    notion = get_client()
+    try:
+        database = _in_flight.do(
+            SCHEMA_KEY,
+            lambda: _with_retry(lambda: notion.databases.retrieve(CALENDAR_DB_ID)),
+        )
+    except Exception as e:
+        print(f"Could not retrieve the database schema: {e!r}")
+        database = None
+    return resolve_property_ids(database)
 
 
-def get_next_event_after(date: datetime) -> NotionEvent:
+def resolve_property_ids(database: Optional[Dict[str, Any]]) -> Optional[List[str]]:
     """
-    Return the first Notion event with a date after the provided one
+    Resolve the identifiers of the properties events are built from, once the
+    schema of the database has been retrieved
+    :param database: Database object returned by the Notion API, None if it could
+                     not be retrieved, in which case it is retrieved again later
+    :return: List with the identifiers, None if they could not be resolved
+    :raises ValueError if the database lacks a property of the event schema
+    """
+    if database is None:
+        event_schema.resolve_failed()
+        return None
+    return event_schema.resolve(database)
+
+
+class Pagination:
+    """
+    Requests of a database query that follows the pagination cursors, and the pages
+    each response contributes. Shared by the synchronous and asynchronous clients,
+    which only perform the requests.
+    """
+
+    def __init__(
+        self,
+        query: Dict[str, Any],
+        page_size: int = MAX_PAGE_SIZE,
+        limit: Optional[int] = None,
+    ):
+        """
+        Initializes a new Pagination
+        :param query: Filter and sorts for the query, without pagination parameters
+        :param page_size: Number of pages to request in each call, up to 100
+        :param limit: Maximum number of pages to return, None for no limit
+        :raises ValueError if the page size is not accepted by Notion
+        """
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"Page size must be 0 < n <= {MAX_PAGE_SIZE}")
+        self.query = query
+        self.page_size = page_size
+        self.remaining = limit
+        self.done = limit is not None and limit <= 0
+        self._start_cursor: Optional[str] = None
+
+    def next_params(self, property_ids: Optional[List[str]]) -> Dict[str, Any]:
+        """
+        Build the parameters of the next request
+        :param property_ids: Identifiers of the properties to request, None for all
+        :return: Dictionary with the parameters, including the database identifier
+        """
+        params = {"database_id": CALENDAR_DB_ID, **self.query}
+        if property_ids:
+            params["filter_properties"] = property_ids
+        # Never ask for more rows than the caller will consume
+        params["page_size"] = (
+            self.page_size
+            if self.remaining is None
+            else min(self.page_size, self.remaining)
+        )
+        if self._start_cursor:
+            params["start_cursor"] = self._start_cursor
+        return params
+
+    def take(self, response: Dict[str, Any]) -> List[Any]:
+        """
+        Advance past a response, marking the query as done after the last page
+        :param response: Response to the last request
+        :return: List with the pages to return from the response
+        """
+        results = response["results"]
+        if self.remaining is not None:
+            results = results[: self.remaining]
+            self.remaining -= len(results)
+        self._start_cursor = response["next_cursor"]
+        self.done = not response["has_more"] or self.remaining == 0
+        return results
+
+
+def iter_pages(
+    query: Dict[str, Any], page_size: int = MAX_PAGE_SIZE, limit: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Lazily fetch the pages matching a database query, following the pagination
+    cursors only as far as the consumer iterates
+    :param query: Filter and sorts for the query, without pagination parameters
+    :param page_size: Number of pages to request in each call, up to 100
+    :param limit: Maximum number of pages to return, None for no limit
+    :return: Iterator over dictionaries for the Notion pages
+    """
+    pagination = Pagination(query, page_size, limit)
+    property_ids = get_property_ids()
+    while not pagination.done:
+        yield from pagination.take(query_database(pagination.next_params(property_ids)))
+
+
+def pages_after_query(date: datetime) -> Dict[str, Any]:
+    """
+    Build the query for the pages with a date after the provided one
+    :param date: Date to use as a filter
+    :return: Dictionary with the filter and sorts for the query
+    """
+    return {
+        "filter": {"property": DATE_PROPERTY, "date": {"after": date.isoformat()}},
+        "sorts": [{"property": DATE_PROPERTY, "direction": "ascending"}],
+    }
+
+
+def iter_pages_after(
+    date: datetime, page_size: int = MAX_PAGE_SIZE, limit: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    Lazily fetch the Notion pages with a date after the provided one
     :param date: Date to use as a filter
-    :return: NotionEvent object
+    :param page_size: Number of pages to request in each call, up to 100
+    :param limit: Maximum number of pages to return, None for no limit
+    :return: Iterator over dictionaries for the Notion pages
+    """
+    return iter_pages(pages_after_query(date), page_size, limit)
+
+
+def pages_between_query(
+    first_day: date, last_day: date, span: timedelta = MAX_EVENT_SPAN
+) -> Dict[str, Any]:
+    """
+    Build the query for the pages that may take place in a window of days. The
+    window is widened at its start by the longest span of an event, to find events
+    that began before it.
+    :param first_day: First day of the window
+    :param last_day: Last day of the window, inclusive
+    :param span: Longest span of an event, zero to only find events starting in
+    the window
+    :return: Dictionary with the filter and sorts for the query
+    """
+    return {
+        "filter": {
+            "and": [
+                {
+                    "property": DATE_PROPERTY,
+                    "date": {"on_or_after": (first_day - span).isoformat()},
+                },
+                {
+                    "property": DATE_PROPERTY,
+                    "date": {"on_or_before": last_day.isoformat()},
+                },
+            ]
+        },
+        "sorts": [{"property": DATE_PROPERTY, "direction": "ascending"}],
+    }
+
+
+def edited_since_query(
+    since: datetime, after: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Build the query for the pages edited since a moment. Notion rounds
+    last_edited_time down to the minute, so the query starts one minute earlier
+    to avoid missing edits, and may return some pages again.
+    :param since: Moment after which the pages must have been edited
+    :param after: If provided, only pages with a date after this one are returned
+    :return: Dictionary with the filter and sorts for the query
     """
-    return NotionEvent.from_page(get_pages_after(date)[0])
+    conditions = [
+        {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {
+                "on_or_after": (since - LAST_EDITED_GRANULARITY).isoformat()
+            },
+        }
+    ]
+    if after:
+        conditions.append(
+            {"property": DATE_PROPERTY, "date": {"after": after.isoformat()}}
+        )
+    return {
+        "filter": {"and": conditions},
+        "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}],
+    }
 
 
-def get_next_event() -> NotionEvent:
+def get_events_after(
+    date: datetime, page_size: int = MAX_PAGE_SIZE
+) -> Iterator[NotionEvent]:
     """
-    Return the first Notion event with a date after the current one
-    :return: NotionEvent object
+    Stream the Notion events with a date after the provided one, fetching further
+    pages from Notion only as they are consumed
+    :param date: Date to use as a filter
+    :param page_size: Number of pages to request in each call, up to 100
+    :return: Iterator over NotionEvent objects
     """
-    return get_next_event_after(datetime.now(UTC))
+    return (NotionEvent.from_page(page) for page in iter_pages_after(date, page_size))
@@ -0,0 +1,302 @@
+"""
+Asynchronous variant of the Notion API helpers, for use from the Telegram handlers
+without blocking the event loop
+"""
+
+import asyncio
+import os
+from contextlib import aclosing
+from datetime import date, datetime, UTC
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    TYPE_CHECKING,
+)
+
+import httpx
+
+import metrics
+import transport
+from config import NOTION_BASE_URL, get_notion_api_key
+from .api import (
+    CALENDAR_DB_ID,
+    MAX_EVENT_SPAN,
+    MAX_PAGE_SIZE,
+    SCHEMA_KEY,
+    Pagination,
+    Retries,
+    pages_after_query,
+    pages_between_query,
+    query_key,
+    resolve_property_ids,
+)
+from .cache import StaleWhileRevalidateCache
+from .index import DayIndex
+from .model import NotionEvent
+from .schema import event_schema
+from .singleflight import AsyncSingleFlight
+from .store import read_model
+
+if TYPE_CHECKING:
+    from notion_client import AsyncClient
+
+# Cache configuration, in seconds. A TTL of 0 disables the cache.
+CACHE_TTL = float(os.environ.get("NotionCacheTTL", "30"))
+CACHE_STALE_TTL = float(os.environ.get("NotionCacheStaleTTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("NotionCacheMaxEntries", "64"))
+
+# Query results survive between invocations served by the same warm container
+cache = StaleWhileRevalidateCache(
+    ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, max_entries=CACHE_MAX_ENTRIES
+)
+
+# Connection pool shared by every query made from the same event loop
+_http_client: Optional[httpx.AsyncClient] = None
+_notion: Optional["AsyncClient"] = None
+_notion_api_key: Optional[str] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Identical queries made concurrently share a single request
+_in_flight = AsyncSingleFlight()
+
+# Returned by _read_store when the events must be fetched from Notion instead
+_NOT_STORED = object()
+
+
+def get_client() -> "AsyncClient":
+    """
+    Return the asynchronous Notion client for the running event loop. Connections
+    cannot be shared between event loops, so a new pool is created whenever the
+    loop changes. notion_client is only imported on first use.
+    :return: AsyncClient instance
+    """
+    global _http_client, _notion, _notion_api_key, _loop
+
+    api_key = get_notion_api_key()
+    loop = asyncio.get_running_loop()
+    if _notion is None or _loop is not loop:
+        from notion_client import AsyncClient
+
+        _http_client = transport.notion_async_http_client()
+        options = {"base_url": NOTION_BASE_URL} if NOTION_BASE_URL else {}
+        _notion = AsyncClient(auth=api_key, client=_http_client, **options)
+        transport.apply_notion_timeout(_notion)
+        _notion_api_key = api_key
+        _loop = loop
+    elif api_key != _notion_api_key:
+        # Keep the connection pool, only the authorization header changes
+        _notion.options.auth = api_key
+        _http_client.headers["Authorization"] = f"Bearer {api_key}"
+        _notion_api_key = api_key
+    return _notion
+
+
+async def aclose():
+    """
+    Close the connection pool of the asynchronous Notion client, if any
+    """
+    global _http_client, _notion, _notion_api_key, _loop
+
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = _notion = _notion_api_key = _loop = None
+
+
+async def _with_retry(
+    request: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    retries = Retries()
+    while True:
+        try:
+            with metrics.span(metrics.NOTION_QUERY):
+                return await request()
+        except Exception as e:
+            await asyncio.sleep(retries.delay_after(e))
+
+
+async def _query_with_retry(params: Dict[str, Any]) -> Dict[str, Any]:
+    notion = get_client()
+    return await _with_retry(lambda: notion.databases.query(**params))
+
+
+async def query_database(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Query the database, retrying transient errors without blocking the event loop.
+    Identical queries made while one is in flight wait for it and share its
+    response.
+    :param params: Parameters for the query, including the database identifier
+    :return: Dictionary with the response, which must not be modified
+    """
+    return await _in_flight.do(query_key(params), lambda: _query_with_retry(params))
+
+
+def _read_if_fresh(read: Callable[[], Any]) -> Any:
+    # Checking the freshness may read the store too, so it runs in the same thread
+    return read() if read_model.is_fresh() else _NOT_STORED
+
+
+async def _read_store(read: Callable[[], Any]) -> Any:
+    """
+    Read from the store kept up to date by the sync job, if any, in a worker thread
+    so that the event loop is not blocked. Notion is queried instead when the
+    store has not been synced recently or cannot be read.
+    :param read: Function reading from the read model
+    :return: Result of the read, _NOT_STORED if Notion must be queried instead
+    """
+    if read_model is None:
+        return _NOT_STORED
+    try:
+        return await asyncio.to_thread(_read_if_fresh, read)
+    except Exception as e:
+        print(f"Could not read the event store, querying Notion: {e!r}")
+        return _NOT_STORED
+
+
+async def get_stored_events_from(first_day: date) -> Optional[List[NotionEvent]]:
+    """
+    Return the events starting on a day or later from the event store, without
+    querying Notion
+    :param first_day: First day to return events for
+    :return: List with the events, sorted by start, None if the store is not synced
+    """
+    events = await _read_store(lambda: read_model.events_from(first_day))
+    return None if events is _NOT_STORED else events
+
+
+async def get_store_synced_at() -> Optional[datetime]:
+    """
+    Return the moment of the last sync of the event store, which only changes when
+    the stored events do, without querying Notion
+    :return: The moment, None if the store is not synced
+    """
+    synced_at = await _read_store(lambda: read_model.synced_at)
+    return None if synced_at is _NOT_STORED else synced_at
+
+
+async def get_property_ids() -> Optional[List[str]]:
+    """
+    Return the identifiers of the properties events are built from, resolving them
+    from the schema of the database on first use. Queries then only request those
+    properties, instead of every property of every page.
+    :return: List with the identifiers, None if they could not be resolved, in
+             which case every property is requested
+    :raises ValueError if the database lacks a property of the event schema
+    """
+    if not event_schema.should_resolve():
+        return event_schema.property_ids
+
+    notion = get_client()
+    try:
+        database = await _in_flight.do(
+            SCHEMA_KEY,
+            lambda: _with_retry(lambda: notion.databases.retrieve(CALENDAR_DB_ID)),
+        )
+    except Exception as e:
+        print(f"Could not retrieve the database schema: {e!r}")
+        database = None
+    return resolve_property_ids(database)
+
+
+async def iter_pages(
+    query: Dict[str, Any], page_size: int = MAX_PAGE_SIZE, limit: Optional[int] = None
+) -> AsyncIterator[Any]:
+    """
+    Lazily fetch the pages matching a database query, following the pagination
+    cursors only as far as the consumer iterates
+    :param query: Filter and sorts for the query, without pagination parameters
+    :param page_size: Number of pages to request in each call, up to 100
+    :param limit: Maximum number of pages to return, None for no limit
+    :return: Asynchronous iterator over dictionaries for the Notion pages
+    """
+    pagination = Pagination(query, page_size, limit)
+    property_ids = await get_property_ids()
+    while not pagination.done:
+        response = await query_database(pagination.next_params(property_ids))
+        for page in pagination.take(response):
+            yield page
+
+
+def iter_pages_after(
+    date: datetime, page_size: int = MAX_PAGE_SIZE, limit: Optional[int] = None
+) -> AsyncIterator[Any]:
+    """
+    Lazily fetch the Notion pages with a date after the provided one
+    :param date: Date to use as a filter
+    :param page_size: Number of pages to request in each call, up to 100
+    :param limit: Maximum number of pages to return, None for no limit
+    :return: Asynchronous iterator over dictionaries for the Notion pages
+    """
+    return iter_pages(pages_after_query(date), page_size, limit)
+
+
+async def get_day_index(first_day: date, last_day: date) -> DayIndex:
+    """
+    Return an index of the events taking place in a window of days, read from the
+    event store when it is synced. Otherwise only that window is fetched from
+    Notion, and served from the cache when possible.
+    :param first_day: First day of the window
+    :param last_day: Last day of the window, inclusive
+    :return: DayIndex with the events in the window
+    """
+    # Events that began before the window but last into it are included
+    events = await _read_store(
+        lambda: read_model.events_between(first_day - MAX_EVENT_SPAN, last_day)
+    )
+    if events is not _NOT_STORED:
+        return DayIndex(events, first_day, last_day)
+
+    async def load():
+        pages = iter_pages(pages_between_query(first_day, last_day))
+        events = [NotionEvent.from_page(page) async for page in pages]
+        return DayIndex(events, first_day, last_day)
+
+    return await cache.get_or_load(
+        ("day_index", first_day.isoformat(), last_day.isoformat()), load
+    )
+
+
+async def get_events_after(
+    date: datetime, page_size: int = MAX_PAGE_SIZE
+) -> AsyncIterator[NotionEvent]:
+    """
+    Stream the Notion events with a date after the provided one, fetching further
+    pages from Notion only as they are consumed
+    :param date: Date to use as a filter
+    :param page_size: Number of pages to request in each call, up to 100
+    :return: Asynchronous iterator over NotionEvent objects
+    """
+    async for page in iter_pages_after(date, page_size):
+        yield NotionEvent.from_page(page)
+
+
+async def get_next_event_after(date: datetime) -> Optional[NotionEvent]:
+    """
+    Return the first Notion event with a date after the provided one
+    :param date: Date to use as a filter
+    :return: NotionEvent object, or None if there are no events after the date
+    """
+    async with aclosing(iter_pages_after(date, limit=1)) as pages:
+        async for page in pages:
+            return NotionEvent.from_page(page)
+    return None
+
+
+async def get_next_event() -> Optional[NotionEvent]:
+    """
+    Return the first Notion event with a date after the current one, read from the
+    event store when it is synced. Otherwise the result is cached, so it can lag
+    behind the current time by up to the cache TTL plus the stale window.
+    :return: NotionEvent object, or None if there are no upcoming events
+    """
+    event = await _read_store(lambda: read_model.next_event_after(datetime.now(UTC)))
+    if event is not _NOT_STORED:
+        return event
+
+    return await cache.get_or_load(
+        ("next_event",), lambda: get_next_event_after(datetime.now(UTC))
+    )
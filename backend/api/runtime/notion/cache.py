@@ -0,0 +1,156 @@
+"""
+In-process cache for Notion query results, kept alive across warm invocations
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Set, Tuple
+
+from .singleflight import AsyncSingleFlight
+
+
+class _Entry:
+    """Cached value together with the moment it was loaded"""
+
+    __slots__ = ("value", "loaded_at")
+
+    def __init__(self, value: Any, loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+
+
+class StaleWhileRevalidateCache:
+    """
+    Size-bounded LRU cache with stale-while-revalidate semantics.
+
+    Entries younger than ``ttl`` are served directly. Entries older than ``ttl``
+    but younger than ``ttl + stale_ttl`` are served immediately while a refresh
+    task is started on the running event loop. Older entries are loaded before
+    returning, and concurrent loads of the same key share a single call to the
+    loader.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes a new StaleWhileRevalidateCache
+        :param ttl: Seconds during which an entry is considered fresh
+        :param stale_ttl: Seconds after ``ttl`` during which a stale entry can still
+                          be served while it is refreshed
+        :param max_entries: Maximum number of entries kept, least recently used
+                            entries are evicted first
+        :param clock: Function returning the current time in seconds
+        """
+        if max_entries < 1:
+            raise ValueError("Cache must be able to hold at least one entry")
+
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._refreshing: set = set()
+        # The event loop only keeps weak references to tasks, so background
+        # refreshes are referenced here until they finish
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._loads = AsyncSingleFlight()
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached value for a key, loading it if necessary
+        :param key: Key identifying the cached value
+        :param loader: Coroutine function that produces the value from the source
+        :return: The cached or freshly loaded value
+        """
+        if self.ttl <= 0:
+            return await loader()
+
+        entry, refresh = self._lookup(key)
+        if refresh:
+            task = asyncio.get_running_loop().create_task(self._refresh(key, loader))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        if entry:
+            return entry.value
+
+        return await self._loads.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        self.put(key, value)
+        return value
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[_Entry], bool]:
+        """
+        Find the entry that can be served for a key
+        :param key: Key identifying the cached value
+        :return: Tuple with the servable entry, or None if it must be loaded, and
+                 whether a background refresh must be started for it
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None, False
+
+            self._entries.move_to_end(key)
+            age = now - entry.loaded_at
+            if age < self.ttl:
+                return entry, False
+            if age < self.ttl + self.stale_ttl:
+                refresh = key not in self._refreshing
+                self._refreshing.add(key)
+                return entry, refresh
+            return None, False
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Store a value in the cache, evicting the least recently used entries if
+        the cache is full
+        :param key: Key identifying the value
+        :param value: Value to store
+        """
+        with self._lock:
+            self._entries[key] = _Entry(value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Remove an entry from the cache, or every entry if no key is provided
+        :param key: Key of the entry to remove
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    async def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        """
+        Reload a stale entry. Errors are logged and the stale value is kept, so
+        that it is loaded again before being served once it fully expires.
+        :param key: Key of the entry to refresh
+        :param loader: Coroutine function that produces the value from the source
+        """
+        try:
+            self.put(key, await loader())
+        except Exception as e:
+            print(f"Background refresh of {key} failed: {e!r}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def __len__(self):
+        return len(self._entries)
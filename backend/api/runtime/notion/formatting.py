@@ -0,0 +1,160 @@
+"""
+Locale-independent formatting of dates for user-facing messages.
+
+Each language is described by a DateFormatter with precomputed weekday and month
+names, so formatting neither depends on the locales installed in the runtime nor
+touches the process-wide locale settings.
+"""
+
+import os
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+# Language used when none is requested explicitly
+DEFAULT_LANGUAGE = os.environ.get("DateLanguage", "es")
+
+# Number of distinct days whose description is memoized by each formatter
+DESCRIPTION_CACHE_SIZE = 1024
+
+
+class DateFormatter:
+    """Formats dates and date ranges in a specific language"""
+
+    def __init__(
+        self,
+        weekday_names: Sequence[str],
+        month_names: Sequence[str],
+        date_template: str,
+        single_template: str,
+        range_template: str,
+    ):
+        """
+        Initializes a new DateFormatter
+        :param weekday_names: Names of the days of the week, starting on Monday
+        :param month_names: Names of the months, starting on January
+        :param date_template: Template for the description of a date, with the
+                              weekday, day and month fields
+        :param single_template: Template for a single date, with the date field
+        :param range_template: Template for a range of dates, with the start and
+                               end fields
+        """
+        if len(weekday_names) != 7:
+            raise ValueError("There must be exactly 7 weekday names")
+        if len(month_names) != 12:
+            raise ValueError("There must be exactly 12 month names")
+
+        self.weekday_names = tuple(weekday_names)
+        self.month_names = tuple(month_names)
+        self.date_template = date_template
+        self.single_template = single_template
+        self.range_template = range_template
+        self._describe_day = lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)(
+            self._build_description
+        )
+
+    def get_weekday_name(self, day: int) -> str:
+        """
+        Return the name of a weekday
+        :param day: Number of the day of the week, from 0 to 6 (inclusive)
+        :return: String with the weekday name
+        """
+        if not 0 <= day < 7:
+            raise ValueError("Weekday must be 0 <= n < 7")
+        return self.weekday_names[day]
+
+    def get_month_name(self, month: int) -> str:
+        """
+        Return the name of a month
+        :param month: Number of the month, from 1 to 12 (inclusive)
+        :return: String with the month name
+        """
+        if not 1 <= month < 13:
+            raise ValueError("Month must be 1 <= n < 13")
+        return self.month_names[month - 1]
+
+    def _build_description(self, day: date) -> str:
+        return self.date_template.format(
+            weekday=self.weekday_names[day.weekday()],
+            day=day.day,
+            month=self.month_names[day.month - 1],
+        )
+
+    def describe(self, value: date) -> str:
+        """
+        Return a text description of a date. Descriptions only depend on the day,
+        so they are memoized per day.
+        :param value: Date or datetime object for the date to describe
+        :return: String with the date description
+        """
+        if isinstance(value, datetime):
+            value = value.date()
+        return self._describe_day(value)
+
+    def format_range(self, start: date, end: Optional[date]) -> str:
+        """
+        Return a text description of a single date or a range of dates
+        :param start: Date in which the range begins
+        :param end: Date in which the range ends, None for a single date
+        :return: String with the description
+        """
+        if not end:
+            return self.single_template.format(date=self.describe(start))
+        return self.range_template.format(
+            start=self.describe(start), end=self.describe(end)
+        )
+
+
+SPANISH = DateFormatter(
+    weekday_names=(
+        "lunes",
+        "martes",
+        "miércoles",
+        "jueves",
+        "viernes",
+        "sábado",
+        "domingo",
+    ),
+    month_names=(
+        "enero",
+        "febrero",
+        "marzo",
+        "abril",
+        "mayo",
+        "junio",
+        "julio",
+        "agosto",
+        "septiembre",
+        "octubre",
+        "noviembre",
+        "diciembre",
+    ),
+    date_template="{weekday} {day} de {month}",
+    single_template="El {date}",
+    range_template="Del {start} al {end}",
+)
+
+_formatters: Dict[str, DateFormatter] = {"es": SPANISH}
+
+
+def register_formatter(language: str, formatter: DateFormatter):
+    """
+    Make a formatter available for a language
+    :param language: Code of the language, such as "es"
+    :param formatter: Formatter for the language
+    """
+    _formatters[language] = formatter
+
+
+def get_formatter(language: Optional[str] = None) -> DateFormatter:
+    """
+    Return the formatter for a language
+    :param language: Code of the language, None for the default one
+    :return: DateFormatter for the language
+    :raises ValueError if no formatter is registered for the language
+    """
+    language = language or DEFAULT_LANGUAGE
+    try:
+        return _formatters[language]
+    except KeyError:
+        raise ValueError(f"No date formatter registered for language '{language}'")
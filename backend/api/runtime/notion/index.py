@@ -0,0 +1,65 @@
+"""
+In-memory indexes over Notion events
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .model import NotionEvent
+
+
+class DayIndex:
+    """
+    Index of events by the days they take place on. Events spanning several days
+    are indexed under each one of them.
+    """
+
+    def __init__(
+        self,
+        events: Iterable[NotionEvent],
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None,
+    ):
+        """
+        Initializes a new DayIndex
+        :param events: Events to index
+        :param first_day: First day to index, earlier days of an event are ignored
+        :param last_day: Last day to index, later days of an event are ignored
+        """
+        self.first_day = first_day
+        self.last_day = last_day
+        self._events_by_day: Dict[date, List[NotionEvent]] = {}
+
+        for event in events:
+            start = event.date.start.date()
+            end = event.date.end.date() if event.date.end else start
+            if first_day and start < first_day:
+                start = first_day
+            if last_day and end > last_day:
+                end = last_day
+
+            day = start
+            while day <= end:
+                self._events_by_day.setdefault(day, []).append(event)
+                day += timedelta(days=1)
+
+    def events_on(self, day: date) -> List[NotionEvent]:
+        """
+        Return the events that take place on a day
+        :param day: Day to look up
+        :return: List with the events, in the order they were indexed
+        """
+        return self._events_by_day.get(day, [])
+
+    def days(self) -> List[date]:
+        """
+        Return the days that have at least one event
+        :return: Sorted list with the days
+        """
+        return sorted(self._events_by_day)
+
+    def __iter__(self) -> Iterator[date]:
+        return iter(self.days())
+
+    def __len__(self):
+        return len(self._events_by_day)
@@ -3,18 +3,20 @@ Classes for the data stored in Notion
 """
 
 from datetime import datetime
-from typing import Any, Optional, List
-import calendar
-import locale
+from typing import Any, Optional, Sequence, Tuple
 
-DD_MM_YY_FORMAT = "%d/%m/%y"
+import metrics
+from .formatting import get_formatter
+from .schema import event_schema
 
-locale.setlocale(locale.LC_ALL, "es_ES.UTF8")
+DD_MM_YY_FORMAT = "%d/%m/%y"
 
 
 class DateRange:
     """Class representing a period of time between two dates, or a single date."""
 
+    __slots__ = ("start", "end")
+
     def __init__(self, start: datetime, end: Optional[datetime]):
         """
         Initializes a new DateRange
@@ -32,55 +34,48 @@ class DateRange:
     @staticmethod
     def get_weekday_name(day: int) -> str:
         """
-        Return the name of a weekday in the configured locale
+        Return the name of a weekday in the default language
         :param day: Number of the day of the week, from 0 to 6 (inclusive)
         :return: String with the weekday name
         """
-        try:
-            return calendar.day_name[day]
-        except KeyError:
-            raise ValueError("Weekday must be 0 <= n < 7")
+        return get_formatter().get_weekday_name(day)
 
     @staticmethod
     def get_month_name(month: int) -> str:
         """
-        Return the name of a month in the configured locale
+        Return the name of a month in the default language
         :param month: Number of the month, from 1 to 12 (inclusive)
         :return: String with the month name
         """
-        try:
-            return calendar.month_name[month]
-        except KeyError:
-            raise ValueError("Month must be 1 <= n < 13")
+        return get_formatter().get_month_name(month)
 
     def get_date_description(self, date: datetime):
         """
-        Return a text description of a date in the configured locale
+        Return a text description of a date in the default language
         :param date: Datetime object for the date to describe
         :return: String with the date description
         """
-        return (
-            f"{self.get_weekday_name(date.weekday())} {date.day} "
-            f"de {self.get_month_name(date.month)}"
-        )
+        return get_formatter().describe(date)
+
+    def format(self, language: Optional[str] = None) -> str:
+        """
+        Returns a user-friendly representation for the DateRange
+        :param language: Code of the language to use, None for the default one
+        :return: String with the representation
+        """
+        return get_formatter(language).format_range(self.start, self.end)
 
     def __str__(self):
         """
-        Returns a user-friendly representation for the DateRange in the configured
-        locale
+        Returns a user-friendly representation for the DateRange in the default
+        language
         :return: String with the representation
         """
-        if not self.end:
-            return f"El {self.get_date_description(self.start)}"
-        return (
-            f"Del {self.get_date_description(self.start)} "
-            f"al {self.get_date_description(self.end)}"
-        )
+        return self.format()
 
     def __repr__(self):
         """
-        Returns a dev-friendly representation for the DateRange in the configured
-        locale
+        Returns a dev-friendly representation for the DateRange
         :return: String with the representation
         """
         if not self.end:
@@ -94,15 +89,29 @@ class DateRange:
 class NotionEvent:
     """Class representing a calendar event retrieved from Notion"""
 
+    __slots__ = (
+        "title",
+        "date",
+        "type",
+        "location",
+        "scouters",
+        "participant_num",
+        "url",
+        "id",
+        "last_edited_time",
+    )
+
     def __init__(
         self,
         title: str,
         date: DateRange,
         event_type: str,
         location: str,
-        scouters: List[str],
+        scouters: Sequence[str],
         participant_num: int,
         url: str,
+        event_id: Optional[str] = None,
+        last_edited_time: Optional[str] = None,
     ):
         """
         Initializes a new NotionEvent instance
@@ -110,17 +119,21 @@ class NotionEvent:
         :param date: Date for the event
         :param event_type: Type for the event
         :param location: Location for the event
-        :param scouters: List with the names of the attending scouters
+        :param scouters: Names of the attending scouters
         :param participant_num: Number of non-scouter participants
         :param url: URL for the event in Notion
+        :param event_id: Identifier of the event page in Notion
+        :param last_edited_time: ISO timestamp of the last edit of the page in Notion
         """
         self.title = title
         self.date = date
         self.type = event_type
         self.location = location
-        self.scouters = scouters
+        self.scouters: Tuple[str, ...] = tuple(scouters)
         self.participant_num = participant_num
         self.url = url
+        self.id = event_id
+        self.last_edited_time = last_edited_time
 
     @classmethod
     def from_page(cls, page: Any):
@@ -128,36 +141,18 @@ class NotionEvent:
         Initializes a new NotionEvent instance from a Notion page
         :param page: Dictionary with the Notion page data
         """
-        properties = page["properties"]
-
-        title = properties["Name"]["title"][0]["plain_text"]
-
-        try:
-            location = properties["Lugar"]["rich_text"][0]["plain_text"]
-        except IndexError:
-            location = ""
-
-        date_begin = properties["Fecha"]["date"]["start"]
-        date_end = properties["Fecha"]["date"]["end"]
-
-        date_begin_parsed = datetime.fromisoformat(date_begin)
-        date_end_parsed = datetime.fromisoformat(date_end) if date_end else None
-
-        date_range = DateRange(date_begin_parsed, date_end_parsed)
-
-        event_type = properties["Tipo"]["select"]["name"]
-
-        scouters = [
-            scouter["name"]
-            for scouter in properties["Scouters asistentes"]["multi_select"]
-        ]
-
-        participant_num = len(properties["Educandos asistentes"]["relation"])
-
-        url = page["url"]
+        with metrics.span(metrics.PAGE_PARSE):
+            return cls._from_page(page)
 
+    @classmethod
+    def _from_page(cls, page: Any):
+        fields = event_schema.parse(page["properties"])
+        fields["date"] = DateRange(*fields["date"])
         return cls(
-            title, date_range, event_type, location, scouters, participant_num, url
+            **fields,
+            url=page["url"],
+            event_id=page.get("id"),
+            last_edited_time=page.get("last_edited_time"),
         )
 
     def __repr__(self):
@@ -0,0 +1,179 @@
+"""
+Mapping between the fields of an event and the properties of the calendar
+database in Notion.
+
+The mapping declares which properties an event is built from, so that queries
+only request those, and the parser of the pages is generated from it too. The
+names of the properties can be overridden with the NotionPropertyNames
+environment variable, a JSON object such as {"location": "Sitio"}.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Seconds before resolving the property identifiers is attempted again after a
+# failure, every property is requested in the meantime
+RESOLVE_RETRY_INTERVAL = 300
+
+
+def _plain_text(value: Any) -> str:
+    return "".join(part["plain_text"] for part in value)
+
+
+def _dates(value: Any) -> Tuple[datetime, Optional[datetime]]:
+    end = value["end"]
+    return (
+        datetime.fromisoformat(value["start"]),
+        datetime.fromisoformat(end) if end else None,
+    )
+
+
+def _select(value: Any) -> str:
+    return value["name"] if value else ""
+
+
+def _multi_select(value: Any) -> Tuple[str, ...]:
+    return tuple(option["name"] for option in value)
+
+
+# Function turning the value of each type of property into that of a field
+PARSERS: Dict[str, Callable[[Any], Any]] = {
+    "title": _plain_text,
+    "rich_text": _plain_text,
+    # Start and end, turned into a DateRange by the model
+    "date": _dates,
+    "select": _select,
+    "multi_select": _multi_select,
+    # Only the number of related pages is used
+    "relation": len,
+}
+
+
+class PropertyMapping:
+    """Property of the database a field is read from"""
+
+    __slots__ = ("field", "name", "type")
+
+    def __init__(self, field: str, name: str, type_: str):
+        """
+        Initializes a new PropertyMapping
+        :param field: Name of the field, as a keyword argument of NotionEvent
+        :param name: Name of the property in the database
+        :param type_: Type of the property in the database, one of PARSERS
+        """
+        if type_ not in PARSERS:
+            raise ValueError(f"Properties of type {type_} are not supported")
+        self.field = field
+        self.name = name
+        self.type = type_
+
+
+class EventSchema:
+    """Properties an event is built from, and the parser generated from them"""
+
+    def __init__(self, mappings: List[PropertyMapping]):
+        """
+        Initializes a new EventSchema
+        :param mappings: Property each field of an event is read from
+        """
+        self.mappings = mappings
+        self._by_field = {mapping.field: mapping for mapping in mappings}
+        # The parser only looks each property up once, in a precomputed order
+        self._parsers = [
+            (mapping.field, mapping.name, mapping.type, PARSERS[mapping.type])
+            for mapping in mappings
+        ]
+        # Identifiers of the properties, known once resolved against the database
+        self.property_ids: Optional[List[str]] = None
+        self._failed_at: Optional[float] = None
+
+    def property_name(self, field: str) -> str:
+        """
+        Return the name of the property a field is read from, for use in filters
+        :param field: Name of the field
+        :return: Name of the property in the database
+        """
+        return self._by_field[field].name
+
+    def parse(self, properties: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Read the fields of an event from the properties of a page
+        :param properties: Properties of the page, by name
+        :return: Dictionary with the value of each field
+        """
+        return {
+            field: parse(properties[name][type_])
+            for field, name, type_, parse in self._parsers
+        }
+
+    def should_resolve(self) -> bool:
+        """
+        Check whether the property identifiers must be resolved before a query
+        :return: True if they are unknown, and no attempt has failed recently
+        """
+        return self.property_ids is None and (
+            self._failed_at is None
+            or time.monotonic() - self._failed_at >= RESOLVE_RETRY_INTERVAL
+        )
+
+    def resolve_failed(self):
+        """
+        Record a failed attempt to retrieve the schema of the database
+        """
+        self._failed_at = time.monotonic()
+
+    def resolve(self, database: Dict[str, Any]) -> List[str]:
+        """
+        Find the identifiers of the mapped properties in the schema of the
+        database, which are what queries use to request only those properties
+        :param database: Database object returned by the Notion API
+        :return: List with the identifiers of the properties
+        :raises ValueError if a property is missing or has a different type
+        """
+        ids = []
+        for mapping in self.mappings:
+            prop = database["properties"].get(mapping.name)
+            if prop is None:
+                raise ValueError(f"The database has no property {mapping.name}")
+            if prop["type"] != mapping.type:
+                raise ValueError(
+                    f"Property {mapping.name} is of type {prop['type']}, "
+                    f"not {mapping.type}"
+                )
+            ids.append(prop["id"])
+        self.property_ids = ids
+        return ids
+
+
+# Property each field of an event is read from by default
+DEFAULT_MAPPINGS = [
+    PropertyMapping("title", "Name", "title"),
+    PropertyMapping("date", "Fecha", "date"),
+    PropertyMapping("event_type", "Tipo", "select"),
+    PropertyMapping("location", "Lugar", "rich_text"),
+    PropertyMapping("scouters", "Scouters asistentes", "multi_select"),
+    PropertyMapping("participant_num", "Educandos asistentes", "relation"),
+]
+
+
+def load_schema() -> EventSchema:
+    """
+    Build the schema of the events, applying the property names overridden in the
+    environment
+    :return: EventSchema instance
+    """
+    names = json.loads(os.environ.get("NotionPropertyNames", "{}"))
+    return EventSchema(
+        [
+            PropertyMapping(
+                mapping.field, names.get(mapping.field, mapping.name), mapping.type
+            )
+            for mapping in DEFAULT_MAPPINGS
+        ]
+    )
+
+
+event_schema = load_schema()
@@ -0,0 +1,257 @@
+"""
+Prefix search over the upcoming Notion events, answered from memory.
+
+The index is built from the calendar once, and then kept up to date in the
+background with queries for the pages edited since the last refresh, so that no
+search has to wait for Notion. Until the index is built, searches are answered
+from the event store when it is synced.
+
+Background tasks only survive the invocation that starts them with a persistent
+runtime. Otherwise searches are answered from the event store, and without one
+the index is built and refreshed before answering. The index of the stored
+events is kept until the store is synced again.
+"""
+
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from datetime import date, datetime, timedelta, UTC
+from typing import Dict, List, Optional, Set, Tuple
+
+import config
+from .api import edited_since_query, pages_after_query
+from .async_api import get_store_synced_at, get_stored_events_from, iter_pages
+from .model import NotionEvent
+
+# Seconds after which the pages edited since the last refresh are fetched again
+REFRESH_INTERVAL = float(os.environ.get("SearchRefreshInterval", "60"))
+# Seconds after which the index is rebuilt from scratch, dropping deleted events
+REBUILD_INTERVAL = float(os.environ.get("SearchRebuildInterval", "3600"))
+
+# Longest prefix indexed for each token
+MAX_PREFIX_LENGTH = 20
+
+_TOKEN_SEPARATOR = re.compile(r"[^\w]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase tokens without accents, so that "campá" matches
+    "Campamento"
+    :param text: Text to split
+    :return: List with the tokens
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return [token for token in _TOKEN_SEPARATOR.split(stripped) if token]
+
+
+class PrefixIndex:
+    """Index of events by the prefixes of the words in their title, location and type"""
+
+    def __init__(self):
+        self._events: Dict[str, NotionEvent] = {}
+        self._prefixes: Dict[str, Set[str]] = {}
+        self._event_prefixes: Dict[str, Set[str]] = {}
+
+    def upsert(self, event: NotionEvent):
+        """
+        Add an event to the index, replacing its previous version if present
+        :param event: Event to index, it must have an identifier
+        """
+        self.remove(event.id)
+
+        prefixes = set()
+        for token in tokenize(f"{event.title} {event.location} {event.type}"):
+            for length in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                prefixes.add(token[:length])
+
+        for prefix in prefixes:
+            self._prefixes.setdefault(prefix, set()).add(event.id)
+        self._event_prefixes[event.id] = prefixes
+        self._events[event.id] = event
+
+    def remove(self, event_id: str):
+        """
+        Remove an event from the index, if present
+        :param event_id: Identifier of the event
+        """
+        for prefix in self._event_prefixes.pop(event_id, ()):
+            ids = self._prefixes[prefix]
+            ids.discard(event_id)
+            if not ids:
+                del self._prefixes[prefix]
+        self._events.pop(event_id, None)
+
+    def search(
+        self, query: str, limit: int, after: Optional[datetime] = None
+    ) -> List[NotionEvent]:
+        """
+        Return the events with a word starting with each word of the query
+        :param query: Text typed by the user, an empty one matches every event
+        :param limit: Maximum number of events to return
+        :param after: Only return events that have not finished by this date
+        :return: List with the matching events, sorted by date
+        """
+        tokens = [token[:MAX_PREFIX_LENGTH] for token in tokenize(query)]
+        if tokens:
+            matches = set.intersection(
+                *(self._prefixes.get(token, set()) for token in tokens)
+            )
+            events = [self._events[event_id] for event_id in matches]
+        else:
+            events = list(self._events.values())
+
+        if after:
+            events = [event for event in events if not _finished_before(event, after)]
+        events.sort(key=lambda event: _sort_key(event.date.start))
+        return events[:limit]
+
+    def __len__(self):
+        return len(self._events)
+
+
+def _sort_key(date: datetime) -> datetime:
+    """
+    Make dates with and without time zone comparable, the latter being treated
+    as UTC
+    """
+    return date if date.tzinfo else date.replace(tzinfo=UTC)
+
+
+def _finished_before(event: NotionEvent, date: datetime) -> bool:
+    end = event.date.end or event.date.start
+    # Events without time last the whole day
+    if not end.tzinfo and end.time() == datetime.min.time():
+        end += timedelta(days=1)
+    return _sort_key(end) < date
+
+
+class EventSearch:
+    """Prefix index over the upcoming events, refreshed incrementally"""
+
+    def __init__(self, background_updates: bool):
+        """
+        Initializes a new EventSearch
+        :param background_updates: Whether the index is built and refreshed in
+                                   background tasks, which requires an event loop
+                                   that outlives each invocation
+        """
+        self.background_updates = background_updates
+        self.index = PrefixIndex()
+        self._built_at: Optional[float] = None
+        self._refreshed_at: Optional[float] = None
+        self._watermark: Optional[datetime] = None
+        self._update_task: Optional[asyncio.Task] = None
+        # Index of the stored events, with the sync and first day it was built for
+        self._stored_index: Optional[PrefixIndex] = None
+        self._stored_version: Optional[Tuple[datetime, date]] = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the index has been built
+        """
+        return self._built_at is not None
+
+    async def _rebuild(self):
+        """
+        Build a new index with every upcoming event
+        """
+        started = datetime.now(UTC)
+        index = PrefixIndex()
+        async for page in iter_pages(pages_after_query(started - timedelta(days=1))):
+            index.upsert(NotionEvent.from_page(page))
+
+        self.index = index
+        self._watermark = started
+        self._built_at = self._refreshed_at = time.monotonic()
+
+    async def _refresh(self):
+        """
+        Update the index with the events edited since the last refresh
+        """
+        started = datetime.now(UTC)
+        query = edited_since_query(self._watermark, started - timedelta(days=1))
+        async for page in iter_pages(query):
+            self.index.upsert(NotionEvent.from_page(page))
+
+        self._watermark = started
+        self._refreshed_at = time.monotonic()
+
+    def _update_due(self) -> bool:
+        return (
+            self._built_at is None
+            or time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL
+        )
+
+    async def _update(self):
+        try:
+            if (
+                self._built_at is None
+                or time.monotonic() - self._built_at >= REBUILD_INTERVAL
+            ):
+                await self._rebuild()
+            else:
+                await self._refresh()
+        except Exception as e:
+            print(f"Search index update failed: {e!r}")
+
+    def _start_update(self):
+        if self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.get_running_loop().create_task(self._update())
+
+    async def _get_stored_index(self, first_day: date) -> Optional[PrefixIndex]:
+        """
+        Return an index of the stored events, which is only built again once the
+        store has been synced since the last one
+        :param first_day: First day to index events for
+        :return: PrefixIndex instance, None if the store is not synced
+        """
+        synced_at = await get_store_synced_at()
+        if synced_at is None:
+            return None
+        version = (synced_at, first_day)
+        if version != self._stored_version:
+            stored = await get_stored_events_from(first_day)
+            if stored is None:
+                return None
+            index = PrefixIndex()
+            for event in stored:
+                index.upsert(event)
+            self._stored_index, self._stored_version = index, version
+        return self._stored_index
+
+    async def search(self, query: str, limit: int) -> Optional[List[NotionEvent]]:
+        """
+        Search the upcoming events, without waiting for Notion when the index is
+        updated in the background. Until the index is built, the events are read
+        from the event store.
+        :param query: Text typed by the user
+        :param limit: Maximum number of events to return
+        :return: List with the matching events, sorted by date, None if the index
+                 is still being built and the event store is not synced
+        """
+        now = datetime.now(UTC)
+        if self.background_updates:
+            if self._update_due():
+                self._start_update()
+            if self.ready:
+                return self.index.search(query, limit, after=now)
+
+        stored_index = await self._get_stored_index((now - timedelta(days=1)).date())
+        if stored_index is not None:
+            return stored_index.search(query, limit, after=now)
+        if self.background_updates:
+            return None
+
+        # The event loop is closed after each invocation, so the index is updated
+        # before answering instead
+        if self._update_due():
+            await self._update()
+        return self.index.search(query, limit, after=now)
+
+
+event_search = EventSearch(background_updates=config.PERSISTENT_RUNTIME)
@@ -0,0 +1,88 @@
+"""
+Coalescing of identical concurrent calls, so that callers asking for the same
+thing while a call is in flight share its result instead of repeating it
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """Call in flight, and its outcome once finished"""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical calls made concurrently from several threads"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Call a function, unless a call with the same key is already in flight, in
+        which case its result is awaited and returned instead
+        :param key: Key identifying the call
+        :param func: Function to call
+        :return: Result of the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Coalesces identical calls made concurrently from the same event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await a coroutine function, unless a call with the same key is already in
+        flight, in which case its result is awaited and returned instead
+        :param key: Key identifying the call
+        :param func: Coroutine function to call
+        :return: Result of the call
+        """
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        # Tasks from an event loop that has been discarded cannot be awaited
+        if task is None or task.get_loop() is not loop:
+            task = self._calls[key] = loop.create_task(func())
+
+            def forget(finished: asyncio.Task):
+                if self._calls.get(key) is finished:
+                    del self._calls[key]
+
+            task.add_done_callback(forget)
+
+        # A caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
@@ -0,0 +1,501 @@
+"""
+Read model of the calendar, kept up to date by the sync job in calendar_sync.py.
+
+Events are stored as compact JSON records, keyed by the day they start on, so
+that the handlers can look up a window of days without querying Notion. The store
+is a SQLite file for local runs, and a DynamoDB table when deployed. The moment
+of the last sync is stored too, so that readers fall back to Notion when the
+store is empty or has not been synced for too long.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, UTC
+from typing import Callable, Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+import config
+import transport
+from .model import DateRange, NotionEvent
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# Name of the DynamoDB table with the events, when deployed
+EVENT_STORE_TABLE_NAME = os.environ.get("EventStoreTableName")
+# Path of the SQLite file with the events, for local runs
+EVENT_STORE_PATH = os.environ.get("EventStorePath")
+# Seconds after the last sync during which the store is read instead of Notion
+EVENT_STORE_MAX_AGE = timedelta(
+    seconds=float(os.environ.get("EventStoreMaxAge", "3600"))
+)
+# Seconds the moment of the last sync is remembered by each reader
+SYNC_CHECK_INTERVAL = 30
+
+# Names of the stored sync state values
+WATERMARK = "watermark"
+REBUILT_AT = "rebuilt_at"
+
+# Largest number of items in a DynamoDB batch write
+_BATCH_SIZE = 25
+# Sorts after every character used in the start keys
+_KEY_END = "~"
+
+
+def start_key(event: NotionEvent) -> str:
+    """
+    Return the key events are sorted and looked up by: the day the event starts,
+    followed by its start time in UTC. Dates without time zone are interpreted in
+    the time zone of the calendar.
+    :param event: Event to return the key for
+    :return: String key, sorting in chronological order
+    """
+    start = event.date.start
+    aware = start if start.tzinfo else start.replace(tzinfo=config.TIME_ZONE)
+    return f"{start.date().isoformat()}#{aware.astimezone(UTC).isoformat()}"
+
+
+def event_to_record(event: NotionEvent) -> str:
+    """
+    Serialize an event as a compact JSON record
+    :param event: Event to serialize
+    :return: String with the record
+    """
+    return json.dumps(
+        {
+            "title": event.title,
+            "start": event.date.start.isoformat(),
+            "end": event.date.end.isoformat() if event.date.end else None,
+            "type": event.type,
+            "location": event.location,
+            "scouters": event.scouters,
+            "participants": event.participant_num,
+            "url": event.url,
+            "id": event.id,
+            "edited": event.last_edited_time,
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def event_from_record(record: str) -> NotionEvent:
+    """
+    Deserialize an event stored with event_to_record
+    :param record: String with the record
+    :return: NotionEvent instance
+    """
+    data = json.loads(record)
+    return NotionEvent(
+        data["title"],
+        DateRange(
+            datetime.fromisoformat(data["start"]),
+            datetime.fromisoformat(data["end"]) if data["end"] else None,
+        ),
+        data["type"],
+        data["location"],
+        data["scouters"],
+        data["participants"],
+        data["url"],
+        data["id"],
+        data["edited"],
+    )
+
+
+class SQLiteEventStore:
+    """Store of events in a SQLite file, for local runs"""
+
+    def __init__(self, path: str):
+        """
+        Initializes a new SQLiteEventStore. The file is created when first used.
+        :param path: Path of the SQLite file
+        """
+        self.path = path
+        self._connection: Optional["sqlite3.Connection"] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> "sqlite3.Connection":
+        # sqlite3 is only imported by local runs that use the store
+        if self._connection is None:
+            import sqlite3
+
+            # Reads are made from worker threads, always under the lock
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    id TEXT PRIMARY KEY,
+                    start_key TEXT NOT NULL,
+                    record TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS events_by_start ON events (start_key);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+            self._connection = connection
+        return self._connection
+
+    def get_state(self, name: str) -> Optional[datetime]:
+        """
+        Return a stored moment of the sync state
+        :param name: Name of the value
+        :return: The moment, None if it was never stored
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute("SELECT value FROM sync_state WHERE name = ?", (name,))
+                .fetchone()
+            )
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def _set_state(self, connection: "sqlite3.Connection", name: str, value: datetime):
+        connection.execute(
+            "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+            (name, value.isoformat()),
+        )
+
+    def upsert(self, events: Iterable[NotionEvent], watermark: datetime):
+        """
+        Insert new events and replace changed ones, and advance the watermark in
+        the same transaction
+        :param events: Events to store, with their identifiers
+        :param watermark: Moment up to which the store holds every edit
+        """
+        rows = [
+            (event.id, start_key(event), event_to_record(event)) for event in events
+        ]
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO events (id, start_key, record) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._set_state(connection, WATERMARK, watermark)
+
+    def replace(self, events: Iterable[NotionEvent], watermark: datetime):
+        """
+        Replace every stored event, which drops those deleted from Notion
+        :param events: Every event to store, with their identifiers
+        :param watermark: Moment up to which the store holds every edit
+        """
+        rows = [
+            (event.id, start_key(event), event_to_record(event)) for event in events
+        ]
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM events")
+            connection.executemany(
+                "INSERT INTO events (id, start_key, record) VALUES (?, ?, ?)", rows
+            )
+            self._set_state(connection, WATERMARK, watermark)
+            self._set_state(connection, REBUILT_AT, watermark)
+
+    def events_between(self, first_day: date, last_day: date) -> List[NotionEvent]:
+        """
+        Return the events starting in a window of days
+        :param first_day: First day of the window
+        :param last_day: Last day of the window, inclusive
+        :return: List with the events, sorted by start
+        """
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT record FROM events WHERE start_key BETWEEN ? AND ? "
+                    "ORDER BY start_key",
+                    (first_day.isoformat(), last_day.isoformat() + _KEY_END),
+                )
+                .fetchall()
+            )
+        return [event_from_record(record) for record, in rows]
+
+    def iter_events_from(self, first_day: date) -> Iterator[NotionEvent]:
+        """
+        Lazily iterate over the events starting on a day or later
+        :param first_day: First day to return events for
+        :return: Iterator over the events, sorted by start
+        """
+        offset = 0
+        while True:
+            with self._lock:
+                rows = (
+                    self._connect()
+                    .execute(
+                        "SELECT record FROM events WHERE start_key >= ? "
+                        "ORDER BY start_key LIMIT ? OFFSET ?",
+                        (first_day.isoformat(), _BATCH_SIZE, offset),
+                    )
+                    .fetchall()
+                )
+            for (record,) in rows:
+                yield event_from_record(record)
+            if len(rows) < _BATCH_SIZE:
+                return
+            offset += len(rows)
+
+
+class DynamoDBEventStore:
+    """
+    Store of events in a DynamoDB table with Kind and Id as its keys, and a
+    ByStart index with Kind and StartKey as its keys
+    """
+
+    def __init__(self, table_name: str):
+        """
+        Initializes a new DynamoDBEventStore
+        :param table_name: Name of the table
+        """
+        self.table_name = table_name
+        self._client = None
+
+    def _get_client(self):
+        # boto3 is only imported when the store is first used
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("dynamodb", config=transport.aws_config())
+        return self._client
+
+    def get_state(self, name: str) -> Optional[datetime]:
+        """
+        Return a stored moment of the sync state
+        :param name: Name of the value
+        :return: The moment, None if it was never stored
+        """
+        item = (
+            self._get_client()
+            .get_item(
+                TableName=self.table_name,
+                Key={"Kind": {"S": "state"}, "Id": {"S": name}},
+            )
+            .get("Item")
+        )
+        return datetime.fromisoformat(item["Value"]["S"]) if item else None
+
+    def _set_state(self, name: str, value: datetime):
+        self._get_client().put_item(
+            TableName=self.table_name,
+            Item={
+                "Kind": {"S": "state"},
+                "Id": {"S": name},
+                "Value": {"S": value.isoformat()},
+            },
+        )
+
+    def _write(self, requests: List[dict]):
+        client = self._get_client()
+        for index in range(0, len(requests), _BATCH_SIZE):
+            pending = {self.table_name: requests[index : index + _BATCH_SIZE]}
+            attempt = 0
+            while pending:
+                if attempt:
+                    time.sleep(min(0.05 * 2**attempt, 1))
+                pending = client.batch_write_item(RequestItems=pending).get(
+                    "UnprocessedItems"
+                )
+                attempt += 1
+
+    def _stored_ids(self) -> Iterator[str]:
+        paginator = self._get_client().get_paginator("query")
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            KeyConditionExpression="Kind = :kind",
+            ExpressionAttributeValues={":kind": {"S": "event"}},
+            ProjectionExpression="Id",
+        ):
+            for item in page["Items"]:
+                yield item["Id"]["S"]
+
+    def _put_events(self, events: Iterable[NotionEvent]):
+        self._write(
+            [
+                {
+                    "PutRequest": {
+                        "Item": {
+                            "Kind": {"S": "event"},
+                            "Id": {"S": event.id},
+                            "StartKey": {"S": start_key(event)},
+                            "Record": {"S": event_to_record(event)},
+                        }
+                    }
+                }
+                for event in events
+            ]
+        )
+
+    def upsert(self, events: Iterable[NotionEvent], watermark: datetime):
+        """
+        Insert new events and replace changed ones, then advance the watermark
+        :param events: Events to store, with their identifiers
+        :param watermark: Moment up to which the store holds every edit
+        """
+        self._put_events(events)
+        # The watermark only advances once every event has been written
+        self._set_state(WATERMARK, watermark)
+
+    def replace(self, events: Iterable[NotionEvent], watermark: datetime):
+        """
+        Replace every stored event, which drops those deleted from Notion. The
+        table cannot be replaced atomically, so the events are written before the
+        stale ones are deleted, and readers never miss an event in between. The
+        sync state only advances once both are done, so a failed rebuild is
+        retried by the next sync.
+        :param events: Every event to store, with their identifiers
+        :param watermark: Moment up to which the store holds every edit
+        """
+        events = list(events)
+        self._put_events(events)
+        current_ids = {event.id for event in events}
+        self._write(
+            [
+                {"DeleteRequest": {"Key": {"Kind": {"S": "event"}, "Id": {"S": id_}}}}
+                for id_ in self._stored_ids()
+                if id_ not in current_ids
+            ]
+        )
+        self._set_state(REBUILT_AT, watermark)
+        # Readers check the watermark, so it is the last value written
+        self._set_state(WATERMARK, watermark)
+
+    def _query_records(self, condition: str, values: dict) -> Iterator[str]:
+        paginator = self._get_client().get_paginator("query")
+        for page in paginator.paginate(
+            TableName=self.table_name,
+            IndexName="ByStart",
+            KeyConditionExpression=f"Kind = :kind AND {condition}",
+            ExpressionAttributeValues={":kind": {"S": "event"}, **values},
+            PaginationConfig={"PageSize": _BATCH_SIZE},
+        ):
+            for item in page["Items"]:
+                yield item["Record"]["S"]
+
+    def events_between(self, first_day: date, last_day: date) -> List[NotionEvent]:
+        """
+        Return the events starting in a window of days
+        :param first_day: First day of the window
+        :param last_day: Last day of the window, inclusive
+        :return: List with the events, sorted by start
+        """
+        records = self._query_records(
+            "StartKey BETWEEN :first AND :last",
+            {
+                ":first": {"S": first_day.isoformat()},
+                ":last": {"S": last_day.isoformat() + _KEY_END},
+            },
+        )
+        return [event_from_record(record) for record in records]
+
+    def iter_events_from(self, first_day: date) -> Iterator[NotionEvent]:
+        """
+        Lazily iterate over the events starting on a day or later
+        :param first_day: First day to return events for
+        :return: Iterator over the events, sorted by start
+        """
+        records = self._query_records(
+            "StartKey >= :first", {":first": {"S": first_day.isoformat()}}
+        )
+        return (event_from_record(record) for record in records)
+
+
+class EventReadModel:
+    """
+    Read access to a store, only while it has been synced recently enough for its
+    events to be served instead of those in Notion
+    """
+
+    def __init__(
+        self,
+        store,
+        max_age: timedelta,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes a new EventReadModel
+        :param store: Store with the events, filled by the sync job
+        :param max_age: Time after the last sync during which the store is used
+        :param clock: Function returning the current time in seconds
+        """
+        self.store = store
+        self.max_age = max_age
+        self._clock = clock
+        self._watermark: Optional[datetime] = None
+        self._checked_at: Optional[float] = None
+
+    def is_fresh(self) -> bool:
+        """
+        Check whether the store has been synced recently. The moment of the last
+        sync is only read again every SYNC_CHECK_INTERVAL seconds, with a blocking
+        call to the store, so asynchronous code must call this from a worker
+        thread.
+        :return: True if the store can be read instead of Notion
+        """
+        now = self._clock()
+        if self._checked_at is None or now - self._checked_at >= SYNC_CHECK_INTERVAL:
+            self._watermark = self.store.get_state(WATERMARK)
+            self._checked_at = now
+        return (
+            self._watermark is not None
+            and datetime.now(UTC) - self._watermark <= self.max_age
+        )
+
+    @property
+    def synced_at(self) -> Optional[datetime]:
+        """
+        Moment of the last sync seen by the latest freshness check, which
+        identifies the version of the stored events
+        """
+        return self._watermark
+
+    def next_event_after(self, date: datetime) -> Optional[NotionEvent]:
+        """
+        Return the first event starting after a moment
+        :param date: Moment with time zone
+        :return: NotionEvent object, or None if there are no events after it
+        """
+        # Events are keyed by the day in their own time zone, which may be the
+        # previous one in UTC
+        for event in self.store.iter_events_from((date - timedelta(days=1)).date()):
+            start = event.date.start
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=config.TIME_ZONE)
+            if start > date:
+                return event
+        return None
+
+    def events_between(self, first_day: date, last_day: date) -> List[NotionEvent]:
+        """
+        Return the events starting in a window of days
+        :param first_day: First day of the window
+        :param last_day: Last day of the window, inclusive
+        :return: List with the events, sorted by start
+        """
+        return self.store.events_between(first_day, last_day)
+
+    def events_from(self, first_day: date) -> List[NotionEvent]:
+        """
+        Return the events starting on a day or later
+        :param first_day: First day to return events for
+        :return: List with the events, sorted by start
+        """
+        return list(self.store.iter_events_from(first_day))
+
+
+def open_event_store():
+    """
+    Open the store configured in the environment
+    :return: DynamoDBEventStore or SQLiteEventStore, None if none is configured
+    """
+    if EVENT_STORE_TABLE_NAME:
+        return DynamoDBEventStore(EVENT_STORE_TABLE_NAME)
+    if EVENT_STORE_PATH:
+        return SQLiteEventStore(EVENT_STORE_PATH)
+    return None
+
+
+_store = open_event_store()
+# Read model used by the handlers, None to always query Notion
+read_model = EventReadModel(_store, EVENT_STORE_MAX_AGE) if _store else None
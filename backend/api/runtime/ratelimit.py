@@ -0,0 +1,80 @@
+"""
+Token buckets used to stay within the rate limits of the Telegram API.
+"""
+
+import asyncio
+import time
+from typing import Callable
+
+
+class TokenBucket:
+    """
+    Bucket that holds up to `capacity` tokens and is refilled at `rate` tokens per
+    second. Each action takes a token, so bursts of up to `capacity` actions are
+    allowed while the sustained rate stays below `rate`.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes a new TokenBucket, which starts full
+        :param rate: Tokens added to the bucket per second
+        :param capacity: Maximum number of tokens in the bucket
+        :param clock: Function returning the current time in seconds
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("Rate and capacity must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Take tokens from the bucket if enough of them are available
+        :param tokens: Number of tokens to take
+        :return: True if the tokens were taken, False otherwise
+        """
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """
+        Return how long it will take for the bucket to hold enough tokens
+        :param tokens: Number of tokens needed
+        :return: Seconds to wait, 0 if they are already available
+        """
+        self._refill()
+        return max(tokens - self._tokens, 0) / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """
+        Wait until enough tokens are available, and take them
+        :param tokens: Number of tokens to take
+        """
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds: float):
+        """
+        Empty the bucket so that no tokens are available for the provided time,
+        such as when the API asks to retry after a while
+        :param seconds: Seconds to wait before the next token is available
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
@@ -0,0 +1,212 @@
+"""
+Scheduled reminders of the upcoming events, sent to every subscribed chat.
+
+Each run queries Notion once for the events starting in the following hours, and
+renders each reminder once, so the cost of a run barely grows with the number of
+chats. Reminders are then sent concurrently, within the global and per-chat rate
+limits of Telegram.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Sequence
+
+from telegram import Bot, LinkPreviewOptions
+from telegram.constants import ParseMode
+from telegram.error import Forbidden, RetryAfter
+
+import config
+import metrics
+import rendering
+import transport
+from notion import async_api
+from notion.api import pages_between_query
+from notion.model import NotionEvent
+from ratelimit import TokenBucket
+
+# Chats where reminders are sent, as a comma separated list of chat IDs
+REMINDER_CHATS = [
+    int(chat_id)
+    for chat_id in os.environ.get("ReminderChats", "").split(",")
+    if chat_id
+]
+# Hours ahead covered by each run, which should match the interval between runs
+REMINDER_HORIZON = timedelta(hours=float(os.environ.get("ReminderHorizonHours", "24")))
+
+# Telegram allows around 30 messages per second overall, and 20 per minute in a
+# group. Both limits are kept slightly below those values.
+GLOBAL_RATE = float(os.environ.get("ReminderGlobalRate", "25"))
+CHAT_RATE = float(os.environ.get("ReminderChatRatePerMinute", "18")) / 60
+# Attempts made to send each reminder when Telegram asks to retry later
+MAX_ATTEMPTS = 3
+
+
+@rendering.renderer("event_reminder")
+def render_event_reminder(event: NotionEvent) -> str:
+    """
+    Render the HTML reminder for an event
+    :param event: Event to remind of
+    :return: String with the HTML reminder
+    """
+    location_str = f"\n\N{pushpin} {event.location}" if event.location else ""
+    return (
+        f"\N{alarm clock} <b>Recordatorio</b>"
+        f"\n<a href='{event.url}'>{event.title}</a>"
+        f"\n\N{stopwatch} {event.date}"
+        f"{location_str}"
+    )
+
+
+def _aware(date: datetime) -> datetime:
+    """
+    Interpret dates without time zone, such as those of all-day events, in the
+    time zone of the calendar
+    """
+    return date if date.tzinfo else date.replace(tzinfo=config.TIME_ZONE)
+
+
+async def get_upcoming_reminders(now: datetime, horizon: timedelta) -> List[str]:
+    """
+    Render the reminders for the events starting within a time window, fetching
+    from Notion only the events starting on the days of the window
+    :param now: Start of the window
+    :param horizon: Length of the window
+    :return: List with the HTML reminders, sorted by event date
+    """
+    end = now + horizon
+    query = pages_between_query(
+        now.astimezone(config.TIME_ZONE).date(),
+        end.astimezone(config.TIME_ZONE).date(),
+        span=timedelta(0),
+    )
+    reminders = []
+    async for page in async_api.iter_pages(query):
+        event = NotionEvent.from_page(page)
+        if now <= _aware(event.date.start) < end:
+            reminders.append(rendering.render("event_reminder", event))
+    return reminders
+
+
+class BroadcastSender:
+    """
+    Sends messages to many chats concurrently, keeping within a global rate limit
+    and a rate limit for each chat, and waiting when Telegram asks to retry later
+    """
+
+    def __init__(
+        self, bot: Bot, global_rate: float, chat_rate: float, concurrency: int
+    ):
+        """
+        Initializes a new BroadcastSender
+        :param bot: Bot used to send the messages
+        :param global_rate: Maximum messages per second across every chat
+        :param chat_rate: Maximum messages per second to a single chat
+        :param concurrency: Maximum number of requests in flight
+        """
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _send(self, chat_id: int, text: str):
+        bucket = self._chat_buckets.setdefault(
+            chat_id, TokenBucket(self.chat_rate, capacity=1)
+        )
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            try:
+                async with self._semaphore:
+                    with metrics.span(metrics.TELEGRAM_SEND):
+                        await self.bot.send_message(
+                            chat_id,
+                            text,
+                            parse_mode=ParseMode.HTML,
+                            link_preview_options=LinkPreviewOptions(is_disabled=True),
+                        )
+                return
+            except RetryAfter as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                print(f"Rate limited in chat {chat_id}, retrying in {e.retry_after}s")
+                bucket.pause(e.retry_after)
+
+    async def send_all(self, chat_id: int, texts: Sequence[str]) -> bool:
+        """
+        Send messages to a chat, in order
+        :param chat_id: Identifier of the chat
+        :param texts: HTML texts of the messages
+        :return: True if every message was sent, False otherwise
+        """
+        for text in texts:
+            try:
+                await self._send(chat_id, text)
+            except Forbidden as e:
+                # The bot was removed from the chat, so no later message can arrive
+                print(f"Cannot send reminders to chat {chat_id}: {e}")
+                return False
+            except Exception as e:
+                print(f"Failed to send reminder to chat {chat_id}: {e!r}")
+                return False
+        return True
+
+    async def broadcast(self, chat_ids: Sequence[int], texts: Sequence[str]) -> int:
+        """
+        Send the same messages to every chat, with chats served concurrently
+        :param chat_ids: Identifiers of the chats
+        :param texts: HTML texts of the messages
+        :return: Number of chats that did not receive every message
+        """
+        results = await asyncio.gather(
+            *(self.send_all(chat_id, texts) for chat_id in chat_ids)
+        )
+        return results.count(False)
+
+
+async def send_reminders() -> Dict[str, int]:
+    """
+    Send the reminders for the events starting before the next run
+    :return: Dictionary with the number of reminders, chats and failed chats
+    """
+    config.prefetch_secrets()
+    try:
+        reminders = await get_upcoming_reminders(datetime.now(UTC), REMINDER_HORIZON)
+    finally:
+        await async_api.aclose()
+
+    failed = 0
+    if reminders and REMINDER_CHATS:
+        options = (
+            {"base_url": config.TELEGRAM_BASE_URL} if config.TELEGRAM_BASE_URL else {}
+        )
+        bot = Bot(
+            config.get_telegram_api_key(),
+            request=transport.telegram_request(),
+            **options,
+        )
+        async with bot:
+            sender = BroadcastSender(
+                bot, GLOBAL_RATE, CHAT_RATE, concurrency=transport.TELEGRAM.pool_size
+            )
+            failed = await sender.broadcast(REMINDER_CHATS, reminders)
+
+    return {"reminders": len(reminders), "chats": len(REMINDER_CHATS), "failed": failed}
+
+
+def handler(event, context):
+    """
+    Entry point for the scheduled reminder runs
+    """
+    try:
+        with metrics.span(metrics.INVOCATION):
+            result = asyncio.run(send_reminders())
+    finally:
+        metrics.flush()
+    print(f"Reminder run finished: {result}")
+    print(f"Connection reuse: {transport.format_stats()}")
+    if result["failed"]:
+        # Fail the invocation, so that the error alarm goes off
+        raise RuntimeError(f"Reminders could not be sent to {result['failed']} chats")
+    return result
@@ -0,0 +1,111 @@
+"""
+Cache of rendered replies for Notion events.
+
+A rendered reply only changes when the Notion page it comes from is edited, so
+renders are keyed by the renderer name, the page identifier and its
+last_edited_time, and reused until the page changes. Notion rounds that time
+down to the minute, so a page may be edited again without changing it while the
+minute lasts. Renders of pages edited that recently are not cached.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Hashable
+
+import metrics
+from notion.model import NotionEvent
+
+# Maximum number of rendered replies kept in memory
+RENDER_CACHE_MAX_ENTRIES = int(os.environ.get("RenderCacheMaxEntries", "512"))
+# Seconds after an edit during which the page may change with the same
+# last_edited_time, which Notion rounds down to the minute
+EDIT_SETTLE_TIME = 60
+
+Renderer = Callable[[NotionEvent], str]
+
+
+class RenderCache:
+    """Registry of event renderers, whose results are cached per event version"""
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.time):
+        """
+        Initializes a new RenderCache
+        :param max_entries: Maximum number of rendered replies kept, least recently
+                            used ones are evicted first
+        :param clock: Function returning the current Unix time in seconds
+        """
+        self.max_entries = max_entries
+        self._clock = clock
+        self._renderers: Dict[str, Renderer] = {}
+        self._rendered: OrderedDict[Hashable, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str) -> Callable[[Renderer], Renderer]:
+        """
+        Decorator that registers a function as the renderer with the provided name
+        :param name: Name of the renderer
+        :return: Decorator that leaves the function unchanged
+        """
+
+        def decorator(func: Renderer) -> Renderer:
+            if name in self._renderers:
+                raise ValueError(f"A renderer named '{name}' is already registered")
+            self._renderers[name] = func
+            return func
+
+        return decorator
+
+    def render(self, name: str, event: NotionEvent) -> str:
+        """
+        Render an event, reusing the previous result if the page has not changed
+        since then
+        :param name: Name of the renderer to use
+        :param event: Event to render
+        :return: Rendered text
+        """
+        renderer = self._renderers[name]
+        # Events that do not come from a page cannot be versioned
+        if not event.id or not event.last_edited_time:
+            return self._call(renderer, event)
+
+        key = (name, event.id, event.last_edited_time)
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is not None:
+                self._rendered.move_to_end(key)
+                return rendered
+
+        rendered = self._call(renderer, event)
+        # Only checked on misses, so that hits stay a single lookup
+        if not self._is_settled(event.last_edited_time):
+            return rendered
+        with self._lock:
+            self._rendered[key] = rendered
+            while len(self._rendered) > self.max_entries:
+                self._rendered.popitem(last=False)
+        return rendered
+
+    @staticmethod
+    def _call(renderer: Renderer, event: NotionEvent) -> str:
+        # Only actual renders are timed, cache hits are negligible
+        with metrics.span(metrics.RENDER):
+            return renderer(event)
+
+    def _is_settled(self, last_edited_time: str) -> bool:
+        edited_at = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00"))
+        return self._clock() - edited_at.timestamp() >= EDIT_SETTLE_TIME
+
+    def clear(self):
+        """
+        Forget every rendered reply
+        """
+        with self._lock:
+            self._rendered.clear()
+
+
+render_cache = RenderCache(RENDER_CACHE_MAX_ENTRIES)
+renderer = render_cache.register
+render = render_cache.render
@@ -2,100 +2,579 @@ import functools
 import json
 import os
 import asyncio
-from typing import Callable, Any, Coroutine
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Any, Coroutine, Dict, List, Optional, Set, Tuple
 
-import boto3
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackContext
-from telegram import Update
-from notion.api import get_next_event
+from telegram.constants import ParseMode
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+    CallbackContext,
+    InlineQueryHandler,
+    TypeHandler,
+)
+from telegram import (
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    LinkPreviewOptions,
+    Update,
+)
+
+import config
+import metrics
+import rendering
+import transport
+import webhook_reply
+from dedup import deduplicator
+from throttling import command_throttle
+from notion import async_api
+from notion.formatting import get_formatter
+from notion.index import DayIndex
+from notion.model import NotionEvent
+from notion.search import event_search
 
 ALLOWED_USERNAMES = set(os.environ["AllowedUsers"].split(","))
-TELEGRAM_SECRET_NAME = os.environ["TelegramSecretName"]
+# Return the first reply to each update in the webhook response, instead of
+# sending it through a separate request to the Telegram API
+WEBHOOK_REPLY = os.environ.get("WebhookReply", "false").lower() == "true"
+
+# Number of days, starting today, covered by the range commands
+WEEK_DAYS = 7
+MONTH_DAYS = 31
+# Longest text accepted by Telegram in a single message
+MAX_MESSAGE_LENGTH = 4096
+# Maximum number of results returned to an inline query
+INLINE_RESULTS_LIMIT = 20
+# Seconds Telegram caches the results of an inline query
+INLINE_CACHE_TIME = int(os.environ.get("InlineCacheTime", "30"))
+# URL of the iCalendar feed, without its access token, if the feed is enabled
+CALENDAR_URL = os.environ.get("CalendarURL")
 
-secrets_manager = boto3.client("secretsmanager")
-TELEGRAM_API_KEY = secrets_manager.get_secret_value(SecretId=TELEGRAM_SECRET_NAME)[
-    "SecretString"
-]
+# Built on the first invocation, so that no secret is fetched at import time
+application: Optional[Application] = None
 
-application = Application.builder().token(TELEGRAM_API_KEY).build()
+# Identifiers of the updates whose handlers raised an error. The application does
+# not raise those errors, it passes them to the error handlers instead.
+_failed_updates: Set[int] = set()
 
 
 def status_code(code: int) -> dict:
     return {"statusCode": code}
 
 
+def is_authorized(update: Update) -> bool:
+    """
+    Check whether an update was sent by one of the allowed users
+    :param update: Update to check
+    :return: True if its sender is allowed to use the bot
+    """
+    # Inline queries are not attached to any message
+    user = update.effective_user
+    return user is not None and user.username in ALLOWED_USERNAMES
+
+
 def authorized_users_only(func: Callable[[Update, CallbackContext], Coroutine[Any, Any, None]]):
     @functools.wraps(func)
     async def wrapper_authorized_users_only(update: Update, context: Any):
-        message_username = update.message.from_user.username
-
-        if message_username not in ALLOWED_USERNAMES:
-            print(
-                f"User {message_username} not authorized for function "
-                f"{func.__name__}"
-            )
+        if not is_authorized(update):
+            username = update.effective_user.username if update.effective_user else None
+            print(f"User {username} not authorized for function {func.__name__}")
             return status_code(401)
         await func(update, context)
 
     return wrapper_authorized_users_only
 
 
+async def throttle_authorized_commands(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+):
+    """
+    Throttle the commands sent by allowed users. Other users are ignored by the
+    handlers, so they are neither warned nor allowed to use up the limits of
+    their chat.
+    """
+    if is_authorized(update):
+        await command_throttle.check(update, context)
+
+
 async def echo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
     user = update.message.from_user
     text = update.message.text
 
     message = f"Received message from {user} in chat {chat_id}:" f"\n{text}"
-    await update.message.reply_text(message)
-
+    await webhook_reply.reply_text(update.message, message)
 
-@authorized_users_only
-async def proximo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    next_event = get_next_event()
 
+@rendering.renderer("event_html")
+def render_event_html(event: NotionEvent) -> str:
+    """
+    Render the HTML description of an event sent as a reply
+    :param event: Event to describe
+    :return: String with the HTML description
+    """
     participants_str = (
-        f"\n\N{baby angel} <b>{next_event.participant_num}</b> educandos"
-        if next_event.participant_num > 0 else ""
+        f"\n\N{baby angel} <b>{event.participant_num}</b> educandos"
+        if event.participant_num > 0 else ""
     )
 
-    scouters_word = "scouter" if len(next_event.scouters) == 1 else "scouters"
-    scouters_str = f"\n\N{mage} <b>{len(next_event.scouters)}</b> {scouters_word}"
-    if next_event.scouters:
-        scouters_str += f": <i>{', '.join(next_event.scouters)}</i>"
+    scouters_word = "scouter" if len(event.scouters) == 1 else "scouters"
+    scouters_str = f"\n\N{mage} <b>{len(event.scouters)}</b> {scouters_word}"
+    if event.scouters:
+        scouters_str += f": <i>{', '.join(event.scouters)}</i>"
 
-    response_message = (
-        f"\n<u><b>{next_event.title}</b></u>"
-        f"\n\N{stopwatch} {next_event.date}"
-        f"\n\N{pushpin} {next_event.location}"
+    return (
+        f"\n<u><b>{event.title}</b></u>"
+        f"\n\N{stopwatch} {event.date}"
+        f"\n\N{pushpin} {event.location}"
         f"{participants_str}"
         f"{scouters_str}"
-        f"\n<a href='{next_event.url}'>Ver en Notion</a>"
+        f"\n<a href='{event.url}'>Ver en Notion</a>"
     )
 
-    await update.message.reply_html(response_message, disable_web_page_preview=True)
+
+@authorized_users_only
+async def proximo_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    next_event = await async_api.get_next_event()
+    if not next_event:
+        await webhook_reply.reply_text(update.message, "No hay ningún evento próximo")
+        return
+
+    response_message = rendering.render("event_html", next_event)
+
+    await webhook_reply.reply_html(
+        update.message, response_message, disable_web_page_preview=True
+    )
     print(f"Sent response: <{response_message}>")
 
 
-# Add message and command handlers
-application.add_handler(CommandHandler("echo", echo_callback))
-application.add_handler(CommandHandler("proximo", proximo_callback))
+@rendering.renderer("event_line")
+def render_event_line(event: NotionEvent) -> str:
+    """
+    Render the single line HTML summary of an event used in event lists
+    :param event: Event to summarize
+    :return: String with the HTML summary
+    """
+    location_str = f" \N{pushpin} {event.location}" if event.location else ""
+    return f"• <a href='{event.url}'>{event.title}</a>{location_str}"
+
+
+def render_day_index(index: DayIndex, title: str) -> str:
+    """
+    Render the HTML list of the events in an index, grouped by day
+    :param index: Index with the events to list
+    :param title: Title for the list
+    :return: String with the HTML list, truncated to fit in a single message
+    """
+    formatter = get_formatter()
+    lines = [f"<u><b>{title}</b></u>"]
+    for day in index:
+        lines.append(f"\n<b>{formatter.describe(day).capitalize()}</b>")
+        lines.extend(
+            rendering.render("event_line", event) for event in index.events_on(day)
+        )
+
+    message = "\n".join(lines)
+    if len(message) > MAX_MESSAGE_LENGTH:
+        message = message[: message.rfind("\n", 0, MAX_MESSAGE_LENGTH - 2)] + "\n…"
+    return message
+
+
+async def reply_with_window(update: Update, days: int, title: str):
+    """
+    Reply with the events taking place in the following days
+    :param update: Update to reply to
+    :param days: Number of days to cover, starting today
+    :param title: Title for the list of events
+    """
+    today = datetime.now(config.TIME_ZONE).date()
+    index = await async_api.get_day_index(today, today + timedelta(days=days - 1))
+    if not index:
+        await webhook_reply.reply_text(update.message, f"{title}: no hay eventos")
+        return
+
+    await webhook_reply.reply_html(
+        update.message, render_day_index(index, title), disable_web_page_preview=True
+    )
+
+
+@authorized_users_only
+async def semana_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_with_window(update, WEEK_DAYS, "Próximos 7 días")
+
+
+@authorized_users_only
+async def mes_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_with_window(update, MONTH_DAYS, "Próximos 31 días")
+
+
+@authorized_users_only
+async def inline_query_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Sent on every keystroke, so it is answered from the in-memory search index
+    events = await event_search.search(update.inline_query.query, INLINE_RESULTS_LIMIT)
+    cache_time = INLINE_CACHE_TIME
+    if events is None:
+        # The index is still being built, so the results must not be cached
+        events, cache_time = [], 0
+    results = [
+        InlineQueryResultArticle(
+            id=event.id,
+            title=event.title,
+            description=f"{event.date} \N{pushpin} {event.location}",
+            input_message_content=InputTextMessageContent(
+                rendering.render("event_html", event),
+                parse_mode=ParseMode.HTML,
+                link_preview_options=LinkPreviewOptions(is_disabled=True),
+            ),
+        )
+        for event in events
+    ]
+    with metrics.span(metrics.TELEGRAM_SEND):
+        await update.inline_query.answer(
+            results, cache_time=cache_time, is_personal=True
+        )
+
+
+@authorized_users_only
+async def calendario_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    token = config.derive_calendar_token(config.get_telegram_api_key())
+    await webhook_reply.reply_text(
+        update.message,
+        f"Suscríbete al calendario desde tu aplicación de calendario con esta "
+        f"dirección:\n{CALENDAR_URL}?token={token}",
+        disable_web_page_preview=True,
+    )
+
+
+def get_application() -> Application:
+    """
+    Return the bot application, building it on first use. Both API keys are fetched
+    in parallel at that point, so the Notion key is already cached by the time a
+    command needs it.
+    :return: Application with every handler registered
+    """
+    global application
+
+    if application is None:
+        config.prefetch_secrets()
+        with metrics.span(metrics.APPLICATION_INIT):
+            application = build_application(config.get_telegram_api_key())
+    return application
+
+
+def build_application(token: str) -> Application:
+    """
+    Build the bot application and register its handlers
+    :param token: API key for the Telegram bot
+    :return: Application with every handler registered
+    """
+    builder = Application.builder().token(token).request(transport.telegram_request())
+    if config.TELEGRAM_BASE_URL:
+        builder = builder.base_url(config.TELEGRAM_BASE_URL)
+    application = builder.build()
+
+    # Throttled commands are stopped before reaching their handlers
+    application.add_handler(TypeHandler(Update, throttle_authorized_commands), group=-1)
 
+    # Add message and command handlers
+    application.add_handler(CommandHandler("echo", echo_callback))
+    application.add_handler(CommandHandler("proximo", proximo_callback))
+    application.add_handler(CommandHandler("semana", semana_callback))
+    application.add_handler(CommandHandler("mes", mes_callback))
+    application.add_handler(InlineQueryHandler(inline_query_callback))
+    if CALENDAR_URL:
+        application.add_handler(CommandHandler("calendario", calendario_callback))
 
-async def handle_update(update: Update):
+    application.add_error_handler(record_failure)
+    return application
+
+
+async def record_failure(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Error handler that logs the error raised by a handler, and records its update
+    as failed so that it can be retried
+    """
+    update_id = update.update_id if isinstance(update, Update) else None
+    print(
+        f"Failed to process update {update_id}:\n"
+        f"{''.join(traceback.format_exception(context.error))}"
+    )
+    if update_id is not None:
+        _failed_updates.add(update_id)
+
+
+async def process_update_checked(application: Application, update: Update) -> bool:
+    """
+    Process an update with the application, and report whether any of its handlers
+    raised an error
+    :param application: Initialized application
+    :param update: Update to process
+    :return: True if the update was processed, False if a handler failed
+    """
+    _failed_updates.discard(update.update_id)
+    await application.process_update(update)
+    if update.update_id in _failed_updates:
+        _failed_updates.discard(update.update_id)
+        return False
+    return True
+
+
+async def initialize_application(application: Application):
+    """
+    Initialize the application, which includes a getMe call to the Telegram API.
+    It is a no-op for an already initialized application.
+    :param application: Application to initialize
+    """
+    with metrics.span(metrics.APPLICATION_INIT):
+        await application.initialize()
+
+
+# Event loop reused across invocations when running in persistent mode
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop kept alive for the lifetime of the container, creating it
+    on the first invocation. Background tasks scheduled on it are paused while the
+    container is frozen, and resume on the next invocation.
+    :return: Event loop for the container
+    """
+    global _loop
+
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+async def shutdown_application():
+    """
+    Release the resources held by the application and the Notion client
+    """
+    if application is not None:
+        await application.shutdown()
+    await async_api.aclose()
+
+
+def shutdown_runtime():
+    """
+    Shut down the persistent application and close its event loop, for local runs
+    such as the load test. Lambda only sends SIGTERM to functions with an external
+    extension, so deployed containers are destroyed without calling this.
+    """
+    if _loop is None or _loop.is_closed() or _loop.is_running():
+        return
+    print("Shutting down persistent runtime")
+    _loop.run_until_complete(shutdown_application())
+    _loop.close()
+
+
+async def handle_update(update: Update) -> Tuple[bool, Optional[dict]]:
+    """
+    Process an update with the bot application
+    :param update: Update to process
+    :return: Tuple with whether the update was processed without errors, and the
+             method call to return in the webhook response, if any
+    """
     if update.message:
         print(
             f"Received message from {update.message.from_user}:"
             f"\n{update.message.text}"
         )
-    async with application:
-        await application.process_update(update)
+    if not WEBHOOK_REPLY:
+        return await process_update(update), None
 
+    with webhook_reply.collect_reply() as reply:
+        processed = await process_update(update)
+    return processed, reply.payload
 
-def handler(event, context):
-    print("Received new update from webhook")
-    update = Update.de_json(event, application.bot)
+
+async def process_update(update: Update) -> bool:
+    application = get_application()
+    if config.PERSISTENT_RUNTIME:
+        # Initialization only happens on the first invocation
+        await initialize_application(application)
+        return await process_update_checked(application, update)
+
+    try:
+        await initialize_application(application)
+        return await process_update_checked(application, update)
+    finally:
+        # The event loop is discarded after each invocation, so the connections
+        # opened on it cannot be reused
+        await shutdown_application()
+
+
+def run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run a coroutine to completion on the event loop for the current mode
+    :param coroutine: Coroutine to run
+    :return: Result of the coroutine
+    """
+    if config.PERSISTENT_RUNTIME:
+        return get_event_loop().run_until_complete(coroutine)
+    return asyncio.run(coroutine)
+
+
+def parse_update(event: Any) -> Update:
+    """
+    Build an Update from its JSON representation
+    :param event: Dictionary with the update, as sent by Telegram
+    :return: Update instance
+    :raises ValueError if the event is not a valid Telegram update
+    """
+    bot = get_application().bot
+    with metrics.span(metrics.UPDATE_PARSE):
+        try:
+            update = Update.de_json(event, bot)
+        except (AttributeError, KeyError, TypeError) as e:
+            # Raised by the parsers of the nested objects when a field is missing
+            # or has an unexpected type
+            raise ValueError(f"Received event is not a valid Telegram update: {e!r}")
     if not update:
         raise ValueError(f"Received event is not a valid Telegram update, event is {json.dumps(event, indent=2)}")
+    return update
+
+
+def handler(event, context):
+    try:
+        with metrics.span(metrics.INVOCATION):
+            return handle_webhook_event(event)
+    finally:
+        metrics.flush()
+
+
+def unwrap_webhook_event(event: Any) -> Tuple[Any, Optional[str]]:
+    """
+    Extract the update and the secret token from the envelope built by the API
+    Gateway request template. Events without an envelope, such as those of local
+    runs, are returned as they are.
+    :param event: Event received by the function
+    :return: Tuple with the update and the secret token, if any
+    """
+    if isinstance(event, dict) and "body" in event and "update_id" not in event:
+        return event["body"], event.get("secretToken") or None
+    return event, None
+
+
+def handle_webhook_event(event: Any) -> dict:
+    """
+    Process an update received from the webhook
+    :param event: Dictionary with the update, as sent by Telegram
+    :return: Method call to return in the webhook response, or a status code
+    """
+    print("Received new update from webhook")
+    event, secret_token = unwrap_webhook_event(event)
+    # Requests not coming from Telegram are rejected before any other work
+    if not config.is_valid_secret_token(secret_token):
+        print("Rejecting update with an invalid secret token")
+        return status_code(401)
+
+    # Deliveries retried by Telegram are discarded before any work is done
+    update_id = event.get("update_id") if isinstance(event, dict) else None
+    if not deduplicator.claim(update_id):
+        print(f"Discarding duplicate update {update_id}")
+        return status_code(200)
 
-    asyncio.run(handle_update(update))
+    try:
+        update = parse_update(event)
+        processed, reply = run(handle_update(update))
+    except Exception:
+        deduplicator.release(update_id)
+        raise
+    # Only processed updates are remembered for good. Failed ones are released,
+    # so that a later delivery is processed again.
+    if processed:
+        deduplicator.complete(update_id)
+    else:
+        deduplicator.release(update_id)
+    print(f"Connection reuse: {transport.format_stats()}")
+    if reply:
+        print(f"Replying in webhook response with method {reply['method']}")
+        return reply
     return status_code(200)
+
+
+async def process_chat_updates(updates: List[Tuple[str, Update]]) -> List[str]:
+    """
+    Process the updates for a single chat in order. Once an update fails, the
+    following ones are not processed, so that they are retried in order too.
+    :param updates: List of (message ID, update) tuples, sorted by update ID
+    :return: List with the message IDs of the updates that were not processed
+    """
+    application = get_application()
+    for index, (message_id, update) in enumerate(updates):
+        try:
+            processed = await process_update_checked(application, update)
+        except Exception as e:
+            print(f"Failed to process update {update.update_id}: {e!r}")
+            processed = False
+        if not processed:
+            for _, failed_update in updates[index:]:
+                await asyncio.to_thread(deduplicator.release, failed_update.update_id)
+            return [failed_id for failed_id, _ in updates[index:]]
+        await asyncio.to_thread(deduplicator.complete, update.update_id)
+    return []
+
+
+async def handle_batch(records: List[Dict[str, Any]]) -> List[str]:
+    """
+    Process a batch of queued updates. Updates from different chats are processed
+    concurrently, while those from the same chat keep their order.
+    :param records: SQS records with the JSON updates as their body
+    :return: List with the message IDs of the records that were not processed
+    """
+    failures = []
+    updates_by_chat: Dict[Optional[int], List[Tuple[str, Update]]] = {}
+    for record in records:
+        attributes = record.get("messageAttributes", {})
+        secret_token = attributes.get("SecretToken", {}).get("stringValue")
+        if not config.is_valid_secret_token(secret_token):
+            print(f"Discarding record {record['messageId']} with invalid secret token")
+            continue
+        try:
+            update = parse_update(json.loads(record["body"]))
+        except ValueError as e:
+            print(f"Discarding invalid record {record['messageId']}: {e}")
+            continue
+        if not await asyncio.to_thread(deduplicator.claim, update.update_id):
+            print(f"Discarding duplicate update {update.update_id}")
+            continue
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        updates_by_chat.setdefault(chat_id, []).append((record["messageId"], update))
+
+    application = get_application()
+    await initialize_application(application)
+    try:
+        results = await asyncio.gather(
+            *(
+                process_chat_updates(sorted(updates, key=lambda u: u[1].update_id))
+                for updates in updates_by_chat.values()
+            )
+        )
+    finally:
+        if not config.PERSISTENT_RUNTIME:
+            await shutdown_application()
+
+    for chat_failures in results:
+        failures.extend(chat_failures)
+    return failures
+
+
+def batch_handler(event, context):
+    """
+    Entry point for batches of updates received through the SQS ingestion queue.
+    Failed records are reported individually, so that only those are retried.
+    """
+    records = event["Records"]
+    print(f"Received batch of {len(records)} updates")
+
+    try:
+        with metrics.span(metrics.INVOCATION):
+            failures = run(handle_batch(records))
+    finally:
+        metrics.flush({"BatchSize": len(records)})
+    return {"batchItemFailures": [{"itemIdentifier": id_} for id_ in failures]}
@@ -0,0 +1,393 @@
+"""
+Long-running webhook server, an alternate entry point to the Lambda handlers.
+
+Serves the same application and handlers from a persistent asyncio HTTP server,
+for running the bot in a container or on a host of its own. Each update is
+acknowledged as soon as it is queued, and processed by a bounded pool of workers,
+so that slow Notion queries never delay the response to Telegram. Updates from
+the same chat are processed in order, while those from different chats are
+processed concurrently.
+
+Usage:
+    python server.py
+
+The server is configured with the same environment variables as the Lambda
+function, plus those read below.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import weakref
+from typing import Dict, Optional, Set, Tuple
+
+from telegram import Update
+
+import config
+import router_lambda
+from dedup import deduplicator
+
+SERVER_HOST = os.environ.get("ServerHost", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("ServerPort", "8080"))
+# Path Telegram posts the updates to
+WEBHOOK_PATH = os.environ.get("WebhookPath", "/")
+HEALTH_PATH = "/health"
+# Number of updates processed concurrently
+SERVER_WORKERS = int(os.environ.get("ServerWorkers", "8"))
+# Number of acknowledged updates waiting for a worker. Once full, updates are
+# rejected so that Telegram delivers them again later.
+SERVER_QUEUE_SIZE = int(os.environ.get("ServerQueueSize", "100"))
+# Seconds the queued updates are given to finish processing on shutdown
+SHUTDOWN_TIMEOUT = float(os.environ.get("ShutdownTimeout", "10"))
+# Public URL of the webhook, set in the Telegram API on startup if given
+WEBHOOK_URL = os.environ.get("WebhookURL")
+# Seconds an idle connection is kept open, Telegram reuses them between updates
+KEEP_ALIVE_TIMEOUT = 75
+# Largest request body accepted, updates are much smaller
+MAX_BODY_SIZE = 1024 * 1024
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    501: "Not Implemented",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """Request that cannot be read, answered with an error before closing"""
+
+    def __init__(self, status: int):
+        super().__init__(_REASONS[status])
+        self.status = status
+
+
+def format_response(status: int, body: dict, keep_alive: bool) -> bytes:
+    """
+    Build an HTTP response with a JSON body
+    :param status: Status code of the response
+    :param body: Object to send as the body
+    :param keep_alive: Whether the connection stays open after the response
+    :return: Bytes of the response
+    """
+    payload = json.dumps(body, separators=(",", ":")).encode()
+    head = (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"\r\n"
+    )
+    return head.encode("latin-1") + payload
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Read an HTTP request from a connection
+    :param reader: Stream of the connection
+    :return: Tuple with the method, path, lowercase headers and body of the request,
+             None if the connection was closed before a new request
+    :raises HTTPError if the request is malformed or not supported
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(501)
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400)
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+class WebhookServer:
+    """HTTP server receiving the updates from Telegram and processing them"""
+
+    def __init__(self, host: str, port: int, workers: int, queue_size: int):
+        """
+        Initializes a new WebhookServer
+        :param host: Address to listen on
+        :param port: Port to listen on, 0 to pick a free one
+        :param workers: Number of updates processed concurrently
+        :param queue_size: Number of updates waiting for a worker before new ones
+                           are rejected
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(queue_size)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._worker_tasks: Set[asyncio.Task] = set()
+        self._connections: Set[asyncio.StreamWriter] = set()
+        # Locks only live while some worker holds or waits for them
+        self._chat_locks = weakref.WeakValueDictionary()
+        self._stopped: Optional[asyncio.Event] = None
+        self._closing = False
+        # Shutdown started by a signal, referenced so that it is not collected
+        self._stop_task: Optional[asyncio.Task] = None
+        self.busy = 0
+        self.processed = 0
+        self.rejected = 0
+
+    async def start(self):
+        """
+        Initialize the application, start the workers and listen for updates
+        """
+        application = router_lambda.get_application()
+        await router_lambda.initialize_application(application)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                WEBHOOK_URL,
+                allowed_updates=["message", "inline_query"],
+                secret_token=(
+                    config.derive_webhook_secret_token(config.get_telegram_api_key())
+                    if config.VALIDATE_SECRET_TOKEN
+                    else None
+                ),
+            )
+            print(f"Webhook set to {WEBHOOK_URL}")
+
+        self._stopped = asyncio.Event()
+        for _ in range(self.workers):
+            task = asyncio.create_task(self._work())
+            self._worker_tasks.add(task)
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Listening for updates on {self.host}:{self.port}{WEBHOOK_PATH}")
+
+    async def stop(self):
+        """
+        Stop accepting updates, give the queued ones time to finish, and release the
+        resources held by the application
+        """
+        if self._closing:
+            return
+        self._closing = True
+        print(f"Shutting down, {self._queue.qsize()} updates queued")
+        self._server.close()
+        # Idle connections would otherwise keep the server from closing
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+        try:
+            await asyncio.wait_for(self._queue.join(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Dropping {self._queue.qsize()} updates not processed in time")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        # Updates never processed are released, so that a later delivery is not
+        # discarded as a duplicate
+        while not self._queue.empty():
+            update_id = self._queue.get_nowait().update_id
+            await asyncio.to_thread(deduplicator.release, update_id)
+
+        await router_lambda.shutdown_application()
+        self._stopped.set()
+
+    async def serve_forever(self):
+        """
+        Serve updates until SIGTERM or SIGINT is received, then shut down gracefully
+        """
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._request_stop)
+        await self._stopped.wait()
+
+    def _request_stop(self):
+        if self._stop_task is None:
+            self._stop_task = asyncio.create_task(self.stop())
+
+    def health(self) -> Tuple[int, dict]:
+        """
+        Report the state of the server, unhealthy once it is shutting down so that
+        load balancers stop sending it requests
+        :return: Tuple with the status code and the body of the response
+        """
+        body = {
+            "status": "stopping" if self._closing else "ok",
+            "queued": self._queue.qsize(),
+            "busy": self.busy,
+            "workers": self.workers,
+            "processed": self.processed,
+            "rejected": self.rejected,
+        }
+        return (503 if self._closing else 200), body
+
+    async def accept_update(self, headers: Dict[str, str], body: bytes) -> int:
+        """
+        Queue an update received from Telegram. The update is claimed in a worker
+        thread, as the shared store is called with a blocking client.
+        :param headers: Lowercase headers of the request
+        :param body: JSON body of the request
+        :return: Status code of the response
+        """
+        if self._closing:
+            return 503
+        if not config.is_valid_secret_token(headers.get(SECRET_TOKEN_HEADER)):
+            print("Rejecting update with an invalid secret token")
+            return 401
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return 400
+
+        update_id = event.get("update_id") if isinstance(event, dict) else None
+        if not await asyncio.to_thread(deduplicator.claim, update_id):
+            print(f"Discarding duplicate update {update_id}")
+            return 200
+        # The claim is released on every path where the update is not queued
+        try:
+            update = router_lambda.parse_update(event)
+        except Exception as e:
+            await asyncio.to_thread(deduplicator.release, update_id)
+            print(f"Discarding invalid update {update_id}: {e!r}")
+            return 400
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram delivers the update again after a while
+            await asyncio.to_thread(deduplicator.release, update_id)
+            self.rejected += 1
+            return 503
+        return 200
+
+    async def _serve_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self._connections.add(writer)
+        try:
+            while not self._closing:
+                try:
+                    request = await asyncio.wait_for(
+                        read_request(reader), KEEP_ALIVE_TIMEOUT
+                    )
+                except HTTPError as e:
+                    await self._reject(writer, e.status)
+                    return
+                except (
+                    asyncio.TimeoutError,
+                    asyncio.IncompleteReadError,
+                    ConnectionError,
+                ):
+                    # Idle or closed connection, there is no request to answer
+                    return
+                except Exception as e:
+                    # Such as lines longer than the limit of the stream
+                    print(f"Rejecting unreadable request: {e!r}")
+                    await self._reject(writer, 400)
+                    return
+                if request is None:
+                    return
+
+                method, path, headers, body = request
+                if path == HEALTH_PATH:
+                    status, response = self.health()
+                    if method != "GET":
+                        status, response = 405, {}
+                elif path == WEBHOOK_PATH:
+                    status = (
+                        405
+                        if method != "POST"
+                        else await self.accept_update(headers, body)
+                    )
+                    response = {}
+                else:
+                    status, response = 404, {}
+
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and not self._closing
+                )
+                writer.write(format_response(status, response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _reject(writer: asyncio.StreamWriter, status: int):
+        writer.write(format_response(status, {"error": _REASONS[status]}, False))
+        await writer.drain()
+
+    def _chat_lock(self, update: Update) -> asyncio.Lock:
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        return lock
+
+    async def _work(self):
+        application = router_lambda.get_application()
+        while True:
+            update = await self._queue.get()
+            try:
+                processed = await self._process(application, update)
+                # Failed updates are released, so that a later delivery is
+                # processed again
+                if processed:
+                    self.processed += 1
+                    await asyncio.to_thread(deduplicator.complete, update.update_id)
+                else:
+                    await asyncio.to_thread(deduplicator.release, update.update_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, application, update: Update) -> bool:
+        try:
+            # Updates from the same chat are taken in order, and wait here for the
+            # previous one to be processed
+            async with self._chat_lock(update):
+                self.busy += 1
+                try:
+                    return await router_lambda.process_update_checked(
+                        application, update
+                    )
+                finally:
+                    self.busy -= 1
+        except Exception as e:
+            print(f"Failed to process update {update.update_id}: {e!r}")
+            return False
+
+
+def main():
+    server = WebhookServer(SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUEUE_SIZE)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
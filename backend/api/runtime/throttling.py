@@ -0,0 +1,150 @@
+"""
+Throttling of the commands that query Notion, per chat and per user.
+
+Every command with a rate limit takes a token from a bucket for its chat and
+another for its user before any handler runs. When either bucket is empty the
+update is dropped, and the user is asked to slow down once, in a reply that
+costs no Notion request. Buckets live in the memory of each container, so the
+limits apply per container.
+"""
+
+import json
+import math
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import webhook_reply
+from ratelimit import TokenBucket
+
+# Maximum number of buckets kept in memory, least recently used ones are dropped
+THROTTLE_MAX_BUCKETS = int(os.environ.get("ThrottleMaxBuckets", "1024"))
+
+
+class RateLimit:
+    """Rate limit for a command"""
+
+    def __init__(self, per_minute: float, burst: int):
+        """
+        Initializes a new RateLimit
+        :param per_minute: Sustained number of uses allowed per minute
+        :param burst: Number of uses allowed in quick succession
+        """
+        self.per_minute = per_minute
+        self.burst = burst
+
+    def new_bucket(self) -> TokenBucket:
+        return TokenBucket(self.per_minute / 60, capacity=self.burst)
+
+
+# Limits for the commands that query Notion. They can be overridden with the
+# CommandRateLimits environment variable, a JSON object such as
+# {"mes": {"per_minute": 2, "burst": 1}}
+DEFAULT_LIMITS: Dict[str, RateLimit] = {
+    "proximo": RateLimit(per_minute=6, burst=3),
+    "semana": RateLimit(per_minute=4, burst=2),
+    "mes": RateLimit(per_minute=2, burst=2),
+}
+
+
+def load_limits() -> Dict[str, RateLimit]:
+    """
+    Return the rate limit of each command, applying the environment overrides
+    :return: Dictionary with the limits by command name
+    """
+    limits = dict(DEFAULT_LIMITS)
+    overrides = json.loads(os.environ.get("CommandRateLimits", "{}"))
+    for command, limit in overrides.items():
+        limits[command] = RateLimit(limit["per_minute"], limit["burst"])
+    return limits
+
+
+def get_command(update: Update) -> Optional[str]:
+    """
+    Return the command sent in an update, without the bot username
+    :param update: Update to inspect
+    :return: Lowercase name of the command, None if the update is not a command
+    """
+    message = update.effective_message
+    if not message or not message.text or not message.text.startswith("/"):
+        return None
+    words = message.text[1:].split(maxsplit=1)
+    if not words:
+        return None
+    return words[0].split("@", 1)[0].lower()
+
+
+class CommandThrottle:
+    """
+    Token bucket throttling of commands, per chat and per user. The buckets live
+    in the memory of the process, so each concurrent Lambda container has buckets
+    of its own, and a chat can use up the limit once in each of them. It bounds
+    the load on Notion from each container, rather than being a global per-chat
+    limit.
+    """
+
+    def __init__(self, limits: Dict[str, RateLimit], max_buckets: int):
+        """
+        Initializes a new CommandThrottle
+        :param limits: Rate limit of each throttled command
+        :param max_buckets: Maximum number of buckets kept in memory
+        """
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+        # Buckets whose owner was already asked to slow down
+        self._warned = set()
+
+    def _get_bucket(self, key: Hashable, limit: RateLimit) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = limit.new_bucket()
+            while len(self._buckets) > self.max_buckets:
+                evicted, _ = self._buckets.popitem(last=False)
+                self._warned.discard(evicted)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Handler run before any other, which stops the processing of a throttled
+        command when its chat or user has run out of tokens. Only updates from
+        allowed users must be passed to it.
+        :raises ApplicationHandlerStop if the command must not be processed
+        """
+        command = get_command(update)
+        limit = self.limits.get(command)
+        if limit is None:
+            return
+
+        keys = []
+        if update.effective_chat:
+            keys.append(("chat", update.effective_chat.id, command))
+        if update.effective_user:
+            keys.append(("user", update.effective_user.id, command))
+        buckets = [self._get_bucket(key, limit) for key in keys]
+
+        delay = max((bucket.delay() for bucket in buckets), default=0)
+        if delay == 0:
+            for key, bucket in zip(keys, buckets):
+                bucket.try_acquire()
+                self._warned.discard(key)
+            return
+
+        print(f"Throttled /{command} in {keys}, next allowed in {delay:.1f}s")
+        # Only warn once per empty bucket, so spamming does not cause more replies
+        if not self._warned.issuperset(keys):
+            self._warned.update(keys)
+            await webhook_reply.reply_text(
+                update.effective_message,
+                f"Demasiadas peticiones de /{command}, prueba de nuevo en "
+                f"{math.ceil(delay)} segundos",
+            )
+        raise ApplicationHandlerStop
+
+
+command_throttle = CommandThrottle(load_limits(), THROTTLE_MAX_BUCKETS)
@@ -0,0 +1,212 @@
+"""
+Shared HTTP transport settings for the outbound calls made by the bot.
+
+Connection pools are created once per container and kept alive across warm
+invocations, so most requests reuse an already established TLS connection. Pool
+sizes and timeouts can be tuned per service through environment variables, and
+every pool records how many requests it served and how many connections it had
+to open for them.
+"""
+
+import os
+import threading
+from typing import Any, Dict, TYPE_CHECKING
+
+import httpx
+
+if TYPE_CHECKING:
+    from botocore.config import Config
+    from telegram.request import HTTPXRequest
+
+
+def _setting(service: str, name: str, default: str) -> float:
+    return float(os.environ.get(f"{service}{name}", default))
+
+
+class PoolSettings:
+    """Connection pool size and timeouts for the calls made to a service"""
+
+    def __init__(self, service: str, pool_size: int, connect: float, read: float):
+        """
+        Initializes a new PoolSettings, which can be overridden with the
+        <Service>PoolSize, <Service>ConnectTimeout and <Service>ReadTimeout
+        environment variables
+        :param service: Name of the service, such as "Telegram"
+        :param pool_size: Default maximum number of connections
+        :param connect: Default seconds to wait for a connection to be established
+        :param read: Default seconds to wait for a response
+        """
+        self.service = service
+        self.pool_size = int(_setting(service, "PoolSize", str(pool_size)))
+        self.connect_timeout = _setting(service, "ConnectTimeout", str(connect))
+        self.read_timeout = _setting(service, "ReadTimeout", str(read))
+
+
+TELEGRAM = PoolSettings("Telegram", pool_size=8, connect=3.0, read=10.0)
+NOTION = PoolSettings("Notion", pool_size=4, connect=3.0, read=15.0)
+AWS = PoolSettings("Aws", pool_size=4, connect=2.0, read=5.0)
+
+# Seconds an idle connection is kept open. Containers can stay frozen for minutes
+# between invocations, after which servers usually have closed the connection.
+KEEPALIVE_EXPIRY = float(os.environ.get("KeepaliveExpiry", "60"))
+
+
+class ConnectionStats:
+    """Counters of requests made and connections opened for a service"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    @property
+    def reused(self) -> int:
+        """Number of requests served on an already open connection"""
+        return max(self.requests - self.new_connections, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Share of the requests served on an already open connection"""
+        return self.reused / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": round(self.reuse_ratio, 3),
+        }
+
+
+stats: Dict[str, ConnectionStats] = {
+    TELEGRAM.service: ConnectionStats(),
+    NOTION.service: ConnectionStats(),
+}
+
+
+def _limits(settings: PoolSettings) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.pool_size,
+        max_keepalive_connections=settings.pool_size,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout(settings: PoolSettings) -> httpx.Timeout:
+    return httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout)
+
+
+def _async_event_hooks(connection_stats: ConnectionStats) -> Dict[str, Any]:
+    """
+    Build httpx event hooks that record requests and new connections, the latter
+    through the httpcore trace extension
+    :param connection_stats: Counters to update
+    :return: Dictionary with the event_hooks argument for an AsyncClient
+    """
+
+    async def trace(event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            connection_stats.record_connection()
+
+    async def on_request(request: httpx.Request):
+        connection_stats.record_request()
+        request.extensions["trace"] = trace
+
+    return {"request": [on_request]}
+
+
+def _event_hooks(connection_stats: ConnectionStats) -> Dict[str, Any]:
+    """
+    Synchronous version of _async_event_hooks
+    :param connection_stats: Counters to update
+    :return: Dictionary with the event_hooks argument for a Client
+    """
+
+    def trace(event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            connection_stats.record_connection()
+
+    def on_request(request: httpx.Request):
+        connection_stats.record_request()
+        request.extensions["trace"] = trace
+
+    return {"request": [on_request]}
+
+
+def telegram_request() -> "HTTPXRequest":
+    """
+    Build the request object used by the bot to call the Telegram API
+    :return: HTTPXRequest with the configured pool size and timeouts
+    """
+    from telegram.request import HTTPXRequest
+
+    return HTTPXRequest(
+        connection_pool_size=TELEGRAM.pool_size,
+        connect_timeout=TELEGRAM.connect_timeout,
+        read_timeout=TELEGRAM.read_timeout,
+        httpx_kwargs={"event_hooks": _async_event_hooks(stats[TELEGRAM.service])},
+    )
+
+
+def notion_async_http_client() -> httpx.AsyncClient:
+    """
+    Build the HTTP client used by the asynchronous Notion client
+    :return: AsyncClient with the configured pool size
+    """
+    return httpx.AsyncClient(
+        limits=_limits(NOTION),
+        event_hooks=_async_event_hooks(stats[NOTION.service]),
+    )
+
+
+def notion_http_client() -> httpx.Client:
+    """
+    Build the HTTP client used by the synchronous Notion client
+    :return: Client with the configured pool size
+    """
+    return httpx.Client(
+        limits=_limits(NOTION), event_hooks=_event_hooks(stats[NOTION.service])
+    )
+
+
+def apply_notion_timeout(client: Any):
+    """
+    Set the configured timeouts on the HTTP client of a Notion client, as the
+    Notion client only supports a single timeout for every phase
+    :param client: Client or AsyncClient from notion_client
+    """
+    client.client.timeout = _timeout(NOTION)
+
+
+def aws_config() -> "Config":
+    """
+    Build the botocore configuration for the AWS clients
+    :return: Config with the configured pool size, timeouts and TCP keep-alive
+    """
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=AWS.pool_size,
+        connect_timeout=AWS.connect_timeout,
+        read_timeout=AWS.read_timeout,
+        tcp_keepalive=True,
+    )
+
+
+def format_stats() -> str:
+    """
+    Return a one-line summary of the connection reuse of every service
+    :return: String with the summary
+    """
+    return ", ".join(
+        f"{service}: {connection_stats.requests} requests, "
+        f"{connection_stats.new_connections} new connections"
+        for service, connection_stats in stats.items()
+    )
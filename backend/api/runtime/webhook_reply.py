@@ -0,0 +1,81 @@
+"""
+Support for answering an update with a Bot API method call in the body of the
+webhook response, which saves the separate request to the Telegram API.
+
+Telegram does not report whether a method call made this way succeeded, so only
+the first reply of each update is sent like this, and any further reply goes
+through the Bot API as usual.
+"""
+
+import contextlib
+import contextvars
+from typing import Any, Dict, Iterator, Optional
+
+from telegram import Chat, Message
+from telegram.constants import ParseMode
+
+import metrics
+
+
+class WebhookReply:
+    """Method call to be returned as the response to the webhook request"""
+
+    def __init__(self):
+        self.payload: Optional[Dict[str, Any]] = None
+
+
+_current_reply: contextvars.ContextVar[Optional[WebhookReply]] = contextvars.ContextVar(
+    "webhook_reply", default=None
+)
+
+
+@contextlib.contextmanager
+def collect_reply() -> Iterator[WebhookReply]:
+    """
+    Allow the replies made while processing an update to be returned in the
+    webhook response
+    :return: WebhookReply whose payload is set if a reply was collected
+    """
+    reply = WebhookReply()
+    token = _current_reply.set(reply)
+    try:
+        yield reply
+    finally:
+        _current_reply.reset(token)
+
+
+async def reply_text(
+    message: Message, text: str, parse_mode: Optional[str] = None, **kwargs: Any
+):
+    """
+    Reply to a message, in the webhook response if it is still available
+    :param message: Message to reply to
+    :param text: Text of the reply
+    :param parse_mode: Telegram parse mode for the text
+    :param kwargs: Additional sendMessage parameters
+    """
+    reply = _current_reply.get()
+    if reply is None or reply.payload is not None:
+        with metrics.span(metrics.TELEGRAM_SEND):
+            await message.reply_text(text, parse_mode=parse_mode, **kwargs)
+        return
+
+    payload = {"method": "sendMessage", "chat_id": message.chat_id, "text": text}
+    if parse_mode:
+        payload["parse_mode"] = parse_mode
+    # Match the behaviour of Message.reply_text, which quotes in group chats
+    if message.chat.type != Chat.PRIVATE:
+        payload["reply_parameters"] = {"message_id": message.message_id}
+    payload.update(kwargs)
+    reply.payload = payload
+
+
+async def reply_html(message: Message, text: str, **kwargs: Any):
+    """
+    Reply to a message with HTML text, in the webhook response if it is still
+    available
+    :param message: Message to reply to
+    :param text: HTML text of the reply
+    :param kwargs: Additional sendMessage parameters
+    """
+    await reply_text(message, text, parse_mode=ParseMode.HTML, **kwargs)
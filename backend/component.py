@@ -1,8 +1,10 @@
-from aws_cdk import Stack, aws_secretsmanager as _sm
+from typing import Optional, Sequence
+
+from aws_cdk import Duration, Stack, aws_secretsmanager as _sm
 
 from constructs import Construct
 
-from .api.infrastructure import API
+from .api.infrastructure import API, PerformanceProfile
 from .webhook.infrastructure import TelegramWebhook
 
 
@@ -21,6 +23,17 @@ class EscultoideBot(Stack):
         notion_secret_name: str,
         notion_calendar_id: str,
         allowed_users: [str] = None,
+        webhook_reply: bool = False,
+        batch_ingestion: bool = False,
+        reminder_chats: [int] = None,
+        performance: PerformanceProfile = None,
+        allowed_updates: Optional[Sequence[str]] = ("message", "inline_query"),
+        max_connections: Optional[int] = None,
+        drop_pending_updates: bool = False,
+        secret_token: bool = False,
+        calendar_sync_interval: Optional[Duration] = None,
+        calendar_feed: bool = False,
+        calendar_cache_ttl: Optional[Duration] = Duration.minutes(5),
         **kwargs,
     ) -> None:
         """
@@ -34,6 +47,37 @@ class EscultoideBot(Stack):
         :param notion_calendar_id: Identifier for the Notion database to interact with
         :param allowed_users: List of usernames that must be able to access restricted
                               bot commands
+        :param webhook_reply: Whether to answer updates with a method call in the
+                              webhook response, instead of a separate request to the
+                              Telegram API
+        :param batch_ingestion: Whether to queue the updates and process them in
+                                batches, instead of invoking the function once per
+                                update
+        :param reminder_chats: List of chat IDs where a daily reminder of the events
+                               in the following 24 hours is sent
+        :param performance: Sizing of the bot lambda, PerformanceProfile defaults
+                            if not provided
+        :param allowed_updates: Update types sent by Telegram. Defaults to those the
+                                bot handles, so that no invocation is wasted on the
+                                rest.
+        :param max_connections: Maximum number of simultaneous connections Telegram
+                                opens to deliver updates, 40 if not provided
+        :param drop_pending_updates: Whether to drop the updates not delivered yet
+                                     when the webhook is set
+        :param secret_token: Whether Telegram must send a secret token with every
+                             update, so that any other request is rejected. The
+                             token is derived from the Telegram API key, so after
+                             rotating the key every update is rejected until the
+                             stack is deployed again and the webhook is set with
+                             the new token.
+        :param calendar_sync_interval: Interval between the syncs of the calendar
+                                       into a table that the bot lambda reads
+                                       instead of querying Notion. None to always
+                                       query Notion.
+        :param calendar_feed: Whether to serve the calendar as an iCalendar feed, to
+                              anyone with the link given by the /calendario command
+        :param calendar_cache_ttl: Time the API Gateway caches the feed, None to
+                                   disable its cache cluster
         """
         super().__init__(scope, construct_id, **kwargs)
 
@@ -54,8 +98,23 @@ class EscultoideBot(Stack):
             self.notion_api_key,
             self.notion_calendar_id,
             allowed_users=allowed_users,
+            webhook_reply=webhook_reply,
+            batch_ingestion=batch_ingestion,
+            reminder_chats=reminder_chats,
+            performance=performance,
+            secret_token=secret_token,
+            calendar_sync_interval=calendar_sync_interval,
+            calendar_feed=calendar_feed,
+            calendar_cache_ttl=calendar_cache_ttl,
         )
 
         self.webhook = TelegramWebhook(
-            self, "TelegramWebhook", self.telegram_api_key, self.api.gateway.url
+            self,
+            "TelegramWebhook",
+            self.telegram_api_key,
+            self.api.gateway.url,
+            allowed_updates=allowed_updates,
+            max_connections=max_connections,
+            drop_pending_updates=drop_pending_updates,
+            secret_token=secret_token,
         )
@@ -1,4 +1,5 @@
 import pathlib
+from typing import Optional, Sequence
 
 from aws_cdk import (
     aws_lambda as _lambda,
@@ -19,10 +20,38 @@ class TelegramWebhook(Construct):
     """
 
     def __init__(
-        self, scope: Construct, _id: str, api_key: ssm.ISecret, gateway_url: str
+        self,
+        scope: Construct,
+        _id: str,
+        api_key: ssm.ISecret,
+        gateway_url: str,
+        allowed_updates: Optional[Sequence[str]] = None,
+        max_connections: Optional[int] = None,
+        drop_pending_updates: bool = False,
+        secret_token: bool = False,
     ) -> None:
+        """
+        Initializes an instance of the TelegramWebhook construct
+        :param scope: Scope where this construct is included
+        :param _id: Unique identifier for this construct
+        :param api_key: Secret containing the API key for the Telegram bot
+        :param gateway_url: URL where the Telegram updates must be sent
+        :param allowed_updates: Update types sent by Telegram, every type except
+                                chat_member, message_reaction and
+                                message_reaction_count if not provided
+        :param max_connections: Maximum number of simultaneous connections Telegram
+                                opens to deliver updates, 40 if not provided
+        :param drop_pending_updates: Whether to drop the updates not delivered yet
+                                     when the webhook is set
+        :param secret_token: Whether Telegram must send a secret token, derived from
+                             the API key, with every update. The webhook must be
+                             set again after rotating the API key.
+        """
         super().__init__(scope, _id)
 
+        if max_connections is not None and not 1 <= max_connections <= 100:
+            raise ValueError("Maximum connections must be between 1 and 100")
+
         # Lambda that processes resource events and creates/updates/deletes
         # the webhook in the Telegram API
         self.provider_lambda = lambda_python_alpha.PythonFunction(
@@ -55,5 +84,11 @@ class TelegramWebhook(Construct):
             properties={
                 "ApiGatewayURL": gateway_url,
                 "TelegramSecretName": api_key.secret_name,
+                "AllowedUpdates": (
+                    list(allowed_updates) if allowed_updates is not None else None
+                ),
+                "MaxConnections": max_connections,
+                "DropPendingUpdates": str(drop_pending_updates).lower(),
+                "UseSecretToken": str(secret_token).lower(),
             },
         )
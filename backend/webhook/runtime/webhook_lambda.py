@@ -1,13 +1,74 @@
+import hashlib
+import hmac
+import json
+import os
+from typing import Any, Dict, List, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
 
 import boto3
-
-secrets_manager = boto3.client("secretsmanager")
-
-# URLs where the set/clear webhook HTTP requests must be sent
+from botocore.config import Config
+
+# Connection pool size and timeouts, in seconds, for the calls to each service.
+# They are named like the settings of the bot, such as TelegramPoolSize.
+TELEGRAM_POOL_SIZE = int(os.environ.get("TelegramPoolSize", "2"))
+TELEGRAM_TIMEOUT = (
+    float(os.environ.get("TelegramConnectTimeout", "3")),
+    float(os.environ.get("TelegramReadTimeout", "10")),
+)
+AWS_POOL_SIZE = int(os.environ.get("AwsPoolSize", "2"))
+AWS_CONNECT_TIMEOUT = float(os.environ.get("AwsConnectTimeout", "3"))
+AWS_READ_TIMEOUT = float(os.environ.get("AwsReadTimeout", "10"))
+
+secrets_manager = boto3.client(
+    "secretsmanager",
+    config=Config(
+        max_pool_connections=AWS_POOL_SIZE,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        tcp_keepalive=True,
+    ),
+)
+
+# Session shared by every invocation of a warm container, so that the connection
+# to the Telegram API is reused instead of performing a new TLS handshake
+session = requests.Session()
+session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=TELEGRAM_POOL_SIZE, pool_maxsize=TELEGRAM_POOL_SIZE),
+)
+
+# URLs where the set/clear/verify webhook HTTP requests must be sent
 _WEBHOOK_BASE_URL = "https://api.telegram.org/bot{}/"
 WEBHOOK_CLEAR_URL = _WEBHOOK_BASE_URL + "setWebHook"
-WEBHOOK_SET_URL = _WEBHOOK_BASE_URL + "setWebHook?url={}"
+WEBHOOK_SET_URL = _WEBHOOK_BASE_URL + "setWebHook"
+WEBHOOK_INFO_URL = _WEBHOOK_BASE_URL + "getWebhookInfo"
+
+
+class WebhookOptions:
+    """Optional settings of the webhook, as received in the resource properties"""
+
+    def __init__(self, properties: Dict[str, Any]):
+        """
+        Initializes a new WebhookOptions. CloudFormation passes every property of a
+        custom resource as a string, so they are converted here.
+        :param properties: Resource properties of the webhook
+        """
+        allowed_updates = properties.get("AllowedUpdates")
+        self.allowed_updates: Optional[List[str]] = (
+            list(allowed_updates) if allowed_updates is not None else None
+        )
+        max_connections = properties.get("MaxConnections")
+        self.max_connections: Optional[int] = (
+            int(max_connections) if max_connections else None
+        )
+        self.drop_pending_updates = (
+            str(properties.get("DropPendingUpdates", "false")).lower() == "true"
+        )
+        self.use_secret_token = (
+            str(properties.get("UseSecretToken", "false")).lower() == "true"
+        )
 
 
 def on_event(event, _):
@@ -19,41 +80,47 @@ def on_event(event, _):
     """
     print(event)
 
-    secret_name = event["ResourceProperties"]["TelegramSecretName"]
-    url = event["ResourceProperties"]["ApiGatewayURL"]
+    properties = event["ResourceProperties"]
+    secret_name = properties["TelegramSecretName"]
+    url = properties["ApiGatewayURL"]
+    options = WebhookOptions(properties)
 
     api_key = get_telegram_api_key(secret_name)
 
     request_type = event["RequestType"]
     if request_type == "Create":
-        return on_create(secret_name, api_key, url)
+        return on_create(secret_name, api_key, url, options)
     if request_type == "Update":
-        return on_update(secret_name, api_key, url)
+        return on_update(secret_name, api_key, url, options)
     if request_type == "Delete":
         return on_delete(secret_name, api_key, url)
     raise Exception("Invalid request type: %s" % request_type)
 
 
-def on_create(secret: str, api_key: str, api_gateway_url: str):
+def on_create(secret: str, api_key: str, api_gateway_url: str, options: WebhookOptions):
     """
     Handles the creation of a new Webhook resource
     :param secret: Name of the secret containing the Telegram API key
     :param api_key: Telegram API key to use
     :param api_gateway_url: URL where the Telegram updates must be sent
+    :param options: Optional settings of the webhook
     """
     print(f"Create webhook for url {api_gateway_url}")
-    set_webhook(api_key, api_gateway_url)
+    set_webhook(api_key, api_gateway_url, options)
+    verify_webhook(api_key, api_gateway_url, options)
 
 
-def on_update(secret: str, api_key: str, api_gateway_url: str):
+def on_update(secret: str, api_key: str, api_gateway_url: str, options: WebhookOptions):
     """
     Handles the updating of a Webhook resource
     :param secret: Name of the secret containing the Telegram API key
     :param api_key: Telegram API key to use
     :param api_gateway_url: URL where the Telegram updates must be sent
+    :param options: Optional settings of the webhook
     """
     print(f"Update webhook for url {api_gateway_url}")
-    set_webhook(api_key, api_gateway_url)
+    set_webhook(api_key, api_gateway_url, options)
+    verify_webhook(api_key, api_gateway_url, options)
 
 
 def on_delete(secret: str, api_key: str, api_gateway_url: str):
@@ -77,28 +144,83 @@ def get_telegram_api_key(secret_name: str) -> str:
     return secret_value["SecretString"]
 
 
-def set_webhook(api_key: str, gateway_url: str):
+def derive_webhook_secret_token(api_key: str) -> str:
+    """
+    Derive the secret token of the webhook from the API key of the bot. It must
+    match the derivation in the runtime of the bot, which validates the token.
+    :param api_key: API key for the Telegram bot
+    :return: String with the token, made of characters accepted by Telegram
+    """
+    return hmac.new(
+        api_key.encode(), b"telegram-webhook-secret-token", hashlib.sha256
+    ).hexdigest()
+
+
+def set_webhook(api_key: str, gateway_url: str, options: WebhookOptions):
     """
     Creates a webhook for the Telegram bot with the provided API key, pointing
     to the provided url
     :param api_key: API key of the bot where the webhook must be set
     :param gateway_url: URL where the Telegram updates must be sent
+    :param options: Optional settings of the webhook
     :raises Exception if any error occurs while setting the webhook
     """
-    response = requests.get(WEBHOOK_SET_URL.format(api_key, gateway_url))
+    params = {"url": gateway_url, "drop_pending_updates": options.drop_pending_updates}
+    # An empty list must be sent too, as it restores the default update types
+    if options.allowed_updates is not None:
+        params["allowed_updates"] = options.allowed_updates
+    if options.max_connections:
+        params["max_connections"] = options.max_connections
+    if options.use_secret_token:
+        params["secret_token"] = derive_webhook_secret_token(api_key)
+
+    response = session.post(
+        WEBHOOK_SET_URL.format(api_key),
+        json=params,
+        timeout=TELEGRAM_TIMEOUT,
+    )
 
     # If any error ocurred during webhook creation, raise an exception so that
     # CloudFormation receives a "FAILED" response
     response.raise_for_status()
 
 
+def verify_webhook(api_key: str, gateway_url: str, options: WebhookOptions):
+    """
+    Checks that the webhook of the bot has the expected configuration
+    :param api_key: API key of the bot whose webhook must be checked
+    :param gateway_url: URL where the Telegram updates must be sent
+    :param options: Optional settings of the webhook
+    :raises Exception if the webhook does not have the expected configuration
+    """
+    response = session.get(WEBHOOK_INFO_URL.format(api_key), timeout=TELEGRAM_TIMEOUT)
+    response.raise_for_status()
+    info = response.json()["result"]
+    print(f"Webhook info: {json.dumps(info)}")
+
+    mismatches = []
+    if info.get("url") != gateway_url:
+        mismatches.append(f"url is {info.get('url')}")
+    # Telegram omits allowed_updates when every update type is allowed
+    if options.allowed_updates and set(info.get("allowed_updates", [])) != set(
+        options.allowed_updates
+    ):
+        mismatches.append(f"allowed_updates are {info.get('allowed_updates')}")
+    if options.max_connections and info.get("max_connections") != (
+        options.max_connections
+    ):
+        mismatches.append(f"max_connections is {info.get('max_connections')}")
+    if mismatches:
+        raise Exception(f"Webhook was not configured as expected: {mismatches}")
+
+
 def clear_webhook(api_key: str):
     """
     Removes the existing webhook for the Telegram bot with the provided API key
     :param api_key: API key of the bot where the webhook must be removed
     :raises Exception if any error occurs while clearing the webhook
     """
-    response = requests.get(WEBHOOK_CLEAR_URL.format(api_key))
+    response = session.get(WEBHOOK_CLEAR_URL.format(api_key), timeout=TELEGRAM_TIMEOUT)
 
     # If any error ocurred during webhook creation, raise an exception so that
     # CloudFormation receives a "FAILED" response
@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from telegram import User
+from telegram.ext import ExtBot
+
+# The runtime modules import each other as top-level modules, as they do in the
+# Lambda functions, and read their configuration from the environment on import
+RUNTIME_DIR = Path(__file__).resolve().parents[2] / "backend" / "api" / "runtime"
+sys.path.insert(0, str(RUNTIME_DIR))
+
+os.environ.setdefault("AllowedUsers", "user")
+os.environ.setdefault("TelegramSecretName", "telegram")
+os.environ.setdefault("NotionSecretName", "notion")
+os.environ.setdefault("NotionCalendarID", "calendar")
+os.environ.setdefault(
+    "LocalSecrets", json.dumps({"telegram": "123:telegram-key", "notion": "notion"})
+)
+os.environ.setdefault("Metrics", "false")
+# The AWS clients created on import need a region, although they are never called
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-1")
+
+
+class FakeClock:
+    """Clock that only moves when a test sets its time"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """Clock for the component under test, starting at 0"""
+    return FakeClock()
+
+
+@pytest.fixture
+def make_event():
+    """Factory of events, with placeholder values for the fields not given"""
+    from notion.model import DateRange, NotionEvent
+
+    def make(
+        title: str = "Reunión",
+        start: datetime = datetime(2026, 10, 20, 18),
+        end: Optional[datetime] = None,
+        **fields,
+    ) -> NotionEvent:
+        fields = {
+            "event_type": "Reunión",
+            "location": "Local",
+            "scouters": [],
+            "participant_num": 0,
+            "url": "https://notion.so/event",
+            **fields,
+        }
+        return NotionEvent(title, DateRange(start, end), **fields)
+
+    return make
+
+
+BOT_USER = User(id=1, first_name="Bot", is_bot=True, username="bot")
+
+
+@pytest.fixture
+def application(monkeypatch):
+    """Bot application used by the handlers, initialized without calling Telegram"""
+    # Imported once the environment is set, as they read it on import
+    import config
+    import router_lambda
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = BOT_USER
+        return BOT_USER
+
+    monkeypatch.setattr(ExtBot, "get_me", get_me)
+    application = router_lambda.build_application(config.get_telegram_api_key())
+    monkeypatch.setattr(router_lambda, "application", application)
+    yield application
+    router_lambda.shutdown_runtime()
@@ -0,0 +1,44 @@
+import httpx
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from notion import api
+
+
+def http_error(status: int, headers=None) -> HTTPResponseError:
+    request = httpx.Request("POST", "https://api.notion.com/v1/databases/query")
+    return HTTPResponseError(httpx.Response(status, headers=headers, request=request))
+
+
+def test_rate_limited_requests_wait_for_retry_after():
+    delay = api.retry_delay(http_error(429, {"Retry-After": "1"}), attempt=1)
+
+    assert 1 <= delay <= 1 + api.RETRY_BASE_DELAY
+
+
+def test_transient_errors_back_off_exponentially():
+    for attempt in (1, 2):
+        delay = api.retry_delay(RequestTimeoutError(), attempt)
+        assert 0 <= delay <= api.RETRY_BASE_DELAY * 2**attempt
+
+
+def test_requests_are_not_retried_forever_or_for_too_long():
+    assert api.retry_delay(RequestTimeoutError(), api.MAX_ATTEMPTS) is None
+    assert api.retry_delay(http_error(429, {"Retry-After": "60"}), 1) is None
+
+
+def test_client_errors_are_not_retried():
+    assert api.retry_delay(http_error(400), 1) is None
+    assert api.retry_delay(ValueError(), 1) is None
+
+
+def test_failed_requests_are_retried(monkeypatch):
+    monkeypatch.setattr(api.time, "sleep", lambda seconds: None)
+    outcomes = iter([RequestTimeoutError(), {"results": []}])
+
+    def request():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert api._with_retry(request) == {"results": []}
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from notion.cache import StaleWhileRevalidateCache
+
+
+def make_cache(clock, ttl=10, stale_ttl=20, max_entries=4):
+    return StaleWhileRevalidateCache(
+        ttl=ttl, stale_ttl=stale_ttl, max_entries=max_entries, clock=clock
+    )
+
+
+def value(result):
+    """Loader returning a fixed value"""
+
+    async def loader():
+        return result
+
+    return loader
+
+
+async def not_loaded():
+    pytest.fail("key is cached")
+
+
+def get(cache, key, loader):
+    return asyncio.run(cache.get_or_load(key, loader))
+
+
+def test_fresh_entries_are_served_without_loading(clock):
+    cache = make_cache(clock)
+    loads = []
+
+    async def loader():
+        loads.append(clock.now)
+        return len(loads)
+
+    assert get(cache, "key", loader) == 1
+    clock.now = 9
+    assert get(cache, "key", loader) == 1
+    assert loads == [0]
+
+
+def test_stale_entries_are_served_while_refreshed_in_a_referenced_task(clock):
+    cache = make_cache(clock)
+    cache.put("key", "old")
+
+    async def main():
+        clock.now = 15
+        assert await cache.get_or_load("key", value("new")) == "old"
+        assert len(cache._refresh_tasks) == 1
+        await asyncio.gather(*cache._refresh_tasks)
+
+    asyncio.run(main())
+    assert not cache._refresh_tasks
+    assert get(cache, "key", not_loaded) == "new"
+
+
+def test_expired_entries_are_loaded_before_returning(clock):
+    cache = make_cache(clock)
+    cache.put("key", "old")
+
+    clock.now = 31
+    assert get(cache, "key", value("new")) == "new"
+
+
+def test_failed_refresh_keeps_the_stale_value(clock):
+    cache = make_cache(clock)
+    cache.put("key", "old")
+
+    async def loader():
+        raise RuntimeError("Notion is down")
+
+    clock.now = 15
+    asyncio.run(cache._refresh("key", loader))
+    assert not cache._refreshing
+    assert get(cache, "key", value("new")) == "old"
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = make_cache(clock, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    get(cache, "a", not_loaded)
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert get(cache, "a", value("reloaded")) == 1
+    assert get(cache, "b", value("reloaded")) == "reloaded"
+
+
+def test_zero_ttl_disables_the_cache(clock):
+    cache = make_cache(clock, ttl=0)
+
+    assert get(cache, "key", value(1)) == 1
+    assert get(cache, "key", value(2)) == 2
+    assert len(cache) == 0
+
+
+def test_invalidate_removes_entries(clock):
+    cache = make_cache(clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+
+    cache.invalidate("a")
+    assert get(cache, "a", value("reloaded")) == "reloaded"
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_concurrent_loads_share_a_single_call(clock):
+    cache = make_cache(clock)
+    calls = []
+
+    async def loader():
+        calls.append(None)
+        await asyncio.sleep(0)
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_load("key", loader) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == [1] * 5
+    assert len(calls) == 1
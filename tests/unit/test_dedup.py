@@ -0,0 +1,80 @@
+from dedup import InMemoryStore, UpdateDeduplicator
+
+
+class CountingStore(InMemoryStore):
+    def __init__(self, clock):
+        super().__init__(ttl=100, lease=10, clock=clock)
+        self.claims = 0
+
+    def claim(self, update_id):
+        self.claims += 1
+        return super().claim(update_id)
+
+
+class UnreachableStore:
+    def claim(self, update_id):
+        raise ConnectionError("DynamoDB is unreachable")
+
+    complete = release = claim
+
+
+def test_updates_are_reserved_while_processed(clock):
+    store = InMemoryStore(ttl=100, lease=10, clock=clock)
+
+    assert store.claim(1)
+    clock.now = 9
+    assert not store.claim(1)
+
+
+def test_updates_whose_processing_crashed_are_claimed_again(clock):
+    store = InMemoryStore(ttl=100, lease=10, clock=clock)
+    store.claim(1)
+
+    # The invocation holding the lease timed out without completing the update
+    clock.now = 11
+    assert store.claim(1)
+
+
+def test_processed_updates_are_remembered_for_the_ttl(clock):
+    store = InMemoryStore(ttl=100, lease=10, clock=clock)
+    store.claim(1)
+    store.complete(1)
+
+    clock.now = 99
+    assert not store.claim(1)
+    clock.now = 101
+    assert store.claim(1)
+
+
+def test_released_updates_are_claimed_again(clock):
+    store = InMemoryStore(ttl=100, lease=10, clock=clock)
+    store.claim(1)
+    store.release(1)
+
+    assert store.claim(1)
+
+
+def test_processed_updates_are_discarded_without_calling_the_store(clock):
+    store = CountingStore(clock)
+    deduplicator = UpdateDeduplicator(store, max_entries=2)
+
+    assert deduplicator.claim(1)
+    deduplicator.complete(1)
+    assert not deduplicator.claim(1)
+    assert store.claims == 1
+
+
+def test_updates_are_processed_when_the_store_is_unreachable():
+    deduplicator = UpdateDeduplicator(UnreachableStore(), max_entries=2)
+
+    assert deduplicator.claim(1)
+    deduplicator.complete(1)
+    deduplicator.release(1)
+    assert deduplicator.claim(1)
+
+
+def test_updates_without_identifier_are_always_processed(clock):
+    deduplicator = UpdateDeduplicator(InMemoryStore(100, 10, clock), max_entries=2)
+
+    assert deduplicator.claim(None)
+    assert deduplicator.claim(None)
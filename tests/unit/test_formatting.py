@@ -0,0 +1,57 @@
+from datetime import date, datetime
+
+import pytest
+
+from notion import formatting
+from notion.formatting import SPANISH, DateFormatter, get_formatter
+
+
+def test_dates_are_described_in_spanish():
+    assert SPANISH.describe(date(2024, 5, 3)) == "viernes 3 de mayo"
+    assert SPANISH.describe(datetime(2024, 12, 29, 18)) == "domingo 29 de diciembre"
+
+
+def test_ranges_use_a_template_for_each_kind():
+    start, end = date(2024, 7, 1), date(2024, 7, 10)
+
+    assert SPANISH.format_range(start, None) == "El lunes 1 de julio"
+    assert (
+        SPANISH.format_range(start, end)
+        == "Del lunes 1 de julio al miércoles 10 de julio"
+    )
+
+
+def test_names_are_looked_up_within_their_bounds():
+    assert SPANISH.get_weekday_name(6) == "domingo"
+    assert SPANISH.get_month_name(1) == "enero"
+    with pytest.raises(ValueError):
+        SPANISH.get_weekday_name(7)
+    with pytest.raises(ValueError):
+        SPANISH.get_month_name(0)
+
+
+def test_formatters_need_every_name():
+    with pytest.raises(ValueError):
+        DateFormatter(["lunes"], SPANISH.month_names, "", "", "")
+    with pytest.raises(ValueError):
+        DateFormatter(SPANISH.weekday_names, ["enero"], "", "", "")
+
+
+def test_formatters_are_registered_per_language(monkeypatch):
+    english = DateFormatter(
+        ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+        ["January", "February", "March", "April", "May", "June", "July"]
+        + ["August", "September", "October", "November", "December"],
+        "{weekday}, {month} {day}",
+        "On {date}",
+        "From {start} to {end}",
+    )
+    monkeypatch.setattr(formatting, "_formatters", {"es": SPANISH})
+    formatting.register_formatter("en", english)
+
+    assert get_formatter() is SPANISH
+    assert get_formatter("en").format_range(date(2024, 5, 3), None) == (
+        "On Friday, May 3"
+    )
+    with pytest.raises(ValueError):
+        get_formatter("it")
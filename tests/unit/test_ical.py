@@ -0,0 +1,49 @@
+from datetime import datetime, UTC
+
+from ical import MAX_LINE_OCTETS, build_feed, etag_matches, fold
+
+
+def test_edits_within_the_same_minute_change_the_etag(make_event):
+    start = datetime(2024, 5, 3, 9, tzinfo=UTC)
+    # Notion reports both edits with the same last edit time
+    edited = {"event_id": "a", "last_edited_time": "2024-04-30T10:00:00.000Z"}
+    before = build_feed([make_event("Uscita", start, **edited)])
+    after = build_feed([make_event("Uscita al lago", start, **edited)])
+
+    assert before.etag != after.etag
+    assert build_feed([make_event("Uscita", start, **edited)]).etag == before.etag
+
+
+def test_etags_match_with_weak_comparison():
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"other", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"other"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_long_lines_are_folded_without_splitting_characters():
+    line = "SUMMARY:" + "è" * 60
+
+    folded = fold(line)
+
+    parts = folded.removesuffix("\r\n").split("\r\n")
+    assert all(len(part.encode()) <= MAX_LINE_OCTETS for part in parts)
+    assert "".join(part.removeprefix(" ") for part in parts) == line
+
+
+def test_all_day_events_end_on_the_following_day(make_event):
+    event = make_event(
+        "Campo",
+        datetime(2024, 7, 1),
+        datetime(2024, 7, 10),
+        event_type="Uscita",
+        scouters=["Akela", "Baloo"],
+        participant_num=20,
+    )
+
+    body = build_feed([event]).body
+
+    assert "DTSTART;VALUE=DATE:20240701\r\n" in body
+    assert "DTEND;VALUE=DATE:20240711\r\n" in body
+    assert "DESCRIPTION:Uscita\\nScouters: Akela\\, Baloo\\nEducandos: 20\r\n" in body
@@ -0,0 +1,30 @@
+from datetime import date, datetime
+
+from notion.index import DayIndex
+
+
+def test_events_are_indexed_under_every_day_they_last(make_event):
+    camp = make_event("Campamento", datetime(2026, 10, 30), datetime(2026, 11, 1))
+    meeting = make_event("Reunión", datetime(2026, 10, 31, 18))
+
+    index = DayIndex([camp, meeting])
+
+    assert index.days() == [date(2026, 10, 30), date(2026, 10, 31), date(2026, 11, 1)]
+    assert index.events_on(date(2026, 10, 31)) == [camp, meeting]
+    assert index.events_on(date(2026, 11, 1)) == [camp]
+    assert len(index) == 3
+
+
+def test_days_outside_the_window_are_ignored(make_event):
+    camp = make_event("Campamento", datetime(2026, 10, 28), datetime(2026, 11, 3))
+
+    index = DayIndex([camp], date(2026, 10, 30), date(2026, 11, 1))
+
+    assert list(index) == [date(2026, 10, 30), date(2026, 10, 31), date(2026, 11, 1)]
+
+
+def test_days_without_events_are_empty():
+    index = DayIndex([])
+
+    assert not index
+    assert index.events_on(date(2026, 10, 30)) == []
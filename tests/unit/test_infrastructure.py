@@ -1,15 +1,228 @@
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
+from aws_cdk import aws_lambda as _lambda
 
+from backend.api.infrastructure import PerformanceProfile
 from backend.component import EscultoideBot
 
-# # example tests. To run these tests, uncomment this file along with the example
-# # resource in escultoide_bot/escultoide_bot_stack.py
-# def test_sqs_queue_created():
-#     app = core.App()
-#     stack = EscultoideBot(app, "escultoide-bot")
-#     template = assertions.Template.from_stack(stack)
-#
-# #     template.has_resource_properties("AWS::SQS::Queue", {
-# #         "VisibilityTimeout": 300
-# #     })
+
+def synth(**kwargs) -> assertions.Template:
+    # Skip the Docker bundling of the functions, only the template is checked
+    app = core.App(context={"aws:cdk:bundling-stacks": []})
+    stack = EscultoideBot(
+        app,
+        "escultoide-bot",
+        telegram_secret_name="telegram",
+        notion_secret_name="notion",
+        notion_calendar_id="calendar",
+        allowed_users=["user"],
+        **kwargs,
+    )
+    return assertions.Template.from_stack(stack)
+
+
+def test_bot_lambda_uses_default_profile():
+    template = synth()
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "router_lambda.handler",
+            "Architectures": ["arm64"],
+            "MemorySize": 512,
+        },
+    )
+    template.resource_count_is("AWS::Lambda::Alias", 0)
+
+
+def test_bot_lambda_uses_custom_profile():
+    template = synth(
+        performance=PerformanceProfile(
+            architecture=_lambda.Architecture.X86_64, memory_size=1024
+        )
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "router_lambda.handler",
+            "Architectures": ["x86_64"],
+            "MemorySize": 1024,
+        },
+    )
+
+
+def test_provisioned_concurrency_is_served_through_alias():
+    template = synth(performance=PerformanceProfile(provisioned_concurrency=2))
+
+    template.has_resource_properties(
+        "AWS::Lambda::Alias",
+        {
+            "Name": "live",
+            "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2},
+        },
+    )
+    # The API Gateway must invoke the alias, or the provisioned environments are
+    # never used
+    alias_id = next(iter(template.find_resources("AWS::Lambda::Alias")))
+    template.has_resource_properties(
+        "AWS::ApiGateway::Method",
+        {
+            "HttpMethod": "POST",
+            "Integration": {
+                "Uri": {
+                    "Fn::Join": [
+                        "",
+                        assertions.Match.array_with([{"Ref": alias_id}]),
+                    ]
+                }
+            },
+        },
+    )
+
+
+def test_provisioned_concurrency_alias_receives_queued_updates():
+    template = synth(
+        batch_ingestion=True,
+        performance=PerformanceProfile(provisioned_concurrency=1),
+    )
+
+    # The mapping refers to the alias by its qualified function name
+    template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {"FunctionName": {"Fn::Join": ["", assertions.Match.array_with([":live"])]}},
+    )
+
+
+def test_updates_are_reserved_longer_than_the_bot_lambda_runs():
+    template = synth()
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "router_lambda.handler",
+            "Timeout": 3,
+            "Environment": {
+                "Variables": assertions.Match.object_like({"DedupLease": "8"})
+            },
+        },
+    )
+
+
+def test_queued_updates_are_processed_in_order_per_chat():
+    template = synth(batch_ingestion=True)
+
+    queues = template.find_resources("AWS::SQS::Queue")
+    assert len(queues) == 2
+    assert all(queue["Properties"]["FifoQueue"] for queue in queues.values())
+    template.has_resource_properties(
+        "AWS::ApiGateway::Method",
+        {
+            "HttpMethod": "POST",
+            "Integration": {
+                "RequestTemplates": {
+                    "application/json": assertions.Match.string_like_regexp(
+                        r"&MessageGroupId=\$util\.urlEncode\(\$group\)"
+                    )
+                }
+            },
+        },
+    )
+    # Every update of a batch may come from the same chat, so batches get a
+    # longer timeout and lease than single updates
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "router_lambda.batch_handler",
+            "Timeout": 30,
+            "Environment": {
+                "Variables": assertions.Match.object_like({"DedupLease": "35"})
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::SQS::Queue",
+        {"VisibilityTimeout": 180, "RedrivePolicy": assertions.Match.any_value()},
+    )
+
+
+def test_calendar_sync_feeds_the_bot_lambda():
+    template = synth(calendar_sync_interval=core.Duration.minutes(5))
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function", {"Handler": "calendar_sync.handler"}
+    )
+    template.has_resource_properties(
+        "AWS::Events::Rule", {"ScheduleExpression": "rate(5 minutes)"}
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "router_lambda.handler",
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {
+                        "EventStoreTableName": assertions.Match.any_value(),
+                        "EventStoreMaxAge": "900",
+                    }
+                )
+            },
+        },
+    )
+
+
+def test_calendar_feed_is_cached_and_reachable_from_anywhere():
+    template = synth(calendar_feed=True)
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function", {"Handler": "ical.handler"}
+    )
+    template.has_resource_properties(
+        "AWS::ApiGateway::Method",
+        {
+            "HttpMethod": "GET",
+            "Integration": {
+                "CacheKeyParameters": [
+                    "method.request.querystring.token",
+                    "method.request.header.If-None-Match",
+                ]
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::ApiGateway::Stage",
+        {
+            "CacheClusterEnabled": True,
+            "MethodSettings": assertions.Match.array_with(
+                [
+                    assertions.Match.object_like(
+                        {"ResourcePath": "/~1calendar.ics", "CachingEnabled": True}
+                    )
+                ]
+            ),
+        },
+    )
+    # Only the feed is left out of the Telegram IP restriction
+    template.has_resource_properties(
+        "AWS::ApiGateway::RestApi",
+        {
+            "Policy": {
+                "Statement": assertions.Match.array_with(
+                    [
+                        assertions.Match.object_like(
+                            {
+                                "Effect": "Deny",
+                                "NotResource": "execute-api:/*/GET/calendar.ics",
+                            }
+                        )
+                    ]
+                )
+            }
+        },
+    )
+
+
+def test_negative_provisioned_concurrency_is_rejected():
+    with pytest.raises(ValueError):
+        PerformanceProfile(provisioned_concurrency=-1)
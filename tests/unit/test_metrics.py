@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    """Metrics written to the log, starting from a cold invocation"""
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "_totals", {})
+    monkeypatch.setattr(metrics, "_cold_start", True)
+
+
+def test_spans_add_up_the_time_of_each_phase(enabled):
+    for _ in range(3):
+        with metrics.span(metrics.PAGE_PARSE):
+            pass
+    metrics.record(metrics.NOTION_QUERY, 12.5)
+    metrics.record(metrics.NOTION_QUERY, 2.5)
+
+    record = json.loads(metrics.flush({"UpdateId": 7}))
+
+    assert record["NotionQuery"] == 15.0
+    assert record["PageParse"] >= 0
+    assert record["UpdateId"] == 7
+    assert record["FunctionName"] == metrics.FUNCTION_NAME
+    (directive,) = record["_aws"]["CloudWatchMetrics"]
+    assert directive["Dimensions"] == [["FunctionName"]]
+    assert [metric["Name"] for metric in directive["Metrics"]] == [
+        "PageParse",
+        "NotionQuery",
+    ]
+
+
+def test_only_the_first_invocation_is_a_cold_start(enabled):
+    first = json.loads(metrics.flush())
+    second = json.loads(metrics.flush())
+
+    assert (first["ColdStart"], second["ColdStart"]) == (True, False)
+    # Totals are reset between invocations
+    assert second["_aws"]["CloudWatchMetrics"][0]["Metrics"] == []
+
+
+def test_nothing_is_written_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    metrics.record(metrics.RENDER, 1)
+
+    assert metrics.flush() is None
+    assert metrics._totals == {}
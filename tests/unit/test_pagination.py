@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from notion import api, async_api
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """Stand-in for the database queries, answering with pages 0 to 249"""
+    requests = []
+
+    def query_database(params):
+        requests.append(params)
+        start = int(params.get("start_cursor") or 0)
+        end = min(start + params["page_size"], 250)
+        return {
+            "results": [{"id": str(index)} for index in range(start, end)],
+            "has_more": end < 250,
+            "next_cursor": str(end) if end < 250 else None,
+        }
+
+    monkeypatch.setattr(api, "query_database", query_database)
+    monkeypatch.setattr(api, "get_property_ids", lambda: ["title", "%3Adate"])
+    return requests
+
+
+def test_pagination_cursors_are_followed(responses):
+    pages = list(api.iter_pages({"filter": {}}))
+
+    assert [page["id"] for page in pages] == [str(index) for index in range(250)]
+    assert [request.get("start_cursor") for request in responses] == [
+        None,
+        "100",
+        "200",
+    ]
+    assert responses[0]["filter_properties"] == ["title", "%3Adate"]
+
+
+def test_pages_are_only_fetched_as_far_as_consumed(responses):
+    pages = api.iter_pages({}, page_size=10)
+
+    assert next(pages)["id"] == "0"
+    assert len(responses) == 1
+
+
+def test_limit_caps_the_page_size_and_the_requests(responses):
+    pages = list(api.iter_pages({}, page_size=100, limit=120))
+
+    assert len(pages) == 120
+    assert [request["page_size"] for request in responses] == [100, 20]
+
+
+def test_invalid_page_sizes_are_rejected(responses):
+    with pytest.raises(ValueError):
+        next(api.iter_pages({}, page_size=101))
+
+
+def test_async_pagination_shares_the_requests_of_the_sync_one(responses, monkeypatch):
+    async def query_database(params):
+        return api.query_database(params)
+
+    async def get_property_ids():
+        return api.get_property_ids()
+
+    monkeypatch.setattr(async_api, "query_database", query_database)
+    monkeypatch.setattr(async_api, "get_property_ids", get_property_ids)
+
+    async def main():
+        return [page["id"] async for page in async_api.iter_pages({}, limit=120)]
+
+    assert asyncio.run(main()) == [str(index) for index in range(120)]
+    assert [request["page_size"] for request in responses] == [100, 20]
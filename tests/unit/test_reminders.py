@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+from telegram.error import Forbidden, RetryAfter
+
+import reminders
+
+
+class FakeBot:
+    """Stand-in for the bot, failing the sends to some chats with given errors"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def broadcast(bot, chat_ids, texts):
+    sender = reminders.BroadcastSender(
+        bot, global_rate=1000, chat_rate=1000, concurrency=2
+    )
+    return asyncio.run(sender.broadcast(chat_ids, texts))
+
+
+def test_every_chat_gets_the_messages_in_order():
+    bot = FakeBot()
+
+    assert broadcast(bot, [1, 2, 3], ["a", "b"]) == 0
+    for chat_id in (1, 2, 3):
+        assert [text for chat, text in bot.sent if chat == chat_id] == ["a", "b"]
+
+
+def test_failed_chats_are_counted_without_stopping_the_rest():
+    bot = FakeBot({1: [Forbidden("bot was kicked")], 2: [ValueError("invalid")]})
+
+    assert broadcast(bot, [1, 2, 3], ["a", "b"]) == 2
+    assert bot.sent == [(3, "a"), (3, "b")]
+
+
+def test_messages_are_sent_again_when_telegram_asks_to_retry():
+    bot = FakeBot({1: [RetryAfter(0)], 2: [RetryAfter(0)] * reminders.MAX_ATTEMPTS})
+
+    assert broadcast(bot, [1, 2], ["a"]) == 1
+    assert bot.sent == [(1, "a")]
+
+
+def test_upcoming_reminders_only_query_the_days_of_the_window(monkeypatch, make_event):
+    now = datetime(2024, 5, 3, 20, tzinfo=UTC)
+    events = [
+        make_event("Started", now - timedelta(minutes=1)),
+        make_event("Tonight", now + timedelta(hours=1)),
+        # All-day events are in the time zone of the calendar
+        make_event("Tomorrow", datetime(2024, 5, 4)),
+        make_event("Later", now + timedelta(hours=24)),
+    ]
+    queries = []
+
+    async def iter_pages(query):
+        queries.append(query)
+        for event in events:
+            yield event
+
+    monkeypatch.setattr(reminders.async_api, "iter_pages", iter_pages)
+    # The stand-in yields the events themselves instead of pages
+    monkeypatch.setattr(
+        reminders, "NotionEvent", SimpleNamespace(from_page=lambda e: e)
+    )
+
+    upcoming = asyncio.run(reminders.get_upcoming_reminders(now, timedelta(hours=24)))
+
+    assert len(upcoming) == 2
+    assert "Tonight" in upcoming[0] and "Tomorrow" in upcoming[1]
+    assert [condition["date"] for condition in queries[0]["filter"]["and"]] == [
+        {"on_or_after": "2024-05-03"},
+        {"on_or_before": "2024-05-04"},
+    ]
@@ -0,0 +1,79 @@
+import pytest
+
+from notion.model import NotionEvent
+from rendering import EDIT_SETTLE_TIME, RenderCache
+
+EDITED = "2026-10-17T10:00:00.000Z"
+# Unix time of EDITED
+EDITED_AT = 1792231200
+# Page every rendered event comes from, unless a test changes it
+PAGE = {"event_id": "event", "last_edited_time": EDITED}
+
+
+@pytest.fixture
+def cache():
+    cache = RenderCache(max_entries=2, clock=lambda: cache.now)
+    cache.now = EDITED_AT + EDIT_SETTLE_TIME
+    calls = []
+
+    @cache.register("title")
+    def render_title(event: NotionEvent) -> str:
+        calls.append(event.title)
+        return f"{event.title} @ {event.date.start.isoformat()}"
+
+    cache.calls = calls
+    return cache
+
+
+def test_unchanged_events_are_rendered_once(cache, make_event):
+    assert (
+        cache.render("title", make_event("Salida", **PAGE))
+        == "Salida @ 2026-10-20T18:00:00"
+    )
+    assert (
+        cache.render("title", make_event("Salida", **PAGE))
+        == "Salida @ 2026-10-20T18:00:00"
+    )
+    assert cache.calls == ["Salida"]
+
+
+def test_edits_are_rendered_again(cache, make_event):
+    cache.render("title", make_event("Salida", **PAGE))
+
+    edited = make_event(
+        "Salida al monte", event_id="event", last_edited_time="2026-10-17T10:05:00.000Z"
+    )
+    assert cache.render("title", edited).startswith("Salida al monte")
+    assert cache.calls == ["Salida", "Salida al monte"]
+
+
+def test_recently_edited_events_are_not_cached(cache, make_event):
+    # Notion reports the same last_edited_time for edits within the same minute
+    cache.now = EDITED_AT + EDIT_SETTLE_TIME - 1
+    cache.render("title", make_event("Salida", **PAGE))
+
+    assert cache.render("title", make_event("Salida al monte", **PAGE)).startswith(
+        "Salida al monte"
+    )
+    assert cache.calls == ["Salida", "Salida al monte"]
+
+
+def test_events_without_a_page_are_not_cached(cache, make_event):
+    cache.render("title", make_event("Salida", event_id=None))
+    cache.render("title", make_event("Salida", event_id=None))
+
+    assert cache.calls == ["Salida", "Salida"]
+
+
+def test_least_recently_used_renders_are_evicted(cache, make_event):
+    for title in ["a", "b", "a", "c", "a", "b"]:
+        cache.render(
+            "title", make_event(title, event_id=title, last_edited_time=EDITED)
+        )
+
+    assert cache.calls == ["a", "b", "c", "b"]
+
+
+def test_renderer_names_are_unique(cache):
+    with pytest.raises(ValueError):
+        cache.register("title")(lambda event: "")
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import router_lambda
+
+
+@pytest.fixture
+def failing_handler(application):
+    """Handler that fails for the messages saying "fail" """
+
+    async def fail(update: Update, context):
+        if update.message and update.message.text == "fail":
+            raise RuntimeError("Notion is unreachable")
+
+    application.add_handler(TypeHandler(Update, fail), group=1)
+
+
+def make_record(update_id: int, chat_id: int, text: str) -> dict:
+    update = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U"},
+            "text": text,
+        },
+    }
+    return {"messageId": f"m{update_id}", "body": json.dumps(update)}
+
+
+def failed_ids(response: dict) -> set:
+    return {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+
+
+def test_batch_reports_updates_whose_handlers_fail(failing_handler):
+    records = [
+        make_record(101, chat_id=1, text="fail"),
+        make_record(102, chat_id=1, text="ok"),
+        make_record(103, chat_id=2, text="ok"),
+    ]
+
+    response = router_lambda.batch_handler({"Records": records}, None)
+
+    # Later updates from the same chat are retried too, to keep their order
+    assert failed_ids(response) == {"m101", "m102"}
+
+
+def test_batch_without_failures_reports_none(failing_handler):
+    records = [make_record(111, chat_id=1, text="ok")]
+
+    response = router_lambda.batch_handler({"Records": records}, None)
+
+    assert response == {"batchItemFailures": []}
+
+
+def test_malformed_batch_items_do_not_fail_the_rest(application):
+    processed = []
+
+    async def record(update: Update, context):
+        processed.append(update.update_id)
+
+    application.add_handler(TypeHandler(Update, record), group=1)
+    malformed = {"update_id": 151, "message": {"chat": 5}}
+    records = [
+        {"messageId": "m151", "body": json.dumps(malformed)},
+        {"messageId": "m152", "body": "{"},
+        make_record(153, chat_id=1, text="ok"),
+    ]
+
+    response = router_lambda.batch_handler({"Records": records}, None)
+
+    # Malformed updates would fail again on every delivery, so they are dropped
+    assert response == {"batchItemFailures": []}
+    assert processed == [153]
+
+
+def test_failed_batch_items_are_processed_when_delivered_again(failing_handler):
+    record = make_record(121, chat_id=1, text="fail")
+    router_lambda.batch_handler({"Records": [record]}, None)
+
+    response = router_lambda.batch_handler({"Records": [record]}, None)
+
+    # Discarding it as a duplicate would delete it from the queue
+    assert failed_ids(response) == {"m121"}
+
+
+def test_processed_batch_items_are_discarded_when_delivered_again(
+    application, monkeypatch
+):
+    processed = []
+
+    async def record(update: Update, context):
+        processed.append(update.update_id)
+
+    application.add_handler(TypeHandler(Update, record), group=1)
+    batch = {"Records": [make_record(131, chat_id=1, text="ok")]}
+
+    router_lambda.batch_handler(batch, None)
+    router_lambda.batch_handler(batch, None)
+
+    assert processed == [131]
+
+
+def test_failed_webhook_updates_are_processed_when_delivered_again(
+    failing_handler,
+):
+    update = json.loads(make_record(141, chat_id=1, text="fail")["body"])
+
+    assert router_lambda.handler(update, None) == {"statusCode": 200}
+    assert router_lambda.deduplicator.claim(141)
@@ -0,0 +1,125 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from notion import schema
+from notion.model import NotionEvent
+from notion.schema import DEFAULT_MAPPINGS, EventSchema, PropertyMapping
+
+
+def text(*parts):
+    return [{"plain_text": part} for part in parts]
+
+
+def make_page(event_type=None):
+    return {
+        "id": "page",
+        "url": "https://notion.so/page",
+        "last_edited_time": "2024-04-30T10:00:00.000Z",
+        "properties": {
+            "Name": {"type": "title", "title": text("Uscita ", "al ", "lago")},
+            "Fecha": {
+                "type": "date",
+                "date": {"start": "2024-05-03", "end": "2024-05-05"},
+            },
+            "Tipo": {"type": "select", "select": event_type},
+            "Lugar": {"type": "rich_text", "rich_text": []},
+            "Scouters asistentes": {
+                "type": "multi_select",
+                "multi_select": [{"name": "Akela"}, {"name": "Baloo"}],
+            },
+            "Educandos asistentes": {
+                "type": "relation",
+                "relation": [{"id": "a"}, {"id": "b"}, {"id": "c"}],
+            },
+            # Properties without a mapping are ignored
+            "Notas": {"type": "rich_text", "rich_text": text("Portare il pranzo")},
+        },
+    }
+
+
+def make_database(**changes):
+    properties = {
+        mapping.name: {"id": f"id-{index}", "type": mapping.type}
+        for index, mapping in enumerate(DEFAULT_MAPPINGS)
+    }
+    properties.update(changes)
+    return {"properties": properties}
+
+
+def test_events_are_built_from_the_mapped_properties():
+    event = NotionEvent.from_page(make_page({"name": "Uscita"}))
+
+    # Titles made of several rich text parts are joined
+    assert event.title == "Uscita al lago"
+    assert (event.date.start, event.date.end) == (
+        datetime(2024, 5, 3),
+        datetime(2024, 5, 5),
+    )
+    assert event.type == "Uscita"
+    assert event.location == ""
+    assert event.scouters == ("Akela", "Baloo")
+    assert event.participant_num == 3
+    assert (event.id, event.last_edited_time) == ("page", "2024-04-30T10:00:00.000Z")
+
+
+def test_empty_selects_are_read_as_empty_strings():
+    assert NotionEvent.from_page(make_page(event_type=None)).type == ""
+
+
+def test_property_names_can_be_overridden(monkeypatch):
+    monkeypatch.setenv("NotionPropertyNames", json.dumps({"location": "Sitio"}))
+    page = make_page()
+    page["properties"]["Sitio"] = page["properties"].pop("Lugar")
+
+    event_schema = schema.load_schema()
+
+    assert event_schema.property_name("location") == "Sitio"
+    assert event_schema.parse(page["properties"])["location"] == ""
+
+
+def test_unsupported_property_types_are_rejected():
+    with pytest.raises(ValueError):
+        PropertyMapping("title", "Name", "formula")
+
+
+def test_property_ids_are_resolved_in_the_order_of_the_mappings():
+    event_schema = EventSchema(DEFAULT_MAPPINGS)
+
+    ids = event_schema.resolve(make_database())
+
+    assert ids == [f"id-{index}" for index in range(len(DEFAULT_MAPPINGS))]
+    assert event_schema.property_ids == ids
+    assert not event_schema.should_resolve()
+
+
+@pytest.mark.parametrize(
+    "database",
+    [
+        make_database(Lugar=None),
+        make_database(Lugar={"id": "id-3", "type": "select"}),
+    ],
+)
+def test_missing_or_changed_properties_are_not_resolved(database):
+    database["properties"] = {
+        name: prop for name, prop in database["properties"].items() if prop
+    }
+    event_schema = EventSchema(DEFAULT_MAPPINGS)
+
+    with pytest.raises(ValueError):
+        event_schema.resolve(database)
+    assert event_schema.property_ids is None
+
+
+def test_failed_resolutions_are_retried_after_an_interval(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(schema.time, "monotonic", lambda: now[0])
+    event_schema = EventSchema(DEFAULT_MAPPINGS)
+
+    assert event_schema.should_resolve()
+    event_schema.resolve_failed()
+    now[0] += schema.RESOLVE_RETRY_INTERVAL - 1
+    assert not event_schema.should_resolve()
+    now[0] += 1
+    assert event_schema.should_resolve()
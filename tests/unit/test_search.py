@@ -0,0 +1,157 @@
+import asyncio
+import functools
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+
+import pytest
+
+from notion import search
+from notion.search import EventSearch, PrefixIndex, tokenize
+
+
+@pytest.fixture
+def events(make_event):
+    """Upcoming events, in a different order than their dates"""
+    now = datetime.now(UTC)
+    # The type is indexed too, so it must not match the queries of the tests
+    make_event = functools.partial(make_event, event_type="Salida")
+    return [
+        make_event("Campamento de verano", now + timedelta(days=3), event_id="1"),
+        make_event("Reunión de padres", now + timedelta(days=1), event_id="2"),
+        make_event(
+            "Excursión", now + timedelta(days=2), event_id="3", location="Cercedilla"
+        ),
+    ]
+
+
+@pytest.fixture
+def notion(monkeypatch, events):
+    """Stand-in for the Notion query of the pages, which waits until released"""
+    released = asyncio.Event()
+    queries = []
+
+    async def iter_pages(query):
+        queries.append(query)
+        await released.wait()
+        for event in events:
+            yield event
+
+    monkeypatch.setattr(search, "iter_pages", iter_pages)
+    # The stand-in yields the events themselves instead of pages
+    monkeypatch.setattr(search, "NotionEvent", SimpleNamespace(from_page=lambda e: e))
+    return SimpleNamespace(released=released, queries=queries)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Stand-in for the event store, not synced unless events are set"""
+    stored = SimpleNamespace(events=None, synced_at=None, reads=0)
+
+    async def get_store_synced_at():
+        if stored.events is None:
+            return None
+        return stored.synced_at or datetime(2024, 5, 1, tzinfo=UTC)
+
+    async def get_stored_events_from(first_day):
+        stored.reads += 1
+        return stored.events
+
+    monkeypatch.setattr(search, "get_store_synced_at", get_store_synced_at)
+    monkeypatch.setattr(search, "get_stored_events_from", get_stored_events_from)
+    return stored
+
+
+def titles(events):
+    return [event.title for event in events]
+
+
+def test_tokens_are_lowercase_without_accents():
+    assert tokenize("Reunión de Padres, 2º") == ["reunion", "de", "padres", "2o"]
+
+
+def test_every_word_of_the_query_must_prefix_a_word_of_the_event(events):
+    index = PrefixIndex()
+    for event in events:
+        index.upsert(event)
+
+    assert titles(index.search("camp ver", 10)) == ["Campamento de verano"]
+    assert titles(index.search("cerce", 10)) == ["Excursión"]
+    assert titles(index.search("", 10)) == [
+        "Reunión de padres",
+        "Excursión",
+        "Campamento de verano",
+    ]
+    assert index.search("camp padres", 10) == []
+
+
+def test_replaced_events_lose_their_old_words(make_event):
+    index = PrefixIndex()
+    index.upsert(make_event("Campamento", event_id="1"))
+    index.upsert(make_event("Marcha", event_id="1"))
+
+    assert index.search("camp", 10) == []
+    assert titles(index.search("marc", 10)) == ["Marcha"]
+    assert len(index) == 1
+
+
+def test_first_search_does_not_wait_for_the_index(notion, store, events):
+    event_search = EventSearch(background_updates=True)
+
+    async def main():
+        # Answered right away, while the index is built in the background
+        assert await event_search.search("camp", 10) is None
+        notion.released.set()
+        await event_search._update_task
+        return await event_search.search("camp", 10)
+
+    assert titles(asyncio.run(main())) == ["Campamento de verano"]
+    assert len(notion.queries) == 1
+
+
+def test_first_search_is_answered_from_the_store_while_building(notion, store, events):
+    store.events = events
+    event_search = EventSearch(background_updates=True)
+
+    async def main():
+        results = await event_search.search("reu", 10)
+        event_search._update_task.cancel()
+        return results
+
+    assert titles(asyncio.run(main())) == ["Reunión de padres"]
+    assert not event_search.ready
+
+
+def test_without_background_updates_the_index_is_built_before_answering(notion, store):
+    notion.released.set()
+    event_search = EventSearch(background_updates=False)
+
+    assert titles(asyncio.run(event_search.search("exc", 10))) == ["Excursión"]
+    assert event_search.ready
+    assert event_search._update_task is None
+
+
+def test_without_background_updates_the_store_is_searched(notion, store, events):
+    store.events = events
+    event_search = EventSearch(background_updates=False)
+
+    assert titles(asyncio.run(event_search.search("exc", 10))) == ["Excursión"]
+    assert notion.queries == []
+
+
+def test_the_stored_events_are_indexed_once_per_sync(notion, store, events):
+    store.events = events
+    event_search = EventSearch(background_updates=False)
+
+    async def main():
+        results = [await event_search.search(query, 10) for query in ("c", "ca")]
+        store.events = events[:1]
+        store.synced_at = datetime(2024, 5, 2, tzinfo=UTC)
+        results.append(await event_search.search("ca", 10))
+        return results
+
+    assert [titles(results) for results in asyncio.run(main())] == [
+        ["Excursión", "Campamento de verano"],
+        ["Campamento de verano"],
+        ["Campamento de verano"],
+    ]
+    assert store.reads == 2
@@ -0,0 +1,190 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+from dedup import deduplicator
+from server import HTTPError, WebhookServer, format_response, read_request
+
+
+def read(data: bytes):
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_request(reader)
+
+    return asyncio.run(main())
+
+
+def update_body(update_id: int, text: str = "hola") -> bytes:
+    update = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "U"},
+            "text": text,
+        },
+    }
+    return json.dumps(update).encode()
+
+
+def test_requests_are_read_with_their_headers_and_body():
+    request = read(
+        b"post /?token=1 HTTP/1.1\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Content-Length: 2\r\n"
+        b"\r\n"
+        b"{}"
+    )
+
+    assert request == (
+        "POST",
+        "/",
+        {"content-type": "application/json", "content-length": "2"},
+        b"{}",
+    )
+
+
+def test_closed_connections_have_no_request():
+    assert read(b"") is None
+
+
+@pytest.mark.parametrize(
+    "data, status",
+    [
+        (b"GARBAGE\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nContent-Length: two\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", 501),
+        (b"POST / HTTP/1.1\r\nContent-Length: 2000000\r\n\r\n", 413),
+    ],
+)
+def test_unsupported_requests_are_rejected(data, status):
+    with pytest.raises(HTTPError) as error:
+        read(data)
+
+    assert error.value.status == status
+
+
+def test_responses_have_a_json_body():
+    response = format_response(200, {"status": "ok"}, keep_alive=False)
+
+    head, body = response.split(b"\r\n\r\n")
+    assert head.split(b"\r\n") == [
+        b"HTTP/1.1 200 OK",
+        b"Content-Type: application/json",
+        b"Content-Length: 15",
+        b"Connection: close",
+    ]
+    assert json.loads(body) == {"status": "ok"}
+
+
+def test_valid_updates_are_queued(application):
+    webhook = WebhookServer("127.0.0.1", 0, workers=1, queue_size=1)
+
+    assert asyncio.run(webhook.accept_update({}, update_body(301))) == 200
+    assert webhook._queue.get_nowait().update_id == 301
+
+
+def test_invalid_json_is_rejected(application):
+    webhook = WebhookServer("127.0.0.1", 0, workers=1, queue_size=1)
+
+    assert asyncio.run(webhook.accept_update({}, b"{")) == 400
+
+
+def test_invalid_updates_are_rejected_and_released(application):
+    webhook = WebhookServer("127.0.0.1", 0, workers=1, queue_size=1)
+    body = json.dumps({"update_id": 302, "message": {"chat": 5}}).encode()
+
+    assert asyncio.run(webhook.accept_update({}, body)) == 400
+    assert webhook._queue.empty()
+    assert deduplicator.claim(302)
+
+
+def test_updates_are_rejected_and_released_once_the_queue_is_full(application):
+    webhook = WebhookServer("127.0.0.1", 0, workers=1, queue_size=1)
+
+    async def main():
+        return [
+            await webhook.accept_update({}, update_body(update_id))
+            for update_id in (311, 312)
+        ]
+
+    assert asyncio.run(main()) == [200, 503]
+    assert webhook.rejected == 1
+    # Telegram delivers the rejected update again later
+    assert deduplicator.claim(312)
+
+
+def test_health_reports_the_queue_until_stopping():
+    webhook = WebhookServer("127.0.0.1", 0, workers=2, queue_size=1)
+
+    status, body = webhook.health()
+    assert status == 200
+    assert body == {
+        "status": "ok",
+        "queued": 0,
+        "busy": 0,
+        "workers": 2,
+        "processed": 0,
+        "rejected": 0,
+    }
+
+    webhook._closing = True
+    assert webhook.health()[0] == 503
+    assert asyncio.run(webhook.accept_update({}, update_body(321))) == 503
+
+
+async def send(port: int, request: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def post(body: bytes) -> bytes:
+    return (
+        b"POST / HTTP/1.1\r\nConnection: close\r\n"
+        b"Content-Length: %d\r\n\r\n" % len(body) + body
+    )
+
+
+def get(path: bytes) -> bytes:
+    return b"GET %s HTTP/1.1\r\nConnection: close\r\n\r\n" % path
+
+
+def test_server_processes_updates_until_stopped(application, monkeypatch):
+    monkeypatch.setattr(server, "WEBHOOK_URL", None)
+    webhook = WebhookServer("127.0.0.1", 0, workers=2, queue_size=10)
+
+    async def main():
+        await webhook.start()
+        try:
+            responses = [
+                await send(webhook.port, post(update_body(331))),
+                await send(webhook.port, get(b"/health")),
+                await send(webhook.port, get(b"/other")),
+                # Longer than the line limit of the stream
+                await send(webhook.port, b"GET /" + b"a" * 100_000 + b"\r\n\r\n"),
+            ]
+        finally:
+            await webhook.stop()
+        return responses
+
+    responses = asyncio.run(main())
+
+    statuses = [response.split(b"\r\n", 1)[0] for response in responses]
+    assert statuses == [
+        b"HTTP/1.1 200 OK",
+        b"HTTP/1.1 200 OK",
+        b"HTTP/1.1 404 Not Found",
+        b"HTTP/1.1 400 Bad Request",
+    ]
+    # Queued updates are processed before the server stops
+    assert webhook.processed == 1
+    assert not deduplicator.claim(331)
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from notion.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_a_single_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def call():
+        calls.append(None)
+        started.set()
+        release.wait(1)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", call)))
+    leader.start()
+    started.wait(1)
+    followers = [
+        threading.Thread(target=lambda: results.append(flight.do("key", call)))
+        for _ in range(3)
+    ]
+    for follower in followers:
+        follower.start()
+    # Give the followers time to find the call in flight
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(1)
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight._calls == {}
+
+
+def test_errors_are_raised_to_the_caller_and_not_remembered():
+    flight = SingleFlight()
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", lambda: (_ for _ in ()).throw(RuntimeError("failed")))
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_async_concurrent_calls_share_a_single_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(None)
+        await asyncio.sleep(0)
+        return len(calls)
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", call) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert flight._calls == {}
+
+
+def test_async_caller_giving_up_does_not_cancel_the_call_for_others():
+    flight = AsyncSingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        impatient = asyncio.ensure_future(flight.do("key", call))
+        patient = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_async_calls_from_a_discarded_loop_are_not_shared():
+    flight = AsyncSingleFlight()
+
+    async def call():
+        return asyncio.get_running_loop()
+
+    first = asyncio.run(flight.do("key", call))
+    second = asyncio.run(flight.do("key", call))
+
+    assert first is not second
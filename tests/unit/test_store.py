@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from datetime import date, datetime, timedelta, UTC
+
+import pytest
+
+from notion import async_api
+from notion.model import NotionEvent
+from notion.store import (
+    DynamoDBEventStore,
+    EventReadModel,
+    REBUILT_AT,
+    SQLiteEventStore,
+    SYNC_CHECK_INTERVAL,
+    WATERMARK,
+    event_from_record,
+    event_to_record,
+)
+
+WATERMARK_TIME = datetime(2024, 5, 1, 12, tzinfo=UTC)
+
+
+@pytest.fixture
+def event_on(make_event):
+    """Factory of the events of a page, from 18:00 to 20:00 on a day of May 2024"""
+
+    def make(event_id: str, day: int, title: str = "Riunione") -> NotionEvent:
+        return make_event(
+            title,
+            datetime(2024, 5, day, 18),
+            datetime(2024, 5, day, 20),
+            scouters=["Akela"],
+            participant_num=12,
+            event_id=event_id,
+            last_edited_time="2024-04-30T10:00:00.000Z",
+        )
+
+    return make
+
+
+def test_records_round_trip(event_on):
+    event = event_on("a", 3, title="Uscita à la mer")
+
+    restored = event_from_record(event_to_record(event))
+
+    assert (restored.date.start, restored.date.end) == (
+        event.date.start,
+        event.date.end,
+    )
+    for name in NotionEvent.__slots__:
+        if name != "date":
+            assert getattr(restored, name) == getattr(event, name)
+
+
+def test_sqlite_store_upserts_and_replaces_events(tmp_path, event_on):
+    store = SQLiteEventStore(str(tmp_path / "events.sqlite"))
+    store.upsert([event_on("a", 3), event_on("b", 5)], WATERMARK_TIME)
+    store.upsert([event_on("a", 7, title="Spostata")], WATERMARK_TIME)
+
+    assert [e.id for e in store.events_between(date(2024, 5, 1), date(2024, 5, 6))] == [
+        "b"
+    ]
+    assert [e.title for e in store.iter_events_from(date(2024, 5, 6))] == ["Spostata"]
+    assert store.get_state(WATERMARK) == WATERMARK_TIME
+    assert store.get_state(REBUILT_AT) is None
+
+    store.replace([event_on("c", 4)], WATERMARK_TIME)
+
+    assert [e.id for e in store.iter_events_from(date(2024, 5, 1))] == ["c"]
+    assert store.get_state(REBUILT_AT) == WATERMARK_TIME
+
+
+class FakeStore:
+    def __init__(self, watermark):
+        self.watermark = watermark
+        self.reads = 0
+
+    def get_state(self, name):
+        self.reads += 1
+        return self.watermark
+
+
+def test_read_model_only_reads_the_watermark_periodically():
+    now = [0.0]
+    store = FakeStore(datetime.now(UTC))
+    model = EventReadModel(store, timedelta(hours=1), clock=lambda: now[0])
+
+    assert model.is_fresh()
+    now[0] = SYNC_CHECK_INTERVAL - 1
+    assert model.is_fresh()
+    assert store.reads == 1
+
+    store.watermark = datetime.now(UTC) - timedelta(hours=2)
+    now[0] = SYNC_CHECK_INTERVAL
+    assert not model.is_fresh()
+    assert store.reads == 2
+
+
+def test_read_model_is_not_fresh_before_the_first_sync():
+    model = EventReadModel(FakeStore(None), timedelta(hours=1))
+
+    assert not model.is_fresh()
+
+
+def test_freshness_is_checked_outside_the_event_loop(monkeypatch):
+    threads = []
+
+    class ThreadRecordingModel:
+        def is_fresh(self):
+            threads.append(threading.current_thread())
+            return True
+
+    monkeypatch.setattr(async_api, "read_model", ThreadRecordingModel())
+
+    assert asyncio.run(async_api._read_store(lambda: "stored")) == "stored"
+    assert threads and threads[0] is not threading.main_thread()
+
+
+class FakeDynamoDB:
+    """Stand-in for the DynamoDB client, recording the writes in order"""
+
+    def __init__(self, stored_ids):
+        self.stored_ids = stored_ids
+        self.writes = []
+
+    def batch_write_item(self, RequestItems):
+        for requests in RequestItems.values():
+            for request in requests:
+                if "PutRequest" in request:
+                    self.writes.append(
+                        ("put", request["PutRequest"]["Item"]["Id"]["S"])
+                    )
+                else:
+                    self.writes.append(
+                        ("delete", request["DeleteRequest"]["Key"]["Id"]["S"])
+                    )
+        return {}
+
+    def put_item(self, TableName, Item):
+        self.writes.append(("state", Item["Id"]["S"]))
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, **kwargs):
+        yield {"Items": [{"Id": {"S": id_}} for id_ in self.stored_ids]}
+
+
+def test_dynamodb_replace_deletes_stale_events_after_writing_the_new_ones(event_on):
+    client = FakeDynamoDB(stored_ids=["a", "stale"])
+    store = DynamoDBEventStore("events")
+    store._client = client
+
+    store.replace([event_on("a", 3), event_on("b", 4)], WATERMARK_TIME)
+
+    # Readers never miss an event, and a failed rebuild leaves the state unchanged
+    assert client.writes == [
+        ("put", "a"),
+        ("put", "b"),
+        ("delete", "stale"),
+        ("state", REBUILT_AT),
+        ("state", WATERMARK),
+    ]
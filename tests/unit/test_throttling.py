@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop
+
+import router_lambda
+import throttling
+from ratelimit import TokenBucket
+from throttling import CommandThrottle, RateLimit, get_command
+
+
+def make_update(text: str, user_id: int = 1, username: str = "user", chat_id=-100):
+    return Update.de_json(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "group"},
+                "from": {
+                    "id": user_id,
+                    "is_bot": False,
+                    "first_name": "U",
+                    "username": username,
+                },
+                "text": text,
+            },
+        }
+    )
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    sent = []
+
+    async def reply_text(message, text, **kwargs):
+        sent.append(text)
+
+    monkeypatch.setattr(throttling.webhook_reply, "reply_text", reply_text)
+    return sent
+
+
+@pytest.fixture
+def throttle(monkeypatch):
+    throttle = CommandThrottle({"mes": RateLimit(per_minute=1, burst=1)}, 16)
+    monkeypatch.setattr(router_lambda, "command_throttle", throttle)
+    return throttle
+
+
+def allowed(check, update) -> bool:
+    try:
+        asyncio.run(check(update, None))
+    except ApplicationHandlerStop:
+        return False
+    return True
+
+
+def test_bucket_allows_bursts_and_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=0.5, capacity=2, clock=clock)
+
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(2)
+    clock.now = 2
+    assert bucket.try_acquire()
+
+
+def test_paused_bucket_waits_before_the_next_token(clock):
+    bucket = TokenBucket(rate=1, capacity=5, clock=clock)
+
+    bucket.pause(3)
+    assert bucket.delay() == pytest.approx(3)
+
+
+def test_commands_are_read_without_the_bot_username():
+    assert get_command(make_update("/Mes@EscultoideBot ahora")) == "mes"
+    assert get_command(make_update("hola")) is None
+
+
+def test_throttled_commands_are_stopped_and_warned_once(throttle, replies):
+    update = make_update("/mes")
+
+    assert allowed(throttle.check, update)
+    assert not allowed(throttle.check, update)
+    assert not allowed(throttle.check, update)
+    assert len(replies) == 1
+
+
+def test_commands_without_limit_are_not_throttled(throttle, replies):
+    for _ in range(5):
+        assert allowed(throttle.check, make_update("/proximo"))
+
+
+def test_each_user_has_a_bucket_per_chat_too(throttle, replies):
+    assert allowed(throttle.check, make_update("/mes", user_id=1, chat_id=1))
+    assert allowed(throttle.check, make_update("/mes", user_id=2, chat_id=2))
+    # The chat of the first user has run out of tokens
+    assert not allowed(throttle.check, make_update("/mes", user_id=2, chat_id=1))
+
+
+def test_unauthorized_users_do_not_use_up_the_chat_limit(throttle, replies):
+    check = router_lambda.throttle_authorized_commands
+
+    for _ in range(3):
+        assert allowed(check, make_update("/mes", user_id=2, username="intruder"))
+    assert allowed(check, make_update("/mes", user_id=1, username="user"))
+    assert replies == []
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+import transport
+from transport import ConnectionStats, PoolSettings
+
+
+def test_pool_settings_are_overridden_per_service(monkeypatch):
+    monkeypatch.setenv("TelegramPoolSize", "2")
+    monkeypatch.setenv("TelegramReadTimeout", "1.5")
+
+    settings = PoolSettings("Telegram", pool_size=8, connect=3.0, read=10.0)
+
+    assert settings.pool_size == 2
+    assert settings.connect_timeout == 3.0
+    assert settings.read_timeout == 1.5
+
+
+def test_requests_on_new_connections_are_not_reused():
+    connection_stats = ConnectionStats()
+    hook = transport._event_hooks(connection_stats)["request"][0]
+
+    for _ in range(4):
+        request = httpx.Request("GET", "https://api.telegram.org")
+        hook(request)
+    request.extensions["trace"]("connection.connect_tcp.complete", {})
+    request.extensions["trace"]("http11.send_request_headers.complete", {})
+
+    assert connection_stats.as_dict() == {
+        "requests": 4,
+        "new_connections": 1,
+        "reuse_ratio": 0.75,
+    }
+
+
+def test_async_hooks_record_the_same_stats():
+    connection_stats = ConnectionStats()
+    hook = transport._async_event_hooks(connection_stats)["request"][0]
+
+    async def main():
+        request = httpx.Request("GET", "https://api.notion.com")
+        await hook(request)
+        await request.extensions["trace"]("connection.connect_tcp.complete", {})
+
+    asyncio.run(main())
+
+    assert (connection_stats.requests, connection_stats.reused) == (1, 0)
+
+
+def test_without_requests_nothing_is_reused():
+    assert ConnectionStats().reuse_ratio == 0.0
+
+
+def test_notion_clients_get_a_timeout_for_each_phase():
+    client = SimpleNamespace(client=transport.notion_http_client())
+
+    transport.apply_notion_timeout(client)
+
+    assert client.client.timeout.connect == transport.NOTION.connect_timeout
+    assert client.client.timeout.read == transport.NOTION.read_timeout
+    client.client.close()
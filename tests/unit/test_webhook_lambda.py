@@ -0,0 +1,106 @@
+import pytest
+
+from backend.webhook.runtime import webhook_lambda
+from backend.webhook.runtime.webhook_lambda import WebhookOptions
+
+URL = "https://example.com/bot"
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Stand-in for the session, answering getWebhookInfo with the given info"""
+
+    def __init__(self, info=None):
+        self.info = info
+        self.posted = []
+
+    def get(self, url, timeout):
+        return FakeResponse({"ok": True, "result": self.info})
+
+    def post(self, url, json, timeout):
+        self.posted.append(json)
+        return FakeResponse({"ok": True, "result": True})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(webhook_lambda, "session", session)
+    return session
+
+
+def test_options_are_converted_from_strings():
+    options = WebhookOptions(
+        {
+            "AllowedUpdates": ["message", "inline_query"],
+            "MaxConnections": "40",
+            "DropPendingUpdates": "True",
+            "UseSecretToken": "false",
+        }
+    )
+
+    assert options.allowed_updates == ["message", "inline_query"]
+    assert options.max_connections == 40
+    assert options.drop_pending_updates
+    assert not options.use_secret_token
+
+
+def test_options_default_to_those_of_telegram():
+    options = WebhookOptions({})
+
+    assert options.allowed_updates is None
+    assert options.max_connections is None
+    assert not options.drop_pending_updates
+    assert not options.use_secret_token
+
+
+def test_webhooks_are_set_with_the_options(session):
+    options = WebhookOptions({"AllowedUpdates": [], "UseSecretToken": "true"})
+
+    webhook_lambda.set_webhook("123:key", URL, options)
+
+    assert session.posted == [
+        {
+            "url": URL,
+            "drop_pending_updates": False,
+            # An empty list restores the default update types
+            "allowed_updates": [],
+            "secret_token": webhook_lambda.derive_webhook_secret_token("123:key"),
+        }
+    ]
+
+
+def test_webhooks_matching_the_options_are_verified(session):
+    session.info = {
+        "url": URL,
+        "allowed_updates": ["inline_query", "message"],
+        "max_connections": 40,
+    }
+    options = WebhookOptions(
+        {"AllowedUpdates": ["message", "inline_query"], "MaxConnections": "40"}
+    )
+
+    webhook_lambda.verify_webhook("123:key", URL, options)
+
+
+def test_every_mismatch_of_the_webhook_is_reported(session):
+    session.info = {"url": "https://old.example.com", "max_connections": 40}
+    options = WebhookOptions({"AllowedUpdates": ["message"], "MaxConnections": "10"})
+
+    with pytest.raises(Exception) as error:
+        webhook_lambda.verify_webhook("123:key", URL, options)
+
+    message = str(error.value)
+    assert "url is https://old.example.com" in message
+    assert "allowed_updates are None" in message
+    assert "max_connections is 40" in message
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram import Chat
+
+from webhook_reply import collect_reply, reply_html, reply_text
+
+
+class FakeMessage:
+    """Stand-in for a message, recording the replies sent through the Bot API"""
+
+    def __init__(self, chat_type: str = Chat.PRIVATE):
+        self.chat = SimpleNamespace(type=chat_type)
+        self.chat_id = 5
+        self.message_id = 7
+        self.sent = []
+
+    async def reply_text(self, text, **kwargs):
+        self.sent.append(text)
+
+
+def test_the_first_reply_is_returned_in_the_webhook_response():
+    message = FakeMessage()
+
+    async def main():
+        with collect_reply() as reply:
+            await reply_html(message, "<b>hola</b>")
+            await reply_text(message, "adiós")
+        return reply
+
+    reply = asyncio.run(main())
+
+    assert reply.payload == {
+        "method": "sendMessage",
+        "chat_id": 5,
+        "text": "<b>hola</b>",
+        "parse_mode": "HTML",
+    }
+    # Further replies cannot wait for the response
+    assert message.sent == ["adiós"]
+
+
+def test_replies_in_groups_quote_the_message():
+    message = FakeMessage(Chat.GROUP)
+
+    async def main():
+        with collect_reply() as reply:
+            await reply_text(message, "hola", disable_notification=True)
+        return reply
+
+    reply = asyncio.run(main())
+
+    assert reply.payload["reply_parameters"] == {"message_id": 7}
+    assert reply.payload["disable_notification"]
+    assert "parse_mode" not in reply.payload
+
+
+def test_replies_are_sent_through_the_bot_api_outside_a_webhook_request():
+    message = FakeMessage()
+
+    asyncio.run(reply_text(message, "hola"))
+
+    assert message.sent == ["hola"]
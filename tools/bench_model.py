@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the parsing of Notion pages into NotionEvent objects.
+
+Generates synthetic pages shaped like the ones returned by the calendar database,
+then reports the time taken by NotionEvent.from_page and the memory held by the
+resulting events.
+
+Usage:
+    python tools/bench_model.py [--pages N] [--repeat N] [--seed N]
+"""
+
+import argparse
+import gc
+import pathlib
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(
+    0, str(pathlib.Path(__file__).parent.parent.joinpath("backend", "api", "runtime"))
+)
+
+from notion.model import NotionEvent  # noqa: E402
+
+_TYPES = ["Reunión", "Acampada", "Excursión", "Campamento", "Actividad"]
+_PLACES = ["Local", "Sierra de Guadarrama", "Parque del Oeste", "", "Cercedilla"]
+_SCOUTERS = ["Alonso", "Diego", "Lucía", "Marta", "Pablo", "Sara", "Javier"]
+
+# Identifier and type of each property of the calendar database
+PROPERTIES = {
+    "Name": ("title", "title"),
+    "Lugar": ("%3ALg", "rich_text"),
+    "Fecha": ("%3DFe", "date"),
+    "Tipo": ("Tp%3F", "select"),
+    "Scouters asistentes": ("Sc%5B", "multi_select"),
+    "Educandos asistentes": ("Ed%5D", "relation"),
+}
+
+
+def make_database() -> dict:
+    """
+    Build the calendar database object, with the schema of its properties
+    :return: Dictionary shaped like a database returned by the Notion API
+    """
+    return {
+        "object": "database",
+        "properties": {
+            name: {"id": id_, "name": name, "type": type_}
+            for name, (id_, type_) in PROPERTIES.items()
+        },
+    }
+
+
+def make_page(rng: random.Random, index: int, first_day: datetime) -> dict:
+    """
+    Build a synthetic Notion page for a calendar event
+    :param rng: Random number generator to use
+    :param index: Number of the event, used for its title and identifier
+    :param first_day: Date of the first event in the calendar
+    :return: Dictionary shaped like a page returned by the Notion API
+    """
+    start = first_day + timedelta(days=index // 3, hours=rng.choice([0, 10, 17]))
+    if rng.random() < 0.3:
+        # Multi-day event, with dates but no times
+        start_text = start.date().isoformat()
+        end_text = (start + timedelta(days=rng.randint(1, 7))).date().isoformat()
+    else:
+        start_text = start.isoformat(timespec="milliseconds") + "+02:00"
+        end_text = None
+
+    place = rng.choice(_PLACES)
+    values = {
+        "Name": [{"plain_text": f"Evento {index}"}],
+        "Lugar": [{"plain_text": place}] if place else [],
+        "Fecha": {"start": start_text, "end": end_text},
+        "Tipo": {"name": rng.choice(_TYPES)},
+        "Scouters asistentes": [
+            {"name": name}
+            for name in rng.sample(_SCOUTERS, rng.randint(0, len(_SCOUTERS)))
+        ],
+        "Educandos asistentes": [{"id": str(i)} for i in range(rng.randint(0, 40))],
+    }
+    properties = {}
+    for name, value in values.items():
+        id_, type_ = PROPERTIES[name]
+        properties[name] = {"id": id_, "type": type_, type_: value}
+
+    return {
+        "object": "page",
+        "id": f"{index:08x}-0000-0000-0000-000000000000",
+        "url": f"https://www.notion.so/Evento-{index:032x}",
+        "last_edited_time": "2024-10-01T12:00:00.000Z",
+        "properties": properties,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first_day = datetime(2024, 9, 1)
+    pages = [make_page(rng, index, first_day) for index in range(args.pages)]
+
+    timings = []
+    for _ in range(args.repeat):
+        gc.collect()
+        start = time.perf_counter()
+        events = [NotionEvent.from_page(page) for page in pages]
+        timings.append(time.perf_counter() - start)
+        del events
+
+    gc.collect()
+    tracemalloc.start()
+    events = [NotionEvent.from_page(page) for page in pages]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    median = statistics.median(timings)
+    print(f"Parsed {args.pages} pages, best of {args.repeat} runs")
+    print(f"  total:     {best * 1000:10.1f} ms (median {median * 1000:.1f} ms)")
+    print(f"  per page:  {best / args.pages * 1e6:10.2f} µs")
+    print(f"  memory:    {memory / 1024 / 1024:10.2f} MiB held by {len(events)} events")
+    print(f"  per event: {memory / len(events):10.0f} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
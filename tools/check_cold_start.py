@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Measure the import time and cold start initialization of the bot Lambda, and fail
+if they exceed the configured budgets.
+
+Every sample runs in a fresh interpreter, like a new Lambda container. Secrets are
+served from the LocalSecrets environment variable, so no AWS access is needed and
+the measurement only covers the work done inside the runtime.
+
+Usage:
+    python tools/check_cold_start.py [--samples N] [--import-budget MS]
+                                     [--init-budget MS] [--top N]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+
+RUNTIME_DIR = pathlib.Path(__file__).parent.parent.joinpath("backend", "api", "runtime")
+
+# Code run in each sample: import the handler module, then build the application
+# the way the first invocation does
+_SAMPLE_CODE = """
+import json, time
+start = time.perf_counter()
+import router_lambda
+imported = time.perf_counter()
+router_lambda.get_application()
+initialized = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "init_ms": (initialized - imported) * 1000,
+}))
+"""
+
+_ENVIRONMENT = {
+    "AllowedUsers": "budget-check",
+    "TelegramSecretName": "telegram",
+    "NotionSecretName": "notion",
+    "NotionCalendarID": "calendar",
+    "LocalSecrets": json.dumps(
+        {"telegram": "123456:budget-check-token", "notion": "secret_budget_check"}
+    ),
+}
+
+
+def run_sample(extra_args: [str] = None) -> subprocess.CompletedProcess:
+    """
+    Run the sample code in a fresh interpreter
+    :param extra_args: Additional interpreter arguments
+    :return: Completed process with the captured output
+    """
+    process = subprocess.run(
+        [sys.executable, *(extra_args or []), "-c", _SAMPLE_CODE],
+        cwd=RUNTIME_DIR,
+        env={**os.environ, **_ENVIRONMENT, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise SystemExit(f"Cold start sample failed:\n{process.stderr}")
+    return process
+
+
+def slowest_imports(top: int) -> [(float, str)]:
+    """
+    Return the modules with the highest cumulative import time
+    :param top: Number of modules to return
+    :return: List of (milliseconds, module name) tuples, slowest first
+    """
+    stderr = run_sample(["-X", "importtime"]).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Only report top level modules, nested ones are included in them
+        if not name.startswith("  "):
+            timings.append((int(cumulative) / 1000, name.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1000.0, metavar="MS")
+    parser.add_argument("--init-budget", type=float, default=500.0, metavar="MS")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    samples = [json.loads(run_sample().stdout) for _ in range(args.samples)]
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    init_ms = statistics.median(sample["init_ms"] for sample in samples)
+
+    print(f"Median import time: {import_ms:.1f} ms (budget {args.import_budget} ms)")
+    print(f"Median init time:   {init_ms:.1f} ms (budget {args.init_budget} ms)")
+    print(f"\nSlowest top level imports:")
+    for ms, name in slowest_imports(args.top):
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if import_ms > args.import_budget or init_ms > args.init_budget:
+        print("\nCold start budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the bot Lambda handler.
+
+Starts local stand-ins for the Telegram Bot API and the Notion API, with
+configurable latency and error injection, serves the secrets from the LocalSecrets
+environment variable, and replays synthetic updates through router_lambda.handler.
+Reports latency percentiles for cold and warm invocations and the number of
+outbound calls made to each service.
+
+Usage:
+    python tools/loadtest.py [--updates N] [--cold-samples N]
+                             [--telegram-latency-ms MS] [--notion-latency-ms MS]
+                             [--telegram-error-rate P] [--notion-error-rate P]
+                             [--events N] [--seed N] [--env NAME=VALUE ...]
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import pathlib
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs
+
+from bench_model import PROPERTIES, make_database, make_page
+
+RUNTIME_DIR = pathlib.Path(__file__).parent.parent.joinpath("backend", "api", "runtime")
+
+TELEGRAM_TOKEN = "123456:loadtest-token"
+NOTION_TOKEN = "secret_loadtest"
+CALENDAR_ID = "loadtest-calendar"
+USERNAME = "loadtester"
+
+# Share of each kind of update in the replayed traffic
+_UPDATE_MIX = [
+    ("/proximo", 0.45),
+    ("/semana", 0.1),
+    ("/mes", 0.05),
+    ("/echo hola", 0.2),
+    ("hola a todos", 0.2),
+]
+
+
+class FakeService:
+    """Local HTTP stand-in for an external API, counting the calls it receives"""
+
+    def __init__(
+        self,
+        name: str,
+        route: Callable[[str, str, bytes], Tuple[int, Dict[str, Any]]],
+        latency: float,
+        error_rate: float,
+        seed: int,
+    ):
+        """
+        Initializes a new FakeService
+        :param name: Name of the service, used in the report
+        :param route: Function receiving the HTTP method, path and body of a request
+                      and returning the status code and JSON body of the response
+        :param latency: Seconds to wait before answering each request
+        :param error_rate: Probability of answering a request with an error
+        :param seed: Seed for the error injection
+        """
+        self.name = name
+        self.calls: collections.Counter = collections.Counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, avoid delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                time.sleep(latency)
+                with service._lock:
+                    fail = service._rng.random() < error_rate
+                    if fail:
+                        service.errors += 1
+                if fail:
+                    status, payload = 500, {"ok": False, "description": "Injected"}
+                else:
+                    status, payload = route(self.command, self.path, body)
+                with service._lock:
+                    service.calls[self.path.split("?")[0].rsplit("/", 1)[-1]] += 1
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = _handle
+
+            def log_message(self, *_):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors = 0
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def parse_body(body: bytes) -> Dict[str, Any]:
+    """
+    Parse the body of a request, either JSON or form encoded
+    :param body: Raw request body
+    :return: Dictionary with the request parameters
+    """
+    if not body:
+        return {}
+    try:
+        return json.loads(body)
+    except ValueError:
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+def telegram_route(method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+    """
+    Answer a Telegram Bot API call with a minimal valid result
+    """
+    api_method = path.rsplit("/", 1)[-1]
+    if api_method == "getMe":
+        result = {
+            "id": 123456,
+            "is_bot": True,
+            "first_name": "EscultoideBot",
+            "username": "escultoide_bot",
+        }
+    elif api_method == "sendMessage":
+        params = parse_body(body)
+        result = {
+            "message_id": random.randint(1, 1 << 30),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 1)), "type": "private"},
+            "text": params.get("text", ""),
+        }
+    else:
+        result = True
+    return 200, {"ok": True, "result": result}
+
+
+def make_notion_route(pages: List[Dict[str, Any]]):
+    """
+    Build the handler for the Notion stand-in, serving the provided pages
+    :param pages: Pages of the calendar database, sorted by date
+    :return: Route function for a FakeService
+    """
+
+    def route(method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        path, _, query = path.partition("?")
+        if method == "GET" and "/databases/" in path:
+            return 200, make_database()
+        if not path.endswith("/query"):
+            return 404, {"object": "error", "status": 404, "code": "object_not_found"}
+
+        params = parse_body(body)
+        start = int(params.get("start_cursor") or 0)
+        end = start + int(params.get("page_size", 100))
+        results = pages[start:end]
+        # Only the requested properties are returned, as Notion does
+        property_ids = parse_qs(query).get("filter_properties")
+        if property_ids:
+            names = [
+                name for name, (id_, _) in PROPERTIES.items() if id_ in property_ids
+            ]
+            results = [
+                {
+                    **page,
+                    "properties": {name: page["properties"][name] for name in names},
+                }
+                for page in results
+            ]
+        return 200, {
+            "object": "list",
+            "results": results,
+            "has_more": end < len(pages),
+            "next_cursor": str(end) if end < len(pages) else None,
+        }
+
+    return route
+
+
+def make_update(rng: random.Random, update_id: int) -> Dict[str, Any]:
+    """
+    Build a synthetic Telegram update with a text message
+    :param rng: Random number generator to use
+    :param update_id: Identifier for the update
+    :return: Dictionary with the update as sent by Telegram
+    """
+    text = rng.choices(
+        [text for text, _ in _UPDATE_MIX], [weight for _, weight in _UPDATE_MIX]
+    )[0]
+    chat_id = rng.randint(1, 50)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {
+            "id": chat_id,
+            "is_bot": False,
+            "first_name": "Load",
+            "username": USERNAME,
+        },
+        "text": text,
+    }
+    if text.startswith("/"):
+        command_length = len(text.split()[0])
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": command_length}
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def percentiles(samples: List[float]) -> str:
+    """
+    Format the p50, p95 and p99 of a list of latencies
+    :param samples: Latencies in seconds
+    :return: String with the percentiles in milliseconds
+    """
+    if len(samples) < 2:
+        return " ".join(f"{sample * 1000:.1f} ms" for sample in samples) or "-"
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return (
+        f"p50 {cuts[49] * 1000:8.2f} ms   p95 {cuts[94] * 1000:8.2f} ms   "
+        f"p99 {cuts[98] * 1000:8.2f} ms   max {max(samples) * 1000:8.2f} ms"
+    )
+
+
+# Run in a fresh interpreter for each cold sample: import the handler and process
+# a single update, like the first invocation of a new container
+_COLD_SAMPLE_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import router_lambda
+imported = time.perf_counter()
+try:
+    router_lambda.handler(json.loads(sys.argv[1]), None)
+    failed = False
+except Exception:
+    failed = True
+done = time.perf_counter()
+print(json.dumps({
+    "import": imported - start, "first_invocation": done - imported, "failed": failed
+}))
+"""
+
+
+def run_cold_sample(environment: Dict[str, str], update: Dict[str, Any]) -> dict:
+    process = subprocess.run(
+        [sys.executable, "-c", _COLD_SAMPLE_CODE, json.dumps(update)],
+        cwd=RUNTIME_DIR,
+        env={**os.environ, **environment},
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise SystemExit(f"Cold sample failed:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--cold-samples", type=int, default=5)
+    parser.add_argument("--telegram-latency-ms", type=float, default=40.0)
+    parser.add_argument("--notion-latency-ms", type=float, default=300.0)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--notion-error-rate", type=float, default=0.0)
+    parser.add_argument("--events", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Additional environment variable for the bot runtime",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the output of the bot runtime"
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    first_day = datetime.now() + timedelta(days=1)
+    pages = [make_page(rng, index, first_day) for index in range(args.events)]
+
+    telegram = FakeService(
+        "Telegram",
+        telegram_route,
+        args.telegram_latency_ms / 1000,
+        args.telegram_error_rate,
+        args.seed,
+    )
+    notion = FakeService(
+        "Notion",
+        make_notion_route(pages),
+        args.notion_latency_ms / 1000,
+        args.notion_error_rate,
+        args.seed,
+    )
+
+    environment = {
+        "AllowedUsers": USERNAME,
+        "TelegramSecretName": "telegram",
+        "NotionSecretName": "notion",
+        "NotionCalendarID": CALENDAR_ID,
+        "LocalSecrets": json.dumps(
+            {"telegram": TELEGRAM_TOKEN, "notion": NOTION_TOKEN}
+        ),
+        "TelegramBaseURL": f"{telegram.url}/bot",
+        "NotionBaseURL": notion.url,
+        # The replayed traffic would be mostly throttled, measure the full pipeline
+        # unless the limits are overridden with --env
+        "CommandRateLimits": json.dumps(
+            {
+                command.split()[0][1:]: {"per_minute": 1e9, "burst": 1e9}
+                for command, _ in _UPDATE_MIX
+                if command.startswith("/")
+            }
+        ),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    for assignment in args.env:
+        name, _, value = assignment.partition("=")
+        environment[name] = value
+
+    # Cold starts, each one in a new interpreter
+    cold = [
+        run_cold_sample(environment, make_update(rng, index))
+        for index in range(args.cold_samples)
+    ]
+    cold_calls = (sum(telegram.calls.values()), sum(notion.calls.values()))
+    telegram.reset()
+    notion.reset()
+
+    # Warm invocations, all served by the same container
+    os.environ.update(environment)
+    sys.path.insert(0, str(RUNTIME_DIR))
+    runtime_output = contextlib.ExitStack()
+    if not args.verbose:
+        devnull = runtime_output.enter_context(open(os.devnull, "w"))
+        runtime_output.enter_context(contextlib.redirect_stdout(devnull))
+        runtime_output.enter_context(contextlib.redirect_stderr(devnull))
+    with runtime_output:
+        import router_lambda
+
+        updates = [make_update(rng, index) for index in range(args.updates + 1)]
+        router_lambda.handler(updates[0], None)
+        telegram.reset()
+        notion.reset()
+
+        warm = []
+        failures = 0
+        for update in updates[1:]:
+            start = time.perf_counter()
+            try:
+                router_lambda.handler(update, None)
+            except Exception:
+                failures += 1
+            warm.append(time.perf_counter() - start)
+
+        router_lambda.shutdown_runtime()
+    telegram.shutdown()
+    notion.shutdown()
+
+    cold_failures = sum(sample["failed"] for sample in cold)
+    print(f"Cold starts ({len(cold)} fresh interpreters, {cold_failures} failed)")
+    print(f"  import:            {percentiles([s['import'] for s in cold])}")
+    print(f"  first invocation:  {percentiles([s['first_invocation'] for s in cold])}")
+    if cold:
+        print(
+            f"  outbound calls:    {cold_calls[0] / len(cold):.1f} Telegram, "
+            f"{cold_calls[1] / len(cold):.1f} Notion per cold start"
+        )
+    print(f"\nWarm invocations ({len(warm)} updates, {failures} failed)")
+    print(f"  latency:           {percentiles(warm)}")
+    for service in (telegram, notion):
+        total = sum(service.calls.values())
+        detail = ", ".join(f"{name} {count}" for name, count in service.calls.items())
+        print(
+            f"  {service.name + ' calls:':19}{total} "
+            f"({total / max(len(warm), 1):.2f} per update; {detail or 'none'}), "
+            f"{service.errors} injected errors"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())